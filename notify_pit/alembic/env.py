@@ -12,8 +12,15 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
+# Keep the app's loggers working when migrations run inside the app
 if config.config_file_name is not None:
-    fileConfig(config.config_file_name)
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+# Migrate the database the app uses; % is escaped for ConfigParser
+if os.environ.get("DATABASE_URL"):
+    config.set_main_option(
+        "sqlalchemy.url", os.environ["DATABASE_URL"].replace("%", "%%")
+    )
 
 # add your model's MetaData object here
 # for 'autogenerate' support
@@ -0,0 +1,35 @@
+"""Add precompiled letter file columns
+
+Revision ID: 0b7d3e5a9c61
+Revises: f2a6c9b84d15
+Create Date: 2026-10-19 22:11:48.530972
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0b7d3e5a9c61"
+down_revision: Union[str, Sequence[str], None] = "f2a6c9b84d15"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("notifications", sa.Column("file_sha256", sa.String(), nullable=True))
+    op.add_column("notifications", sa.Column("file_size", sa.Integer(), nullable=True))
+    op.add_column("notifications", sa.Column("postage", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Plain ALTER TABLE rather than a batch rebuild, which would drop the
+    # full-text search triggers and renumber rowids on SQLite
+    op.drop_column("notifications", "postage")
+    op.drop_column("notifications", "file_size")
+    op.drop_column("notifications", "file_sha256")
@@ -0,0 +1,54 @@
+"""Add service callbacks
+
+Revision ID: 5383e035eee2
+Revises: bf36889abd1f
+Create Date: 2026-10-19 09:12:41.204310
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5383e035eee2"
+down_revision: Union[str, Sequence[str], None] = "bf36889abd1f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "service_callbacks",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("service_id", sa.String(), nullable=False),
+        sa.Column("callback_type", sa.String(), nullable=False),
+        sa.Column("url", sa.String(), nullable=False),
+        sa.Column("bearer_token", sa.String(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("(CURRENT_TIMESTAMP)"),
+            nullable=True,
+        ),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("service_id", "callback_type"),
+    )
+    op.create_index(
+        op.f("ix_service_callbacks_service_id"),
+        "service_callbacks",
+        ["service_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        op.f("ix_service_callbacks_service_id"), table_name="service_callbacks"
+    )
+    op.drop_table("service_callbacks")
@@ -0,0 +1,46 @@
+"""Add notification_files for stored letter PDFs and email attachments
+
+Revision ID: 5e9a0c7d2b48
+Revises: 0b7d3e5a9c61
+Create Date: 2026-10-19 23:02:17.204815
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5e9a0c7d2b48"
+down_revision: Union[str, Sequence[str], None] = "0b7d3e5a9c61"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "notification_files",
+        sa.Column("notification_id", sa.String(), nullable=False),
+        sa.Column("sha256", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("notification_id", "sha256"),
+    )
+    op.create_index(
+        "ix_notification_files_sha256",
+        "notification_files",
+        ["sha256"],
+        unique=False,
+    )
+    # Precompiled letters sent before this revision
+    op.execute(
+        "INSERT INTO notification_files (notification_id, sha256) "
+        "SELECT id, file_sha256 FROM notifications WHERE file_sha256 IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_notification_files_sha256", table_name="notification_files")
+    op.drop_table("notification_files")
@@ -0,0 +1,32 @@
+"""Add notifications (type, created_at) index
+
+Revision ID: 7c2e9d41a8f3
+Revises: 5383e035eee2
+Create Date: 2026-10-19 14:05:12.518204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7c2e9d41a8f3"
+down_revision: Union[str, Sequence[str], None] = "5383e035eee2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_notifications_type_created_at",
+        "notifications",
+        ["type", "created_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_notifications_type_created_at", table_name="notifications")
@@ -0,0 +1,95 @@
+"""Add notification full-text search index
+
+Revision ID: a93f5c2d7e10
+Revises: e41b7a9c03d2
+Create Date: 2026-10-19 17:42:09.316552
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a93f5c2d7e10"
+down_revision: Union[str, Sequence[str], None] = "e41b7a9c03d2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PERSONALISATION_TEXT = """(SELECT group_concat(atom, ' ')
+    FROM json_tree({row}.personalisation) WHERE atom IS NOT NULL)"""
+
+FTS_VALUES = f"""NEW.rowid, NEW.content, NEW.reference, NEW.phone_number,
+    NEW.email_address, {PERSONALISATION_TEXT.format(row="NEW")}"""
+
+FTS_COLUMNS = """rowid, content, reference, phone_number, email_address,
+    personalisation"""
+
+SQLITE_UPGRADE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS notifications_fts USING fts5(
+        content, reference, phone_number, email_address, personalisation
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS notifications_fts_insert
+    AFTER INSERT ON notifications BEGIN
+        INSERT INTO notifications_fts ({FTS_COLUMNS}) VALUES ({FTS_VALUES});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS notifications_fts_update
+    AFTER UPDATE OF content, reference, phone_number, email_address,
+        personalisation ON notifications BEGIN
+        DELETE FROM notifications_fts WHERE rowid = OLD.rowid;
+        INSERT INTO notifications_fts ({FTS_COLUMNS}) VALUES ({FTS_VALUES});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notifications_fts_delete
+    AFTER DELETE ON notifications BEGIN
+        DELETE FROM notifications_fts WHERE rowid = OLD.rowid;
+    END""",
+    # Index the notifications that already exist
+    f"""INSERT INTO notifications_fts ({FTS_COLUMNS})
+    SELECT rowid, content, reference, phone_number, email_address,
+        {PERSONALISATION_TEXT.format(row="notifications")}
+    FROM notifications""",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS notifications_fts_insert",
+    "DROP TRIGGER IF EXISTS notifications_fts_update",
+    "DROP TRIGGER IF EXISTS notifications_fts_delete",
+    "DROP TABLE IF EXISTS notifications_fts",
+]
+
+POSTGRESQL_UPGRADE = [
+    """CREATE INDEX IF NOT EXISTS ix_notifications_search ON notifications
+    USING gin ((
+        to_tsvector('simple', coalesce(content, '') || ' ' ||
+            coalesce(reference, '') || ' ' || coalesce(phone_number, '') ||
+            ' ' || coalesce(email_address, ''))
+        || jsonb_to_tsvector('simple', coalesce(personalisation::jsonb,
+            '{}'), '["string", "numeric"]')
+    ))""",
+]
+
+POSTGRESQL_DOWNGRADE = ["DROP INDEX IF EXISTS ix_notifications_search"]
+
+
+def _run(statements) -> None:
+    for statement in statements:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _run(SQLITE_UPGRADE)
+    elif dialect == "postgresql":
+        _run(POSTGRESQL_UPGRADE)
+    # Other databases search with LIKE and need no index
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _run(SQLITE_DOWNGRADE)
+    elif dialect == "postgresql":
+        _run(POSTGRESQL_DOWNGRADE)
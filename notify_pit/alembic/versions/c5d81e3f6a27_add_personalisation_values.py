@@ -0,0 +1,45 @@
+"""Add personalisation_values for promoted personalisation keys
+
+Revision ID: c5d81e3f6a27
+Revises: a93f5c2d7e10
+Create Date: 2026-10-19 19:03:55.671820
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c5d81e3f6a27"
+down_revision: Union[str, Sequence[str], None] = "a93f5c2d7e10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Filled in for existing notifications by warm-up (crud.promote_existing)
+    op.create_table(
+        "personalisation_values",
+        sa.Column("notification_id", sa.String(), nullable=False),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("value", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("notification_id", "key"),
+    )
+    op.create_index(
+        "ix_personalisation_values_key_value",
+        "personalisation_values",
+        ["key", "value"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_personalisation_values_key_value", table_name="personalisation_values"
+    )
+    op.drop_table("personalisation_values")
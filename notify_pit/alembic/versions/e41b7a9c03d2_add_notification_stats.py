@@ -0,0 +1,74 @@
+"""Add notification_stats summary table
+
+Revision ID: e41b7a9c03d2
+Revises: 7c2e9d41a8f3
+Create Date: 2026-10-19 16:20:37.904115
+
+"""
+
+from collections import Counter
+from datetime import timezone
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e41b7a9c03d2"
+down_revision: Union[str, Sequence[str], None] = "7c2e9d41a8f3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _hour(created_at):
+    if created_at is None:
+        return ""
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:00:00Z")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    stats = op.create_table(
+        "notification_stats",
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("template_id", sa.String(), nullable=False),
+        sa.Column("hour", sa.String(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("type", "status", "template_id", "hour"),
+    )
+
+    # Count the notifications that already exist
+    notifications = sa.table(
+        "notifications",
+        sa.column("type", sa.String),
+        sa.column("status", sa.String),
+        sa.column("template_id", sa.String),
+        sa.column("created_at", sa.DateTime(timezone=True)),
+    )
+    counts = Counter()
+    for type, status, template_id, created_at in op.get_bind().execute(
+        sa.select(
+            notifications.c.type,
+            notifications.c.status,
+            notifications.c.template_id,
+            notifications.c.created_at,
+        )
+    ):
+        counts[(type, status, template_id or "", _hour(created_at))] += 1
+    if counts:
+        op.bulk_insert(
+            stats,
+            [
+                {"type": t, "status": s, "template_id": tid, "hour": h, "count": n}
+                for (t, s, tid, h), n in counts.items()
+            ],
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("notification_stats")
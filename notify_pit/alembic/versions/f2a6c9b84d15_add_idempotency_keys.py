@@ -0,0 +1,36 @@
+"""Add idempotency_keys
+
+Revision ID: f2a6c9b84d15
+Revises: c5d81e3f6a27
+Create Date: 2026-10-19 20:26:14.208433
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f2a6c9b84d15"
+down_revision: Union[str, Sequence[str], None] = "c5d81e3f6a27"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("service_id", sa.String(), nullable=False),
+        sa.Column("reference", sa.String(), nullable=False),
+        sa.Column("notification_id", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("service_id", "reference"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("idempotency_keys")
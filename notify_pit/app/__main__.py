@@ -0,0 +1,195 @@
+# Production entry point:
+#
+#   python -m app serve [--workers N] [--port 8000] ...
+#
+# Runs uvicorn with one worker by default, using uvloop and httptools when
+# they are installed (uvicorn[standard]). Several workers (PIT_WORKERS or
+# --workers) are opt-in, because some of the pit's debugging and simulation
+# state lives in each process; check_workers lists what that affects. Before
+# starting workers it checks the database can be shared between them and
+# runs migrations, and the backfill of newly promoted personalisation keys,
+# once, so workers don't race each other over them.
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+import tempfile
+
+from .config import env_bool, env_int
+
+logger = logging.getLogger("app.serve")
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def event_loop() -> str:
+    return "uvloop" if _installed("uvloop") else "asyncio"
+
+
+def http_protocol() -> str:
+    return "httptools" if _installed("httptools") else "h11"
+
+
+def check_workers(database_url: str, workers: int) -> list:
+    """Raise SystemExit if workers can't share the database; return warnings.
+
+    Also prepares shared state for multi-worker runs: a metrics directory
+    when none is configured, so /pit/metrics covers every worker.
+    """
+    from .database import is_memory_sqlite
+
+    if workers <= 1:
+        return []
+    if is_memory_sqlite(database_url):
+        raise SystemExit(
+            f"An in-memory SQLite database can't be shared by {workers} workers: "
+            "each would get its own empty database. Use a file "
+            "(DATABASE_URL=sqlite:///./notify_pit.db), PostgreSQL or --workers 1."
+        )
+    warnings = []
+    if not os.environ.get("PIT_METRICS_DIR"):
+        os.environ["PIT_METRICS_DIR"] = tempfile.mkdtemp(prefix="notify-pit-metrics-")
+    else:
+        directory = os.environ["PIT_METRICS_DIR"]
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(directory, name))
+    if env_bool("PIT_RATE_LIMIT_ENABLED") and not os.environ.get(
+        "PIT_RATE_LIMIT_STATE"
+    ):
+        warnings.append(
+            "Rate limits are per worker, so the budget is multiplied by "
+            f"{workers}; set PIT_RATE_LIMIT_STATE to share them"
+        )
+    if env_bool("PIT_PROFILING"):
+        warnings.append(
+            "Profiles are kept by the worker that made them; "
+            "/pit/debug/profiles/{id} 404s on the other workers"
+        )
+    warnings += [
+        "Fault profiles set through PUT /pit/config only apply to the worker "
+        "that handled the request; use PIT_FAULT_PROFILE for all workers",
+        "/pit/debug/queries shows the statements of one worker only",
+        "Template edits reach the other workers' caches up to "
+        "PIT_TEMPLATE_CACHE_TTL seconds later",
+        "Rendered previews are cached per worker, so a pre-render may warm a "
+        "different worker from the one serving the view",
+        "DELETE /pit/reset clears in-memory state (pending status changes, "
+        "caches, profiles, query log) only in the worker that handles it",
+    ]
+    return warnings
+
+
+def promote_existing():
+    """Backfill newly promoted keys here, so the workers' warm-up can skip it."""
+    from . import crud
+    from .database import SessionLocal
+
+    try:
+        with SessionLocal() as db:
+            copied = crud.promote_existing(db)
+    except Exception:
+        # Leave it to the workers' warm-up
+        logger.exception("Indexing promoted personalisation keys failed")
+        return
+    if copied:
+        logger.info("Indexed %d promoted personalisation values", copied)
+    os.environ["PIT_PROMOTE_EXISTING"] = "false"
+
+
+def serve(args):
+    import uvicorn
+
+    from . import migrations
+    from .database import DATABASE_URL, engine
+
+    for warning in check_workers(DATABASE_URL, args.workers):
+        logger.warning(warning)
+
+    state = migrations.run(engine)
+    if state["status"] == "failed":
+        raise SystemExit(f"Database migration failed: {state['error']}")
+    promote_existing()
+    # Workers open their own connections
+    engine.dispose()
+
+    loop, http = event_loop(), http_protocol()
+    logger.info(
+        "Starting %d worker(s) on %s:%d (loop=%s, http=%s)",
+        args.workers,
+        args.host,
+        args.port,
+        loop,
+        http,
+    )
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_concurrency=args.limit_concurrency,
+        proxy_headers=True,
+        access_log=args.access_log,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Run the pit with uvicorn")
+    serve_parser.add_argument("--host", default=os.environ.get("PIT_HOST", "0.0.0.0"))
+    serve_parser.add_argument("--port", type=int, default=env_int("PORT", 8000))
+    serve_parser.add_argument(
+        "--workers",
+        type=int,
+        default=env_int("PIT_WORKERS", 1),
+        help="Worker processes (default: PIT_WORKERS or 1)",
+    )
+    serve_parser.add_argument(
+        "--keep-alive",
+        type=int,
+        default=env_int("PIT_KEEP_ALIVE", 5),
+        help="Seconds to hold idle keep-alive connections open",
+    )
+    serve_parser.add_argument(
+        "--backlog",
+        type=int,
+        default=env_int("PIT_BACKLOG", 2048),
+        help="Connections the listening socket queues before refusing",
+    )
+    serve_parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=env_int("PIT_GRACEFUL_TIMEOUT", 30),
+        help="Seconds to let in-flight requests finish on shutdown",
+    )
+    serve_parser.add_argument(
+        "--limit-concurrency",
+        type=int,
+        default=env_int("PIT_LIMIT_CONCURRENCY", 0) or None,
+        help="Answer 503 beyond this many concurrent connections per worker",
+    )
+    serve_parser.add_argument(
+        "--access-log",
+        action=argparse.BooleanOptionalAction,
+        default=env_bool("PIT_ACCESS_LOG", True),
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:     %(message)s")
+    if args.command == "serve":
+        serve(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,255 @@
+# Cold archive for notifications aged out by retention.
+#
+# With PIT_ARCHIVE_DIR set, retention writes each batch it purges to an
+# append-only segment of compressed NDJSON (zstd when the zstandard package
+# is installed, gzip otherwise) before deleting it. manifest.json records
+# each segment's row count and min/max created_at, so a query only
+# decompresses segments that overlap its time range. Queries only read the
+# archive when created_after reaches back past the newest archived row; the
+# hot table is never slowed down by it.
+#
+# Each segment also gets an id index: a sidecar file of its notification ids,
+# sorted and padded to one width, so finding a notification by id is a binary
+# search of each index and decompresses only the segment that holds it.
+import fcntl
+import gzip
+import io
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+import orjson
+
+from .crud import personalisation_text
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+MANIFEST = "manifest.json"
+CODECS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+IDS = ".ids"
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands back naive datetimes, which are UTC
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _parse(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _matches(values: dict, personalisation: dict) -> bool:
+    return all(
+        key in values and personalisation_text(values[key]) == value
+        for key, value in personalisation.items()
+    )
+
+
+class Archive:
+    def __init__(self, directory: str, codec: Optional[str] = None):
+        self.directory = directory
+        self.codec = codec or ("zstd" if zstandard else "gzip")
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        directory = os.environ.get("PIT_ARCHIVE_DIR")
+        return cls(directory) if directory else None
+
+    # --- Manifest ---
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST)
+
+    def segments(self) -> list:
+        try:
+            with open(self._manifest_path, "rb") as f:
+                return orjson.loads(f.read())["segments"]
+        except FileNotFoundError:
+            return []
+
+    def _save_segments(self, segments: list):
+        tmp = self._manifest_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps({"segments": segments}, option=orjson.OPT_INDENT_2))
+        os.replace(tmp, self._manifest_path)
+
+    @contextmanager
+    def locked(self):
+        """Serialise archiving between workers sharing the directory."""
+        with open(os.path.join(self.directory, ".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def newest(self) -> Optional[datetime]:
+        """created_at of the newest archived notification."""
+        newest = [_parse(s["max_created_at"]) for s in self.segments()]
+        newest = [_utc(value) for value in newest if value]
+        return max(newest) if newest else None
+
+    # --- Writing ---
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return gzip.compress(data, compresslevel=9)
+
+    def append(self, rows: list) -> Optional[dict]:
+        """Write rows to a new segment; call while holding locked()."""
+        if not rows:
+            return None
+        segments = self.segments()
+        number = segments[-1]["number"] + 1 if segments else 1
+        filename = f"segment-{number:06d}{CODECS[self.codec]}"
+        data = b"".join(orjson.dumps(row) + b"\n" for row in rows)
+        path = os.path.join(self.directory, filename)
+        with open(path + ".tmp", "wb") as f:
+            f.write(self._compress(data))
+        os.replace(path + ".tmp", path)
+
+        ids = sorted(row["id"].encode() for row in rows)
+        width = max(len(id) for id in ids)
+        ids_file = f"segment-{number:06d}{IDS}"
+        ids_path = os.path.join(self.directory, ids_file)
+        with open(ids_path + ".tmp", "wb") as f:
+            f.write(b"".join(id.ljust(width) + b"\n" for id in ids))
+        os.replace(ids_path + ".tmp", ids_path)
+
+        created = [_utc(row["created_at"]) for row in rows if row["created_at"]]
+        segment = {
+            "number": number,
+            "file": filename,
+            "codec": self.codec,
+            "rows": len(rows),
+            "min_created_at": min(created).isoformat() if created else None,
+            "max_created_at": max(created).isoformat() if created else None,
+            "ids": ids_file,
+            "id_width": width,
+        }
+        self._save_segments(segments + [segment])
+        return segment
+
+    def clear(self):
+        """Delete every segment, as /pit/reset does with the hot table."""
+        with self.locked():
+            for segment in self.segments():
+                for name in (segment["file"], segment.get("ids")):
+                    try:
+                        if name:
+                            os.remove(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        pass
+            self._save_segments([])
+
+    # --- Reading ---
+
+    def reaches(self, created_after: Optional[datetime]) -> bool:
+        """Whether a query from created_after needs the archive at all."""
+        if created_after is None:
+            return False
+        newest = self.newest()
+        return newest is not None and _utc(created_after) <= newest
+
+    def _open(self, segment: dict):
+        f = open(os.path.join(self.directory, segment["file"]), "rb")
+        if segment["codec"] == "zstd":
+            if zstandard is None:
+                f.close()
+                raise RuntimeError(
+                    f"{segment['file']} needs the zstandard package to read"
+                )
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f))
+        return gzip.GzipFile(fileobj=f)
+
+    def iter_rows(
+        self,
+        type: str = None,
+        status: str = None,
+        template_id: str = None,
+        reference: str = None,
+        created_after: datetime = None,
+        created_before: datetime = None,
+        personalisation: dict = None,
+    ):
+        """Archived rows matching the same filters as the hot table, oldest first.
+
+        Segments are decompressed one line at a time, and only when their
+        created_at range overlaps [created_after, created_before).
+        """
+        after, before = _utc(created_after), _utc(created_before)
+        fields = {
+            "type": type,
+            "status": status,
+            "template_id": template_id,
+            "reference": reference,
+        }
+        fields = {key: value for key, value in fields.items() if value}
+        for segment in self.segments():
+            low = _utc(_parse(segment["min_created_at"]))
+            high = _utc(_parse(segment["max_created_at"]))
+            if after and high and high < after:
+                continue
+            if before and low and low >= before:
+                continue
+            with self._open(segment) as lines:
+                for line in lines:
+                    row = orjson.loads(line)
+                    if any(row.get(key) != value for key, value in fields.items()):
+                        continue
+                    if personalisation and not _matches(
+                        row.get("personalisation") or {}, personalisation
+                    ):
+                        continue
+                    row["created_at"] = _parse(row["created_at"])
+                    created_at = _utc(row["created_at"])
+                    if after and (created_at is None or created_at < after):
+                        continue
+                    if before and (created_at is None or created_at >= before):
+                        continue
+                    yield row
+
+    def _may_hold(self, segment: dict, notification_id: str) -> bool:
+        # Segments written before the id index existed have to be read
+        if not segment.get("ids"):
+            return True
+        target = notification_id.encode()
+        width = segment["id_width"]
+        if len(target) > width:
+            return False
+        target = target.ljust(width)
+        with open(os.path.join(self.directory, segment["ids"]), "rb") as f:
+            low, high = 0, segment["rows"]
+            while low < high:
+                middle = (low + high) // 2
+                f.seek(middle * (width + 1))
+                id = f.read(width)
+                if id == target:
+                    return True
+                if id < target:
+                    low = middle + 1
+                else:
+                    high = middle
+        return False
+
+    def get(self, notification_id: str) -> Optional[dict]:
+        """An archived notification by id, or None."""
+        for segment in reversed(self.segments()):
+            if not self._may_hold(segment, notification_id):
+                continue
+            with self._open(segment) as lines:
+                for line in lines:
+                    row = orjson.loads(line)
+                    if row["id"] == notification_id:
+                        row["created_at"] = _parse(row["created_at"])
+                        return row
+        return None
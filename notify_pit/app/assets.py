@@ -0,0 +1,123 @@
+# Static asset serving with precompressed variants and long-lived caching.
+#
+# Precompressed .gz (and .br, when brotli is installed) files are generated at
+# image build time:
+#
+#   python -m app.assets
+#
+import os
+import re
+import sys
+from mimetypes import guess_type
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+from .compression import acceptable, compress, supported_encodings
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# Files whose name carries a version or content hash never change in place,
+# e.g. govuk-frontend-5.13.0.min.css or fonts/bold-affa96571d-v2.woff2
+FINGERPRINTED = re.compile(r"-(\d+\.\d+\.\d+|[0-9a-f]{10}-v\d+)\.")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+DEFAULT_CACHE = "public, max-age=86400"
+
+# Already-compressed formats (fonts, images) gain nothing from another pass
+COMPRESSIBLE = (".css", ".js", ".json", ".svg", ".txt", ".html", ".webmanifest")
+EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that prefers precompressed variants and sets Cache-Control."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        headers = {"Cache-Control": self.cache_control(str(full_path))}
+
+        path, media_type = full_path, None
+        encodings = acceptable(request_headers.get("accept-encoding", ""))
+        variant = self.lookup_variant(str(full_path), encodings)
+        if variant:
+            path, stat_result, encoding = variant
+            media_type = guess_type(str(full_path))[0]
+            headers["Content-Encoding"] = encoding
+        if str(full_path).endswith(COMPRESSIBLE):
+            headers["Vary"] = "Accept-Encoding"
+
+        response = FileResponse(
+            path,
+            status_code=status_code,
+            stat_result=stat_result,
+            headers=headers,
+            media_type=media_type,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    @staticmethod
+    def cache_control(path: str) -> str:
+        if FINGERPRINTED.search(os.path.basename(path)):
+            return IMMUTABLE_CACHE
+        return DEFAULT_CACHE
+
+    @staticmethod
+    def lookup_variant(path: str, encodings):
+        """(path, stat, encoding) of the best precompressed variant on disk.
+
+        A variant is only written when it is smaller, so a file may have a .gz
+        but no .br; the next acceptable coding is tried then.
+        """
+        if not path.endswith(COMPRESSIBLE):
+            return None
+        for encoding in encodings:
+            variant = path + EXTENSIONS[encoding]
+            try:
+                return variant, os.stat(variant), encoding
+            except OSError:
+                continue
+        return None
+
+
+def precompress(directory: str = STATIC_DIR):
+    """Write compressed siblings for every compressible file under directory.
+
+    Variants that are already newer than their source are left alone, and a
+    variant is only kept if it is actually smaller than the original.
+    """
+    written = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            source = os.path.join(root, name)
+            data = None
+            for encoding in supported_encodings():
+                target = source + EXTENSIONS[encoding]
+                if _is_fresh(target, source):
+                    continue
+                if data is None:
+                    with open(source, "rb") as f:
+                        data = f.read()
+                level = 9 if encoding == "gzip" else 11
+                compressed = compress(data, encoding, level=level)
+                if len(compressed) >= len(data):
+                    continue
+                with open(target, "wb") as f:
+                    f.write(compressed)
+                written.append(target)
+    return written
+
+
+def _is_fresh(target: str, source: str) -> bool:
+    if not os.path.exists(target):
+        return False
+    return os.path.getmtime(target) >= os.path.getmtime(source)
+
+
+if __name__ == "__main__":
+    for path in precompress(sys.argv[1] if len(sys.argv) > 1 else STATIC_DIR):
+        print(f"Wrote {path}")
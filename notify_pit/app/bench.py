@@ -0,0 +1,280 @@
+# Load generator and benchmark for the pit's own endpoints.
+#
+# Drives a weighted mix of API calls at a target concurrency (and optionally a
+# target request rate) and prints throughput and latency percentiles as JSON.
+#
+# In-process, through httpx's ASGI transport (no sockets, measures the app):
+#
+#   python -m app.bench --requests 5000 --concurrency 50
+#
+# Over the socket, against a running pit:
+#
+#   python -m app.bench --url http://localhost:8000 --duration 30 --rps 500
+#
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+import jwt
+
+from .auth import SECRET
+
+DEFAULT_MIX = "sms=6,email=2,received=1,preview=1"
+TEMPLATE_ID = "550e8400-e29b-41d4-a716-446655440000"
+
+
+def mint_token(secret: str = SECRET, iss: str = "notify-pit-bench") -> str:
+    """A token that validate_notify_jwt accepts for the next 30 seconds."""
+    return jwt.encode({"iss": iss, "iat": int(time.time())}, secret, algorithm="HS256")
+
+
+class TokenCache:
+    """Re-mints the bearer token well inside its 30 second lifetime."""
+
+    def __init__(self, secret: str = SECRET, iss: str = "notify-pit-bench"):
+        self.secret = secret
+        self.iss = iss
+        self._token = None
+        self._minted = 0.0
+
+    def headers(self) -> dict:
+        now = time.monotonic()
+        if self._token is None or now - self._minted > 10:
+            self._token = mint_token(self.secret, self.iss)
+            self._minted = now
+        return {"Authorization": f"Bearer {self._token}"}
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values, p: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarise(latencies) -> dict:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values) * 1000, 3) if values else None,
+        "p50": _ms(percentile(values, 50)),
+        "p95": _ms(percentile(values, 95)),
+        "p99": _ms(percentile(values, 99)),
+        "max": _ms(values[-1] if values else None),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+# --- Operations ---
+
+
+async def send_sms(client, ctx):
+    return await client.post(
+        "/v2/notifications/sms",
+        json={
+            "phone_number": "07700900000",
+            "template_id": ctx["template_id"],
+            "personalisation": {"username": "bench", "password": "secret"},
+            "reference": str(uuid.uuid4()),
+        },
+        headers=ctx["tokens"].headers(),
+    )
+
+
+async def send_email(client, ctx):
+    return await client.post(
+        "/v2/notifications/email",
+        json={
+            "email_address": "bench@example.com",
+            "template_id": ctx["template_id"],
+            "personalisation": {"name": "Bench"},
+        },
+        headers=ctx["tokens"].headers(),
+    )
+
+
+async def send_letter(client, ctx):
+    return await client.post(
+        "/v2/notifications/letter",
+        json={
+            "template_id": ctx["template_id"],
+            "personalisation": {"address_line_1": "Bench", "postcode": "SW1A 1AA"},
+        },
+        headers=ctx["tokens"].headers(),
+    )
+
+
+async def received_texts(client, ctx):
+    return await client.get(
+        "/v2/received-text-messages", headers=ctx["tokens"].headers()
+    )
+
+
+async def preview(client, ctx):
+    return await client.post(
+        f"/v2/template/{ctx['template_id']}/preview",
+        json={"personalisation": {"name": "Bench"}},
+        headers=ctx["tokens"].headers(),
+    )
+
+
+async def list_notifications(client, ctx):
+    return await client.get("/pit/notifications")
+
+
+OPERATIONS = {
+    "sms": send_sms,
+    "email": send_email,
+    "letter": send_letter,
+    "received": received_texts,
+    "preview": preview,
+    "list": list_notifications,
+}
+
+
+async def setup(client, tokens) -> dict:
+    r = await client.post(
+        "/pit/template",
+        json={"type": "email", "name": "Bench", "subject": "Hi", "body": "Hi ((name))"},
+    )
+    r.raise_for_status()
+    return {"tokens": tokens, "template_id": r.json()["id"]}
+
+
+async def run(
+    client: httpx.AsyncClient,
+    mix: dict,
+    concurrency: int = 10,
+    requests: int = None,
+    duration: float = None,
+    rps: float = None,
+    seed: int = None,
+    tokens: TokenCache = None,
+) -> dict:
+    """Run the benchmark with an already configured client."""
+    if requests is None and duration is None:
+        requests = 1000
+    ctx = await setup(client, tokens or TokenCache())
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    latencies = defaultdict(list)
+    statuses = Counter()
+    errors = Counter()
+    issued = 0
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+
+    async def worker():
+        nonlocal issued
+        while True:
+            if requests is not None and issued >= requests:
+                return
+            slot = issued
+            issued += 1
+            if rps:
+                delay = start + slot / rps - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if deadline and time.perf_counter() >= deadline:
+                return
+            name = rng.choices(names, weights)[0]
+            began = time.perf_counter()
+            try:
+                response = await OPERATIONS[name](client, ctx)
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] += 1
+                continue
+            latencies[name].append(time.perf_counter() - began)
+            statuses[response.status_code] += 1
+            if response.is_error:
+                errors[f"HTTP {response.status_code}"] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    completed = sum(len(v) for v in latencies.values())
+    return {
+        "concurrency": concurrency,
+        "target_rps": rps,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": completed,
+        "throughput_rps": round(completed / elapsed, 1) if elapsed else None,
+        "errors": dict(errors),
+        "status_codes": {str(k): v for k, v in sorted(statuses.items())},
+        "latency_ms": summarise([x for v in latencies.values() for x in v]),
+        "operations": {name: summarise(v) for name, v in sorted(latencies.items())},
+    }
+
+
+def in_process_client() -> httpx.AsyncClient:
+    from .database import Base, engine
+    from .main import app
+
+    Base.metadata.create_all(bind=engine)
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://notify-pit"
+    )
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.bench")
+    parser.add_argument("--url", help="Benchmark a running pit instead of in-process")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"(default {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int)
+    parser.add_argument("--duration", type=float, help="Seconds to run for")
+    parser.add_argument("--rps", type=float, help="Target request rate")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--secret", default=SECRET)
+    parser.add_argument("--iss", default="notify-pit-bench")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        client = httpx.AsyncClient(
+            base_url=args.url,
+            timeout=30,
+            limits=httpx.Limits(max_connections=args.concurrency),
+        )
+    else:
+        client = in_process_client()
+
+    async with client:
+        result = await run(
+            client,
+            parse_mix(args.mix),
+            concurrency=args.concurrency,
+            requests=args.requests,
+            duration=args.duration,
+            rps=args.rps,
+            seed=args.seed,
+            tokens=TokenCache(args.secret, args.iss),
+        )
+    result = {"mode": "socket" if args.url else "asgi", "mix": args.mix, **result}
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
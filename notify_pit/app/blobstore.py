@@ -0,0 +1,147 @@
+# Content-addressed file store for uploaded documents (precompiled letters
+# and email attachments).
+#
+# Files are stored once under their SHA-256, as <directory>/<ab>/<abcdef...>,
+# and written incrementally while they are uploaded, so no file is ever held
+# in memory whole. Rows keep just the hash and size. Identical uploads share
+# one file.
+#
+# Because they share it, a file can't simply be removed once no row refers
+# to it: another send may have just uploaded the same bytes and not yet
+# written its row. Filing an upload and removing a file both hold a lock on
+# the store (shared by every worker), and filing an upload that is already
+# there touches the file. A file is then only removed if it hasn't been
+# touched since this process created it, or not for PIT_BLOB_GRACE seconds.
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from .config import env_float, env_int
+
+BLOB_DIR = os.environ.get("PIT_BLOB_DIR", "./blobs")
+
+
+class BlobWriter:
+    """Receives a file in chunks; commit() files it under its hash."""
+
+    def __init__(self, store: "BlobStore", max_size: int = 0):
+        self.store = store
+        self.max_size = max_size
+        self.size = 0
+        self._hash = hashlib.sha256()
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.directory, suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.size += len(data)
+        if self.max_size and self.size > self.max_size:
+            raise ValueError(f"File is larger than {self.max_size} bytes")
+        self._hash.update(data)
+        self._file.write(data)
+
+    def commit(self) -> tuple:
+        """Store the file; returns (sha256, size)."""
+        self._file.close()
+        sha256 = self._hash.hexdigest()
+        path = self.store.path(sha256)
+        with self.store.locked():
+            if os.path.exists(path):
+                os.remove(self._tmp_path)
+                # Newer than any time the file was filed at before
+                ns = max(time.time_ns(), os.stat(path).st_mtime_ns + 1)
+                os.utime(path, ns=(ns, ns))
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(self._tmp_path, path)
+                self.store.created[sha256] = os.stat(path).st_mtime_ns
+        return sha256, self.size
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class BlobStore:
+    def __init__(self, directory: str, max_size: int = 0, grace: float = 60.0):
+        self.directory = directory
+        self.max_size = max_size
+        self.grace = grace
+        # Files this process created and no row refers to yet, with the
+        # modification time they were created with
+        self.created = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            BLOB_DIR,
+            max_size=env_int("PIT_MAX_FILE_SIZE", 0),
+            grace=env_float("PIT_BLOB_GRACE", 60.0),
+        )
+
+    @contextmanager
+    def locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def path(self, sha256: str) -> str:
+        if len(sha256) != 64 or not all(c in "0123456789abcdef" for c in sha256):
+            raise ValueError(f"Not a SHA-256: {sha256!r}")
+        return os.path.join(self.directory, sha256[:2], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path(sha256))
+
+    def writer(self) -> BlobWriter:
+        os.makedirs(self.directory, exist_ok=True)
+        return BlobWriter(self, self.max_size)
+
+    def put(self, data: bytes) -> tuple:
+        writer = self.writer()
+        try:
+            writer.write(data)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def release(self, files):
+        """Stop tracking files as new once a row refers to them."""
+        for sha256 in files:
+            self.created.pop(sha256, None)
+
+    def remove(self, sha256: str):
+        """Remove a file no row refers to, unless another send may want it."""
+        path = self.path(sha256)
+        created = self.created.pop(sha256, None)
+        with self.locked():
+            try:
+                modified = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                return
+            if created is None:
+                in_use = time.time_ns() - modified < self.grace * 1e9
+            else:
+                in_use = modified != created
+            if not in_use:
+                os.remove(path)
+
+    def clear(self):
+        self.created.clear()
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
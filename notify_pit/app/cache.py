@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+
+class TTLCache:
+    """A small in-process cache whose entries expire after ``ttl`` seconds.
+
+    Lookups are counted in the cache metrics under ``name``. Each worker has
+    its own copy, so a change made through another worker is seen at most
+    ``ttl`` seconds late; changes made through this worker invalidate the
+    entry straight away.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = 10_000, clock=None):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock or time.monotonic
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > self.clock():
+            metrics.CACHE_REQUESTS.inc(self.name, "hit")
+            return entry[1]
+        metrics.CACHE_REQUESTS.inc(self.name, "miss")
+        return None
+
+    def put(self, key, value):
+        if self.ttl <= 0:
+            return
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LRUCache:
+    """An in-process cache of byte strings, bounded by their total size.
+
+    The least recently used entries are dropped once the values add up to
+    more than ``max_bytes``. Lookups are counted like TTLCache's. Entries are
+    read and written from worker threads as well as the event loop, hence
+    the lock.
+    """
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        metrics.CACHE_REQUESTS.inc(self.name, "hit" if value is not None else "miss")
+        return value
+
+    def put(self, key, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
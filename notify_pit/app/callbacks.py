@@ -0,0 +1,310 @@
+# Delivery receipt and inbound SMS callbacks.
+#
+# Events (status changes, received texts) are queued as they happen. A single
+# resolver task drains them in batches, loading the notifications and service
+# callback settings for a whole batch in one round trip, and hands the
+# resulting deliveries to a fixed pool of sender tasks sharing one pooled
+# httpx client. Failed deliveries wait in a retry heap with exponential
+# backoff.
+import asyncio
+import heapq
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import httpx
+
+from . import crud
+from .config import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_STATUS = "delivery_status"
+INBOUND_SMS = "inbound_sms"
+
+# Notify only calls back once a notification reaches a final status
+FINAL_STATUSES = {
+    "delivered",
+    "permanent-failure",
+    "temporary-failure",
+    "technical-failure",
+    "received",
+}
+
+
+@dataclass
+class Delivery:
+    url: str
+    bearer_token: str
+    payload: dict
+    attempt: int = 0
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def delivery_status_payload(notification, status: str) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "id": notification.id,
+        "reference": notification.reference,
+        "to": notification.phone_number or notification.email_address,
+        "status": status,
+        "created_at": _isoformat(notification.created_at),
+        "completed_at": now,
+        "sent_at": now,
+        "notification_type": notification.type,
+        "template_id": notification.template_id,
+        # Notifications don't record which template version they were sent with
+        "template_version": 1,
+    }
+
+
+def inbound_sms_payload(notification) -> dict:
+    return {
+        "id": notification.id,
+        "source_number": notification.phone_number,
+        "destination_number": notification.notify_number or "407555000000",
+        "message": notification.content,
+        "date_received": _isoformat(notification.created_at),
+    }
+
+
+class CallbackDispatcher:
+    def __init__(
+        self,
+        session_factory,
+        concurrency: int = 10,
+        batch_size: int = 100,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        timeout: float = 5.0,
+        max_queue: int = 100_000,
+        transport: "httpx.AsyncBaseTransport" = None,
+        clock=time.monotonic,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.transport = transport
+        self.clock = clock
+
+        self.sent = 0
+        self.failed = 0
+        # Events that found the queue full, and deliveries that ran out of
+        # attempts (or failed for good)
+        self.dropped_queue_full = 0
+        self.dropped_retries_exhausted = 0
+        self.latency_total = 0.0
+        self.latencies = deque(maxlen=1000)
+
+        self._events = None
+        self._deliveries = None
+        # (due, sequence, Delivery)
+        self._retries = []
+        self._sequence = 0
+        self._retry_wakeup = None
+        self._client = None
+        self._tasks = []
+
+    @classmethod
+    def from_env(cls, session_factory):
+        return cls(
+            session_factory,
+            concurrency=env_int("PIT_CALLBACK_CONCURRENCY", 10),
+            batch_size=env_int("PIT_CALLBACK_BATCH_SIZE", 100),
+            max_attempts=env_int("PIT_CALLBACK_MAX_ATTEMPTS", 5),
+            base_delay=env_float("PIT_CALLBACK_RETRY_DELAY", 1.0),
+            timeout=env_float("PIT_CALLBACK_TIMEOUT", 5.0),
+        )
+
+    # --- Triggers (called on the event loop) ---
+
+    def status_changed(self, transitions):
+        """Listener for StatusSimulator batches of (notification_id, status)."""
+        for notification_id, status in transitions:
+            if status in FINAL_STATUSES:
+                self._enqueue((DELIVERY_STATUS, notification_id, status))
+
+    def inbound_received(self, notification_id: str):
+        self._enqueue((INBOUND_SMS, notification_id, None))
+
+    def _enqueue(self, event):
+        if self._events is None:
+            return
+        try:
+            self._events.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped_queue_full += 1
+
+    # --- Metrics ---
+
+    def metrics(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "queue_depth": (self._events.qsize() if self._events else 0)
+            + (self._deliveries.qsize() if self._deliveries else 0),
+            "retry_depth": len(self._retries),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped_queue_full": self.dropped_queue_full,
+            "dropped_retries_exhausted": self.dropped_retries_exhausted,
+            "latency_seconds": {
+                "mean": self.latency_total / self.sent if self.sent else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+
+    # --- Resolving events into deliveries ---
+
+    def resolve(self, events):
+        """Turn queued events into deliveries with two queries per batch."""
+        with self.session_factory() as db:
+            notifications = {
+                n.id: n
+                for n in crud.get_notifications_by_id(db, {e[1] for e in events})
+            }
+            service_ids = {n.service_id for n in notifications.values()}
+            callbacks = {
+                (c.service_id, c.callback_type): c
+                for c in crud.get_service_callbacks(db, service_ids)
+            }
+            deliveries = []
+            for callback_type, notification_id, status in events:
+                notification = notifications.get(notification_id)
+                if notification is None:
+                    continue
+                callback = callbacks.get((notification.service_id, callback_type))
+                if callback is None:
+                    continue
+                if callback_type == DELIVERY_STATUS:
+                    payload = delivery_status_payload(notification, status)
+                else:
+                    payload = inbound_sms_payload(notification)
+                deliveries.append(
+                    Delivery(callback.url, callback.bearer_token, payload)
+                )
+            return deliveries
+
+    async def _resolver(self):
+        while True:
+            events = [await self._events.get()]
+            while len(events) < self.batch_size and not self._events.empty():
+                events.append(self._events.get_nowait())
+            try:
+                deliveries = await asyncio.to_thread(self.resolve, events)
+            except Exception:
+                logger.exception("Failed to resolve %d callback events", len(events))
+                continue
+            for delivery in deliveries:
+                await self._deliveries.put(delivery)
+
+    # --- Sending ---
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        # Jitter stops retries from a burst of failures lining up again
+        return random.uniform(delay / 2, delay)
+
+    async def send(self, delivery: Delivery) -> bool:
+        delivery.attempt += 1
+        start = time.perf_counter()
+        try:
+            response = await self._client.post(
+                delivery.url,
+                json=delivery.payload,
+                headers={"Authorization": f"Bearer {delivery.bearer_token}"},
+            )
+            ok = response.is_success
+            retryable = response.status_code >= 500 or response.status_code == 429
+        except httpx.HTTPError as e:
+            logger.info("Callback to %s failed: %s", delivery.url, e)
+            ok, retryable = False, True
+        elapsed = time.perf_counter() - start
+
+        if ok:
+            self.sent += 1
+            self.latency_total += elapsed
+            self.latencies.append(elapsed)
+            return True
+
+        self.failed += 1
+        if retryable and delivery.attempt < self.max_attempts:
+            self._sequence += 1
+            due = self.clock() + self.backoff(delivery.attempt)
+            heapq.heappush(self._retries, (due, self._sequence, delivery))
+            if self._retries[0][2] is delivery:
+                self._retry_wakeup.set()
+        else:
+            self.dropped_retries_exhausted += 1
+        return False
+
+    async def _sender(self):
+        while True:
+            delivery = await self._deliveries.get()
+            try:
+                await self.send(delivery)
+            except Exception:
+                logger.exception("Unexpected error sending callback")
+
+    async def _retrier(self):
+        while True:
+            self._retry_wakeup.clear()
+            now = self.clock()
+            while self._retries and self._retries[0][0] <= now:
+                _, _, delivery = heapq.heappop(self._retries)
+                await self._deliveries.put(delivery)
+            timeout = self._retries[0][0] - self.clock() if self._retries else None
+            try:
+                await asyncio.wait_for(self._retry_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- Lifecycle ---
+
+    def start(self):
+        if self._tasks:
+            return
+        self._events = asyncio.Queue(maxsize=self.max_queue)
+        self._deliveries = asyncio.Queue(maxsize=self.concurrency * 10)
+        self._retry_wakeup = asyncio.Event()
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+            transport=self.transport,
+        )
+        loop = asyncio.get_running_loop()
+        self._tasks = [
+            loop.create_task(self._resolver()),
+            loop.create_task(self._retrier()),
+        ] + [loop.create_task(self._sender()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
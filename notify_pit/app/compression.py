@@ -0,0 +1,100 @@
+import gzip
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+
+def supported_encodings():
+    """Content codings we can produce, most preferred first."""
+    return ("br", "gzip") if brotli else ("gzip",)
+
+
+def acceptable(accept_encoding: str) -> list:
+    """The content codings we can produce that the client accepts, best first."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return [
+        encoding
+        for encoding in supported_encodings()
+        if accepted.get(encoding, accepted.get("*", 0)) > 0
+    ]
+
+
+def negotiate(accept_encoding: str):
+    """Pick the best content coding the client accepts, or None."""
+    encodings = acceptable(accept_encoding)
+    return encodings[0] if encodings else None
+
+
+def compress(data: bytes, encoding: str, level: int = None) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=4 if level is None else level)
+    return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+
+
+class CompressionMiddleware:
+    """Compress complete JSON responses above ``minimum_size`` bytes.
+
+    The content coding is negotiated from Accept-Encoding (brotli when it is
+    installed, otherwise gzip). Streaming responses and responses that already
+    carry a Content-Encoding are passed through untouched. Every response
+    that could have been compressed says ``Vary: Accept-Encoding``, whether
+    it was or not, so shared caches keep the variants apart.
+    """
+
+    def __init__(self, app, minimum_size=1024, media_types=("application/json",)):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.media_types = media_types
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] == "http.response.body" and start_message is not None:
+                start, start_message = start_message, None
+                headers = MutableHeaders(raw=list(start["headers"]))
+                body = message.get("body", b"")
+                if self._should_compress(headers, body, message):
+                    headers.add_vary_header("Accept-Encoding")
+                    if encoding is not None:
+                        body = compress(body, encoding)
+                        headers["content-encoding"] = encoding
+                        headers["content-length"] = str(len(body))
+                        message = {**message, "body": body}
+                    start = {**start, "headers": headers.raw}
+                await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    def _should_compress(self, headers, body, message):
+        media_type = headers.get("content-type", "").split(";")[0].strip()
+        return (
+            not message.get("more_body", False)
+            and len(body) >= self.minimum_size
+            and media_type in self.media_types
+            and "content-encoding" not in headers
+        )
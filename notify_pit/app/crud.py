@@ -1,9 +1,57 @@
-from datetime import datetime, timezone
+from collections import Counter
+from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import desc
+import orjson
+from sqlalchemy import (
+    String,
+    cast,
+    delete,
+    desc,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Session
+from sqlalchemy.sql.functions import FunctionElement
 
-from . import models, schemas
+from . import models, schemas, stats
+from .blobstore import BlobStore
+from .cache import TTLCache
+from .config import env_float, env_list
+from .uploads import Base64Decoder, UploadError
+
+# Template rows by id, for the read-heavy /v2/template endpoints. Warm-up
+# preloads every template, and template writes invalidate their entry, so
+# entries can live long; the TTL only bounds how late a worker sees an edit
+# made through another worker.
+TEMPLATE_CACHE_TTL = env_float("PIT_TEMPLATE_CACHE_TTL", 300.0)
+template_cache = TTLCache("templates", ttl=TEMPLATE_CACHE_TTL)
+
+# Uploaded files: precompiled letter PDFs and email attachments
+blobs = BlobStore.from_env()
+
+# Personalisation keys copied into the indexed personalisation_values table
+PROMOTED_KEYS = frozenset(env_list("PIT_PROMOTED_KEYS"))
+
+# With a window, a send repeating a (service, reference) pair seen within
+# that many seconds returns the original notification instead of a new one.
+# Recent pairs are cached so repeats are answered without a query; the
+# idempotency_keys primary key catches the rest, including other workers'.
+IDEMPOTENCY_WINDOW = env_float("PIT_IDEMPOTENCY_WINDOW", 0.0)
+recent_sends = TTLCache("idempotency", ttl=IDEMPOTENCY_WINDOW, maxsize=100_000)
+
+
+class DuplicateSend(Exception):
+    """A repeated (service, reference) within the idempotency window."""
+
+    def __init__(self, notification_id: str):
+        super().__init__(notification_id)
+        self.notification_id = notification_id
 
 
 def get_notification(db: Session, notification_id: str):
@@ -20,22 +68,470 @@ def create_notification(
     type: str,
     phone_number: str = None,
     email_address: str = None,
+    service_id: str = None,
 ):
+    """Store a new notification.
+
+    File attachments in the personalisation are moved to the blob store, and
+    the row keeps {"sha256", "size"} in place of each file's base64.
+
+    Raises DuplicateSend when idempotency is on and the reference was already
+    used by this service within the window.
+    """
+    personalisation, files = _store_attachments(notification.personalisation)
+    if isinstance(notification, schemas.PrecompiledLetterRequest):
+        files.add(notification.file_sha256)
+
+    idempotency_key = None
+    if IDEMPOTENCY_WINDOW > 0 and notification.reference:
+        idempotency_key = (service_id or "", notification.reference)
+        original = recent_sends.get(idempotency_key)
+        if original:
+            _remove_unreferenced_files(db, files)
+            raise DuplicateSend(original)
+
     db_notification = models.Notification(
+        id=models.generate_uuid(),
         type=type,
-        template_id=str(notification.template_id),
+        service_id=service_id,
+        template_id=str(notification.template_id) if notification.template_id else None,
         reference=notification.reference,
         phone_number=phone_number,
         email_address=email_address,
-        personalisation=notification.personalisation,
+        personalisation=personalisation,
         created_at=datetime.now(timezone.utc),
+        status="created",
     )
-    db.add(db_notification)
-    db.commit()
+    if isinstance(notification, schemas.PrecompiledLetterRequest):
+        db_notification.file_sha256 = notification.file_sha256
+        db_notification.file_size = notification.file_size
+        db_notification.postage = notification.postage
+    _add_notification(db, db_notification, files)
+    if idempotency_key is None:
+        db.commit()
+    else:
+        try:
+            _commit_idempotent(db, db_notification, idempotency_key, files)
+        except DuplicateSend:
+            _remove_unreferenced_files(db, files)
+            raise
+    blobs.release(files)
     db.refresh(db_notification)
     return db_notification
 
 
+def _add_notification(db: Session, notification: models.Notification, files=()):
+    db.add(notification)
+    _count_new(db, notification)
+    _promote(db, notification.id, notification.personalisation)
+    for sha256 in files:
+        db.add(models.NotificationFile(notification_id=notification.id, sha256=sha256))
+
+
+def _commit_idempotent(
+    db: Session, notification: models.Notification, key: tuple, files=()
+):
+    # Keys are written and read as plain rows, never as ORM instances, so a
+    # key already loaded into the session can't clash with the new one
+    keys = models.IdempotencyKey.__table__
+    row = {
+        "service_id": key[0],
+        "reference": key[1],
+        "notification_id": notification.id,
+        "created_at": notification.created_at,
+    }
+    try:
+        db.execute(insert(keys), [row])
+        db.commit()
+    except IntegrityError:
+        # The primary key says the reference has been used before
+        db.rollback()
+        cutoff = notification.created_at - timedelta(seconds=IDEMPOTENCY_WINDOW)
+        _raise_if_duplicate(db, key, cutoff)
+        # Last used before the window: this send becomes the original. The
+        # key is taken over in place, and only while it is still stale, so
+        # of two sends reusing it at once one wins and the other is a repeat.
+        _add_notification(db, notification, files)
+        try:
+            claimed = db.execute(
+                update(keys)
+                .where(
+                    keys.c.service_id == key[0],
+                    keys.c.reference == key[1],
+                    keys.c.created_at <= cutoff,
+                )
+                .values(notification_id=notification.id, created_at=row["created_at"])
+            )
+            if claimed.rowcount == 0:
+                # Purged or claimed meanwhile: insert it, or fail as a repeat
+                db.execute(insert(keys), [row])
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            _raise_if_duplicate(db, key, cutoff)
+            raise
+    recent_sends.put(key, notification.id)
+
+
+def _raise_if_duplicate(db: Session, key: tuple, cutoff: datetime):
+    keys = models.IdempotencyKey.__table__
+    existing = db.execute(
+        select(keys.c.notification_id, keys.c.created_at).where(
+            keys.c.service_id == key[0], keys.c.reference == key[1]
+        )
+    ).first()
+    if existing is not None and _as_utc(existing.created_at) > cutoff:
+        raise DuplicateSend(existing.notification_id)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes, which are UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _store_attachments(personalisation):
+    """Move the files attached in personalisation into the blob store.
+
+    Returns a copy of the personalisation with each attachment's base64 file
+    replaced by {"sha256", "size"}, and the set of hashes it refers to.
+    Attachments streamed to the store already (see main.send_email) arrive
+    in that form and are kept as they are.
+    """
+    files = set()
+    if not personalisation:
+        return personalisation, files
+    stored = dict(personalisation)
+    for key, value in personalisation.items():
+        if not _is_attachment(value):
+            continue
+        file = value["file"]
+        if isinstance(file, str):
+            file = _put_attachment(file)
+        elif not _is_stored_file(file):
+            continue
+        stored[key] = {**value, "file": file}
+        files.add(file["sha256"])
+    return stored, files
+
+
+def _is_attachment(value) -> bool:
+    # Anything shaped like prepare_upload()'s {"file": ..., "filename": ...},
+    # extra keys or not. main._attachment_sink streams the same values, so
+    # every file it stores is recorded here.
+    return isinstance(value, dict) and "file" in value
+
+
+def _is_stored_file(file) -> bool:
+    if not isinstance(file, dict) or not isinstance(file.get("sha256"), str):
+        return False
+    try:
+        return blobs.exists(file["sha256"])
+    except ValueError:
+        return False
+
+
+def _put_attachment(text: str) -> dict:
+    decoder = Base64Decoder()
+    data = decoder.feed(text.encode())
+    decoder.finish()
+    try:
+        sha256, size = blobs.put(data)
+    except ValueError as e:
+        raise UploadError(str(e)) from None
+    return {"sha256": sha256, "size": size}
+
+
+def personalisation_text(value) -> str:
+    """How a personalisation value is stored and compared when promoted."""
+    return value if isinstance(value, str) else orjson.dumps(value).decode()
+
+
+def _promoted_values(notification_id: str, personalisation) -> list:
+    if not personalisation or not PROMOTED_KEYS:
+        return []
+    return [
+        {
+            "notification_id": notification_id,
+            "key": key,
+            "value": personalisation_text(value),
+        }
+        for key, value in personalisation.items()
+        if key in PROMOTED_KEYS
+        and value is not None
+        and not isinstance(value, (dict, list))
+    ]
+
+
+def _promote(db: Session, notification_id: str, personalisation):
+    rows = _promoted_values(notification_id, personalisation)
+    if rows:
+        db.execute(insert(models.PersonalisationValue.__table__), rows)
+
+
+def _insert_new(db: Session, table, rows: list):
+    # Rows whose primary key is already there (say, copied by a concurrent
+    # backfill) are skipped rather than failing the batch
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        db.execute(insert(table), rows)
+        return
+    db.execute(dialect_insert(table).on_conflict_do_nothing(), rows)
+
+
+def promote_existing(db: Session, batch_size: int = 1000) -> int:
+    """Copy promoted keys for notifications created before they were promoted.
+
+    Works through the notifications in id order, one batch (and one
+    transaction) at a time, so memory stays flat however many need copying.
+    """
+    if not PROMOTED_KEYS:
+        return 0
+    table = models.Notification.__table__
+    values = models.PersonalisationValue.__table__
+    keys = sorted(PROMOTED_KEYS)
+    copied = 0
+    after = None
+    while True:
+        statement = (
+            select(table.c.id, table.c.personalisation)
+            .where(table.c.personalisation.is_not(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        )
+        if after is not None:
+            statement = statement.where(table.c.id > after)
+        batch = db.execute(statement).all()
+        if not batch:
+            break
+        after = batch[-1].id
+        ids = [notification_id for notification_id, _ in batch]
+        done = set(
+            db.execute(
+                select(values.c.notification_id, values.c.key).where(
+                    values.c.notification_id.in_(ids), values.c.key.in_(keys)
+                )
+            ).all()
+        )
+        rows = [
+            row
+            for notification_id, personalisation in batch
+            for row in _promoted_values(notification_id, personalisation)
+            if (notification_id, row["key"]) not in done
+        ]
+        if rows:
+            _insert_new(db, values, rows)
+            copied += len(rows)
+        db.commit()
+    return copied
+
+
+def _count_new(db: Session, notification: models.Notification):
+    stats.record(
+        db,
+        Counter(
+            {
+                stats.key(
+                    notification.type,
+                    notification.status,
+                    notification.template_id,
+                    notification.created_at,
+                ): 1
+            }
+        ),
+    )
+
+
+def _rows(db: Session, statement):
+    # Core select of plain columns: rows come back as tuples, so nothing is
+    # added to the identity map and no ORM instances are built.
+    result = db.execute(statement)
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def _select_notifications(
+    type: str = None,
+    status: str = None,
+    template_id: str = None,
+    reference: str = None,
+    created_after: datetime = None,
+    created_before: datetime = None,
+    personalisation: dict = None,
+):
+    table = models.Notification.__table__
+    statement = select(*table.columns)
+    if type:
+        statement = statement.where(table.c.type == type)
+    if status:
+        statement = statement.where(table.c.status == status)
+    if template_id:
+        statement = statement.where(table.c.template_id == template_id)
+    if reference:
+        statement = statement.where(table.c.reference == reference)
+    if created_after:
+        statement = statement.where(table.c.created_at >= created_after)
+    if created_before:
+        statement = statement.where(table.c.created_at < created_before)
+    values = models.PersonalisationValue.__table__
+    for key, value in (personalisation or {}).items():
+        if key in PROMOTED_KEYS:
+            matching = select(values.c.notification_id).where(
+                values.c.key == key, values.c.value == value
+            )
+            statement = statement.where(table.c.id.in_(matching))
+        else:
+            # Not promoted: compare the value inside the JSON, row by row, as
+            # personalisation_text would write it, so "true" matches true
+            statement = statement.where(_personalisation_matches(key, value))
+    return statement
+
+
+class _json_text(FunctionElement):
+    """A personalisation value as JSON text: true, 1815 or "ada"."""
+
+    type = String()
+    inherit_cache = True
+
+
+@compiles(_json_text)
+def _compile_json_text(element, compiler, **kw):
+    column, key = element.clauses
+    return compiler.process(cast(column[key.value], String), **kw)
+
+
+@compiles(_json_text, "sqlite")
+def _compile_json_text_sqlite(element, compiler, **kw):
+    # JSON_EXTRACT turns true into 1, but -> keeps the JSON text
+    column, key = element.clauses
+    return compiler.process(column.op("->")(f'$."{key.value}"'), **kw)
+
+
+def _personalisation_matches(key: str, value: str):
+    table = models.Notification.__table__
+    matches = table.c.personalisation[key].as_string() == value
+    try:
+        parsed = orjson.loads(value)
+    except orjson.JSONDecodeError:
+        return matches
+    # Numbers and booleans; None isn't promoted, so it doesn't match either
+    if parsed is None or isinstance(parsed, (str, dict, list)):
+        return matches
+    if personalisation_text(parsed) != value:
+        return matches
+    return or_(matches, _json_text(table.c.personalisation, literal(key)) == value)
+
+
+def get_notification_rows(db: Session, **filters):
+    """Notifications as plain dicts, ready for JSON serialisation."""
+    return _rows(db, _select_notifications(**filters))
+
+
+def iter_notification_rows(db: Session, batch_size: int = 1000, **filters):
+    """Like get_notification_rows, but streamed from a server-side cursor.
+
+    Only ``batch_size`` rows are buffered at a time, so exporting the whole
+    table runs in constant memory.
+    """
+    result = db.execute(
+        _select_notifications(**filters),
+        execution_options={"yield_per": batch_size},
+    )
+    keys = list(result.keys())
+    for row in result:
+        yield dict(zip(keys, row))
+
+
+def count_notifications_of_type(db: Session, type: str) -> int:
+    table = models.Notification.__table__
+    return db.execute(
+        select(func.count()).select_from(table).where(table.c.type == type)
+    ).scalar_one()
+
+
+def oldest_notification_ids(
+    db: Session, type: str, limit: int, created_before: datetime = None
+):
+    """Ids of the oldest notifications of a type, using the (type, created_at) index."""
+    table = models.Notification.__table__
+    statement = select(table.c.id).where(table.c.type == type)
+    if created_before:
+        statement = statement.where(table.c.created_at < created_before)
+    statement = statement.order_by(table.c.created_at).limit(limit)
+    return list(db.execute(statement).scalars())
+
+
+def get_notification_rows_by_id(db: Session, notification_ids):
+    table = models.Notification.__table__
+    return _rows(
+        db,
+        select(*table.columns)
+        .where(table.c.id.in_(notification_ids))
+        .order_by(table.c.created_at),
+    )
+
+
+def delete_notifications(db: Session, notification_ids) -> int:
+    table = models.Notification.__table__
+    deltas = Counter()
+    for row in db.execute(
+        select(
+            table.c.type,
+            table.c.status,
+            table.c.template_id,
+            table.c.created_at,
+        ).where(table.c.id.in_(notification_ids))
+    ):
+        deltas[stats.key(*row)] -= 1
+    stats.record(db, deltas)
+    file_rows = models.NotificationFile.__table__
+    files = set(
+        db.execute(
+            select(file_rows.c.sha256).where(
+                file_rows.c.notification_id.in_(notification_ids)
+            )
+        ).scalars()
+    )
+    for side_table in (
+        models.PersonalisationValue.__table__,
+        models.IdempotencyKey.__table__,
+        file_rows,
+    ):
+        db.execute(
+            delete(side_table).where(side_table.c.notification_id.in_(notification_ids))
+        )
+    result = db.execute(delete(table).where(table.c.id.in_(notification_ids)))
+    db.commit()
+    if files:
+        _remove_unreferenced_files(db, files)
+    return result.rowcount
+
+
+def discard_unreferenced_files(db: Session, files):
+    """Remove uploaded files that no notification ended up using."""
+    _remove_unreferenced_files(db, set(files))
+
+
+def _remove_unreferenced_files(db: Session, files: set):
+    # Identical uploads share a file, so only remove it with its last row
+    if not files:
+        return
+    table = models.NotificationFile.__table__
+    still_used = set(
+        db.execute(select(table.c.sha256).where(table.c.sha256.in_(files))).scalars()
+    )
+    for sha256 in files - still_used:
+        blobs.remove(sha256)
+
+
+def get_template_rows(db: Session):
+    """All templates as plain dicts, ready for JSON serialisation."""
+    return _rows(db, select(*models.Template.__table__.columns))
+
+
 def get_received_texts(db: Session):
     return (
         db.query(models.Notification)
@@ -46,14 +542,19 @@ def get_received_texts(db: Session):
 
 
 # Testing helper for received texts
-def create_received_text(db: Session, phone_number: str, content: str):
+def create_received_text(
+    db: Session, phone_number: str, content: str, service_id: str = None
+):
     db_notification = models.Notification(
         type="sms",
         phone_number=phone_number,
         content=content,
+        service_id=service_id,
         created_at=datetime.now(timezone.utc),
+        status="created",
     )
     db.add(db_notification)
+    _count_new(db, db_notification)
     db.commit()
     db.refresh(db_notification)
     return db_notification
@@ -70,6 +571,27 @@ def get_template(db: Session, template_id: str):
     return db.query(models.Template).filter(models.Template.id == template_id).first()
 
 
+def get_template_row(db: Session, template_id: str):
+    """A template as a plain dict, served from template_cache when possible."""
+    row = template_cache.get(template_id)
+    if row is None:
+        table = models.Template.__table__
+        rows = _rows(db, select(*table.columns).where(table.c.id == template_id))
+        if not rows:
+            return None
+        row = rows[0]
+        template_cache.put(template_id, row)
+    return row
+
+
+def preload_templates(db: Session) -> int:
+    """Fill template_cache with every template, returning how many."""
+    rows = get_template_rows(db)
+    for row in rows:
+        template_cache.put(row["id"], row)
+    return len(rows)
+
+
 def create_template(db: Session, template: schemas.CreateTemplateRequest):
     db_template = models.Template(
         type=template.type,
@@ -102,6 +624,7 @@ def update_template(
 
     db.commit()
     db.refresh(db_template)
+    template_cache.invalidate(template_id)
     return db_template
 
 
@@ -110,11 +633,72 @@ def delete_template(db: Session, template_id: str):
     if db_template:
         db.delete(db_template)
         db.commit()
+        template_cache.invalidate(template_id)
         return True
     return False
 
 
+def get_notifications_by_id(db: Session, notification_ids):
+    return (
+        db.query(models.Notification)
+        .filter(models.Notification.id.in_(notification_ids))
+        .all()
+    )
+
+
+def get_service_callbacks(db: Session, service_ids=None):
+    query = db.query(models.ServiceCallback)
+    if service_ids is not None:
+        query = query.filter(models.ServiceCallback.service_id.in_(service_ids))
+    return query.all()
+
+
+def set_service_callback(db: Session, callback: schemas.ServiceCallbackRequest):
+    db_callback = (
+        db.query(models.ServiceCallback)
+        .filter(
+            models.ServiceCallback.service_id == callback.service_id,
+            models.ServiceCallback.callback_type == callback.callback_type,
+        )
+        .first()
+    )
+    if db_callback is None:
+        db_callback = models.ServiceCallback(
+            service_id=callback.service_id,
+            callback_type=callback.callback_type,
+            created_at=datetime.now(timezone.utc),
+        )
+        db.add(db_callback)
+    else:
+        db_callback.updated_at = datetime.now(timezone.utc)
+    db_callback.url = callback.url
+    db_callback.bearer_token = callback.bearer_token
+    db.commit()
+    db.refresh(db_callback)
+    return db_callback
+
+
+def delete_service_callback(db: Session, service_id: str, callback_type: str):
+    deleted = (
+        db.query(models.ServiceCallback)
+        .filter(
+            models.ServiceCallback.service_id == service_id,
+            models.ServiceCallback.callback_type == callback_type,
+        )
+        .delete()
+    )
+    db.commit()
+    return deleted > 0
+
+
 def reset_db(db: Session):
     db.query(models.Notification).delete()
     db.query(models.Template).delete()
+    db.query(models.PersonalisationValue).delete()
+    db.query(models.IdempotencyKey).delete()
+    db.query(models.NotificationFile).delete()
+    stats.clear(db)
     db.commit()
+    recent_sends.clear()
+    template_cache.clear()
+    blobs.clear()
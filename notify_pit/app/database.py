@@ -1,22 +1,72 @@
+import asyncio
 import os
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from .config import env_float, env_int
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./notify_pit.db")
+SQLITE_BUSY_TIMEOUT_MS = env_int("PIT_SQLITE_BUSY_TIMEOUT", 5000)
+
+
+def is_memory_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and make_url(url).database in (None, "", ":memory:")
+
+
+def _pool_options(url: str) -> dict:
+    # In-memory SQLite uses a single-connection pool that takes no sizing
+    if is_memory_sqlite(url):
+        return {}
+    # get_db waits for pooled connections off the event loop, so a full pool
+    # only queues requests. SQLite connections are just file handles, so
+    # don't cap them; server databases get a fixed pool with generous
+    # overflow.
+    sqlite = url.startswith("sqlite")
+    return {
+        "pool_size": env_int("PIT_DB_POOL_SIZE", 20),
+        "max_overflow": env_int("PIT_DB_MAX_OVERFLOW", -1 if sqlite else 20),
+        "pool_timeout": env_float("PIT_DB_POOL_TIMEOUT", 30.0),
+        "pool_pre_ping": not sqlite,
+    }
+
 
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
+    **_pool_options(DATABASE_URL),
 )
+
+
+if DATABASE_URL.startswith("sqlite") and not is_memory_sqlite(DATABASE_URL):
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers carry on while one connection writes, and
+        # busy_timeout makes a writer wait for the lock instead of failing
+        # with "database is locked" when several workers write at once.
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
+async def get_db():
+    # Endpoints run their queries on the event loop. Waiting there for a
+    # pooled connection would stall every request that could hand one back,
+    # so the connection is checked out in a thread and kept for the whole
+    # request; the session commits on it without returning it to the pool.
+    connection = await asyncio.to_thread(engine.connect)
+    db = SessionLocal(bind=connection)
     try:
         yield db
     finally:
         db.close()
+        connection.close()
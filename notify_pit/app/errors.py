@@ -0,0 +1,27 @@
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+
+class NotifyError(Exception):
+    """An error reported in Notify's own response shape.
+
+    Notify API errors look like::
+
+        {"status_code": 429, "errors": [{"error": "RateLimitError", "message": "..."}]}
+    """
+
+    def __init__(self, status_code: int, error: str, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error = error
+        self.message = message
+
+
+async def notify_error_handler(request: Request, exc: NotifyError) -> JSONResponse:
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={
+            "status_code": exc.status_code,
+            "errors": [{"error": exc.error, "message": exc.message}],
+        },
+    )
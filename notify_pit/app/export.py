@@ -0,0 +1,57 @@
+import csv
+import io
+import zlib
+
+import orjson
+
+from .models import Notification
+
+COLUMNS = [c.name for c in Notification.__table__.columns]
+
+# Rows are grouped into chunks so the response isn't one tiny write per row
+ROWS_PER_CHUNK = 500
+
+
+def ndjson_chunks(rows):
+    lines = []
+    for row in rows:
+        lines.append(orjson.dumps(row))
+        if len(lines) == ROWS_PER_CHUNK:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+def csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(_csv_value(row.get(name)) for name in COLUMNS)
+        count += 1
+        if count % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return orjson.dumps(value).decode()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def gzip_chunks(chunks, level: int = 6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,146 @@
+# Latency and fault injection.
+#
+# A profile maps path globs to a FaultRule: a latency distribution plus error
+# and timeout rates. The active profile is set through /pit/config and can be
+# overridden per request with the X-Pit-Fault-Profile header. Delays use
+# asyncio.sleep, so thousands of slowed requests can be in flight at once.
+import asyncio
+import bisect
+import os
+import random
+from fnmatch import fnmatchcase
+
+import orjson
+from starlette.datastructures import Headers
+
+from .schemas import FaultRule, LatencySpec
+
+HEADER = "x-pit-fault-profile"
+
+BUILTIN_PROFILES = {
+    "none": {},
+    "slow": {
+        "/v2/*": FaultRule(
+            latency=LatencySpec(distribution="normal", mean_ms=800, stddev_ms=200)
+        )
+    },
+    "degraded": {
+        "/v2/*": FaultRule(
+            latency=LatencySpec(
+                distribution="percentiles",
+                percentiles={50: 200, 90: 1000, 99: 5000, 100: 10000},
+            ),
+            error_rate=0.05,
+        )
+    },
+    "flaky": {"/v2/*": FaultRule(error_rate=0.2, timeout_rate=0.05)},
+}
+
+ERROR_NAMES = {
+    429: "RateLimitError",
+    500: "Exception",
+    502: "BadGateway",
+    503: "ServiceUnavailable",
+    504: "GatewayTimeout",
+}
+
+
+def sample_latency(spec: LatencySpec, rng: random.Random) -> float:
+    """Draw a delay in seconds from a latency spec."""
+    if spec.distribution == "fixed":
+        ms = spec.ms
+    elif spec.distribution == "normal":
+        ms = max(0.0, rng.gauss(spec.mean_ms, spec.stddev_ms))
+    else:
+        ms = _sample_percentiles(sorted(spec.percentiles.items()), rng.random() * 100)
+    return ms / 1000
+
+
+def _sample_percentiles(points, p: float) -> float:
+    # Inverse CDF by linear interpolation between the given percentiles. Below
+    # the first point the first value applies, above the last the last does.
+    if not points:
+        return 0.0
+    percents = [point[0] for point in points]
+    i = bisect.bisect_left(percents, p)
+    if i == 0:
+        return points[0][1]
+    if i == len(points):
+        return points[-1][1]
+    (p0, v0), (p1, v1) = points[i - 1], points[i]
+    return v0 + (v1 - v0) * (p - p0) / (p1 - p0)
+
+
+class FaultInjector:
+    def __init__(self, active: str = "none", rng: random.Random = None):
+        self.profiles = dict(BUILTIN_PROFILES)
+        self.active = active
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def from_env(cls):
+        active = os.environ.get("PIT_FAULT_PROFILE", "none")
+        if active not in BUILTIN_PROFILES:
+            raise ValueError(f"PIT_FAULT_PROFILE: unknown fault profile {active!r}")
+        return cls(active=active)
+
+    def rule_for(self, profile: str, path: str):
+        for pattern, rule in self.profiles[profile].items():
+            if fnmatchcase(path, pattern):
+                return rule
+        return None
+
+
+class FaultInjectionMiddleware:
+    def __init__(self, app, injector: FaultInjector):
+        self.app = app
+        self.injector = injector
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        # /pit/* stays reachable so a degraded pit can always be reconfigured
+        if scope["type"] != "http" or path.startswith("/pit/"):
+            await self.app(scope, receive, send)
+            return
+
+        injector = self.injector
+        profile = Headers(scope=scope).get(HEADER) or injector.active
+        if profile not in injector.profiles:
+            await _notify_error(send, 400, "BadRequestError", "Unknown fault profile")
+            return
+        rule = injector.rule_for(profile, path)
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        roll = injector.rng.random()
+        if roll < rule.timeout_rate:
+            await asyncio.sleep(rule.timeout_seconds)
+            await _notify_error(send, 504, "GatewayTimeout", "Request timed out")
+            return
+        if rule.latency is not None:
+            await asyncio.sleep(sample_latency(rule.latency, injector.rng))
+        if roll < rule.timeout_rate + rule.error_rate:
+            status = rule.error_status
+            await _notify_error(
+                send, status, ERROR_NAMES.get(status, "Exception"), "Injected fault"
+            )
+            return
+        await self.app(scope, receive, send)
+
+
+async def _notify_error(send, status: int, error: str, message: str):
+    body = orjson.dumps(
+        {"status_code": status, "errors": [{"error": error, "message": message}]}
+    )
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
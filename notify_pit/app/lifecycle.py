@@ -0,0 +1,218 @@
+# Delivery status simulation.
+#
+# Real Notify moves a notification through sending -> delivered (or one of the
+# failure states). The pit mimics that with a single scheduler task: pending
+# transitions live in one heap, so a million queued notifications cost a
+# million small tuples rather than a million asyncio tasks, and every wake-up
+# applies all due transitions with one UPDATE per target status.
+import asyncio
+import heapq
+import logging
+import random
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy import select, update
+
+from . import models, stats
+from .config import env_bool, env_float, env_int
+
+DELIVERED = "delivered"
+PERMANENT_FAILURE = "permanent-failure"
+TEMPORARY_FAILURE = "temporary-failure"
+
+logger = logging.getLogger(__name__)
+
+# Notify's smoke test and simulator recipients force a particular outcome
+MAGIC_RECIPIENTS = {
+    "07700900000": DELIVERED,
+    "07700900111": DELIVERED,
+    "07700900222": DELIVERED,
+    "07700900002": PERMANENT_FAILURE,
+    "07700900003": TEMPORARY_FAILURE,
+    "simulate-delivered@notifications.service.gov.uk": DELIVERED,
+    "simulate-delivered-2@notifications.service.gov.uk": DELIVERED,
+    "simulate-delivered-3@notifications.service.gov.uk": DELIVERED,
+    "perm-fail@simulator.notify": PERMANENT_FAILURE,
+    "temp-fail@simulator.notify": TEMPORARY_FAILURE,
+}
+
+# Letters go through their own states rather than sending/delivered
+SENDING_STATUS = {"letter": "accepted"}
+DELIVERED_STATUS = {"letter": "received"}
+
+
+def normalise_recipient(recipient: str) -> str:
+    recipient = (recipient or "").strip().lower()
+    if "@" in recipient:
+        return recipient
+    digits = "".join(c for c in recipient if c.isdigit())
+    if digits.startswith("44"):
+        digits = "0" + digits[2:]
+    return digits
+
+
+class StatusSimulator:
+    def __init__(
+        self,
+        session_factory,
+        sending_delay: float = 1.0,
+        delivery_delay: float = 5.0,
+        permanent_failure_rate: float = 0.0,
+        temporary_failure_rate: float = 0.0,
+        batch_size: int = 500,
+        max_pending: int = 1_000_000,
+        enabled: bool = True,
+        rng: random.Random = None,
+        clock=time.monotonic,
+    ):
+        self.session_factory = session_factory
+        self.sending_delay = sending_delay
+        self.delivery_delay = delivery_delay
+        self.permanent_failure_rate = permanent_failure_rate
+        self.temporary_failure_rate = temporary_failure_rate
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self.rng = rng or random.Random()
+        self.clock = clock
+        self.dropped = 0
+        # Called on the event loop with each applied batch of transitions
+        self.listeners = []
+        # (due, notification_id, status, final_status or None)
+        self._heap = []
+        self._wakeup = None
+        self._task = None
+
+    @classmethod
+    def from_env(cls, session_factory):
+        return cls(
+            session_factory,
+            sending_delay=env_float("PIT_SENDING_DELAY", 1.0),
+            delivery_delay=env_float("PIT_DELIVERY_DELAY", 5.0),
+            permanent_failure_rate=env_float("PIT_PERMANENT_FAILURE_RATE", 0.0),
+            temporary_failure_rate=env_float("PIT_TEMPORARY_FAILURE_RATE", 0.0),
+            max_pending=env_int("PIT_STATUS_MAX_PENDING", 1_000_000),
+            enabled=env_bool("PIT_STATUS_SIMULATION"),
+        )
+
+    def __len__(self):
+        return len(self._heap)
+
+    def outcome_for(self, type: str, recipient: str = None) -> str:
+        forced = MAGIC_RECIPIENTS.get(normalise_recipient(recipient))
+        if forced:
+            outcome = forced
+        else:
+            roll = self.rng.random()
+            if roll < self.permanent_failure_rate:
+                outcome = PERMANENT_FAILURE
+            elif roll < self.permanent_failure_rate + self.temporary_failure_rate:
+                outcome = TEMPORARY_FAILURE
+            else:
+                outcome = DELIVERED
+        if outcome == DELIVERED:
+            return DELIVERED_STATUS.get(type, DELIVERED)
+        return outcome
+
+    def schedule(self, notification):
+        """Queue the status transitions for a freshly created notification."""
+        if not self.enabled:
+            return
+        if len(self._heap) >= self.max_pending:
+            self.dropped += 1
+            return
+        recipient = notification.phone_number or notification.email_address
+        final = self.outcome_for(notification.type, recipient)
+        due = self.clock() + self.sending_delay
+        sending = SENDING_STATUS.get(notification.type, "sending")
+        heapq.heappush(self._heap, (due, notification.id, sending, final))
+        if self._wakeup is not None and self._heap[0][0] == due:
+            self._wakeup.set()
+
+    def pop_due(self, now: float):
+        """Remove up to batch_size due transitions and return them in order."""
+        batch = []
+        follow_ups = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            due, notification_id, status, final = heapq.heappop(self._heap)
+            batch.append((notification_id, status))
+            if final is not None:
+                follow_ups.append((due + self.delivery_delay, notification_id, final))
+        # Pushed afterwards so a notification never moves twice in one batch
+        for due, notification_id, final in follow_ups:
+            heapq.heappush(self._heap, (due, notification_id, final, None))
+        return batch
+
+    def apply(self, batch):
+        """Write a batch of transitions with one UPDATE per target status."""
+        by_status = defaultdict(list)
+        for notification_id, status in batch:
+            by_status[status].append(notification_id)
+        with self.session_factory() as db:
+            stats.record(db, self._stat_deltas(db, batch))
+            for status, ids in by_status.items():
+                db.execute(
+                    update(models.Notification)
+                    .where(models.Notification.id.in_(ids))
+                    .values(status=status)
+                )
+            db.commit()
+
+    @staticmethod
+    def _stat_deltas(db, batch) -> Counter:
+        # Notifications move one step per batch, so each id appears once
+        new_status = dict(batch)
+        table = models.Notification.__table__
+        deltas = Counter()
+        for id, type, status, template_id, created_at in db.execute(
+            select(
+                table.c.id,
+                table.c.type,
+                table.c.status,
+                table.c.template_id,
+                table.c.created_at,
+            ).where(table.c.id.in_(new_status))
+        ):
+            if status != new_status[id]:
+                deltas[stats.key(type, status, template_id, created_at)] -= 1
+                deltas[stats.key(type, new_status[id], template_id, created_at)] += 1
+        return deltas
+
+    def clear(self):
+        self._heap.clear()
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            batch = self.pop_due(self.clock())
+            if batch:
+                try:
+                    await asyncio.to_thread(self.apply, batch)
+                except Exception:
+                    logger.exception(
+                        "Failed to apply %d status transitions", len(batch)
+                    )
+                    continue
+                for listener in self.listeners:
+                    listener(batch)
+                continue
+            timeout = self._heap[0][0] - self.clock() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
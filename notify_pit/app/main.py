@@ -1,47 +1,154 @@
+import asyncio
+import itertools
 import json
+import mimetypes
 import os
-from typing import Optional
-
-from alembic.config import Config
-from fastapi import Depends, FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
-from fastapi.staticfiles import StaticFiles
+from types import SimpleNamespace
+from typing import Literal, Optional
+
+import orjson
+from fastapi import (
+    BackgroundTasks,
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+)
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import (
+    FileResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.templating import Jinja2Templates
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
-from alembic import command
-
-from . import crud, schemas
+from . import (
+    archive,
+    crud,
+    export,
+    metrics,
+    migrations,
+    previews,
+    querylog,
+    recording,
+    retention,
+    schemas,
+    search,
+    stats,
+    tracing,
+    uploads,
+    warmup,
+)
+from .assets import STATIC_DIR, CachedStaticFiles
 from .auth import validate_notify_jwt
-from .database import get_db
+from .callbacks import CallbackDispatcher
+from .compression import CompressionMiddleware
+from .database import DATABASE_URL, SessionLocal, engine, get_db
+from .errors import NotifyError, notify_error_handler
+from .faults import FaultInjectionMiddleware, FaultInjector
+from .lifecycle import StatusSimulator
+from .profiling import Profiler, ProfilingMiddleware
+from .ratelimit import RateLimiter
+from .responses import JSONResponse, ORJSONResponse
 
-app = FastAPI(title="Notify.pit")
+app = FastAPI(title="Notify.pit", default_response_class=JSONResponse)
+app.add_exception_handler(NotifyError, notify_error_handler)
 
 
 @app.on_event("startup")
 def run_migrations():
-    try:
-        # PWD should be /app in docker, where alembic.ini is
-        alembic_cfg = Config("alembic.ini")
-        command.upgrade(alembic_cfg, "head")
-    except Exception as e:
-        print(f"Error running migrations: {e}")
-        # Fallback for local dev if alembic.ini not found or other issues,
-        # though ideally we want this to fail loud.
-        # But if we are running locally in a different dir, it might fail.
-        # Let's try to be robust.
-        pass
+    migrations.run(engine)
+
+
+status_simulator = StatusSimulator.from_env(SessionLocal)
+callback_dispatcher = CallbackDispatcher.from_env(SessionLocal)
+status_simulator.listeners.append(callback_dispatcher.status_changed)
+notification_archive = archive.Archive.from_env()
+retention_purger = retention.RetentionPurger.from_env(
+    SessionLocal, archive=notification_archive, database_url=DATABASE_URL
+)
+query_log = querylog.QueryLog.from_env()
+querylog.install(engine, query_log)
+metrics.watch_pool(engine)
+
+
+def _collect_background_metrics():
+    metrics.STATUS_PENDING.set(value=len(status_simulator))
+    callback_metrics = callback_dispatcher.metrics()
+    metrics.CALLBACK_QUEUE.set(
+        value=callback_metrics["queue_depth"] + callback_metrics["retry_depth"]
+    )
+    for result in ("sent", "failed", "dropped_queue_full", "dropped_retries_exhausted"):
+        metrics.CALLBACK_DELIVERIES.set(result, value=callback_metrics[result])
+
+
+metrics.registry.add_collector(_collect_background_metrics)
+
+
+_metrics_flush = None
+_warm_up = None
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    callback_dispatcher.start()
+    status_simulator.start()
+    retention_purger.start()
+    if metrics.registry.directory:
+        global _metrics_flush
+        _metrics_flush = asyncio.get_running_loop().create_task(
+            metrics.registry.flush_periodically(metrics.FLUSH_INTERVAL)
+        )
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    global _warm_up
+    _warm_up = asyncio.get_running_loop().create_task(
+        asyncio.to_thread(warmup.run, engine, SessionLocal, templates.env)
+    )
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await status_simulator.stop()
+    await callback_dispatcher.stop()
+    await retention_purger.stop()
+    if recorder is not None:
+        recorder.close()
+    if _metrics_flush is not None:
+        _metrics_flush.cancel()
 
 
 # Setup Templates - pointing to the 'app/templates' directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
-app.mount(
-    "/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static"
-)
-app.mount(
-    "/assets", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static"
-)
+# One static app serves both paths, preferring precompressed variants
+static_files = CachedStaticFiles(directory=STATIC_DIR)
+app.mount("/static", static_files, name="static")
+app.mount("/assets", static_files, name="assets")
+
+fault_injector = FaultInjector.from_env()
+app.add_middleware(FaultInjectionMiddleware, injector=fault_injector)
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+app.add_middleware(querylog.QueryLogMiddleware, querylog=query_log)
+profiler = Profiler.from_env()
+if profiler.enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+tracer = tracing.Tracer.from_env()
+if tracer.enabled:
+    tracing.instrument(crud)
+    app.add_middleware(tracing.TracingMiddleware, tracer=tracer)
+recorder = recording.Recorder.from_env()
+if recorder is not None:
+    # Outside fault injection, so replays reproduce the traffic, not the faults
+    app.add_middleware(recording.RecordingMiddleware, recorder=recorder)
+# Outermost, so injected latency and compression count towards request time
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 def _render_notify_template(content: str, values: dict) -> str:
@@ -55,34 +162,17 @@ def _render_notify_template(content: str, values: dict) -> str:
     return content
 
 
+preview_renderer = previews.PreviewRenderer.from_env(
+    _render_notify_template, templates.env
+)
+
+
 @app.get("/", include_in_schema=False)
 async def root(request: Request, db: Session = Depends(get_db)):
-    # Fetch data for dashboard from DB
-    # Note: For dashboard we might want all notifications, but for now we haven't implemented get_all_notifications
-    # Let's assume dashboard just shows templates for now or we implement get_all if needed.
-    # The original tracked all notifications. Let's add that to CRUD if needed, but for now received texts are most important for the loopback.
-    # Actually, the original dashboard showed everything. Let's retrieve a few recent ones or all if small.
-    # For now, to keep it simple and match original potentially large structure, we might want to paginate, but original was list.
-    # Let's just fetch all templates. For notifications, the current CRUD only has get_received_texts.
-    # We might need to add get_all_notifications to crud if the dashboard relies primarily on it.
-    # Checking original main.py: "notifications": notifications_db
-
-    # I will add a simple query here or use a crud function.
-    from . import models
-
-    notifications = db.query(models.Notification).all()
-    templates_list = crud.get_templates(db)
-
-    # Convert SQLAlchemy models to dicts/json-able format for the template
-    # Pydantic models (from_attributes=True) or manual conversion.
-    # Simple workaround for now:
-    notifications_data = [
-        {c.name: getattr(n, c.name) for c in n.__table__.columns} for n in notifications
-    ]
-    templates_data = [
-        {c.name: getattr(t, c.name) for c in t.__table__.columns}
-        for t in templates_list
-    ]
+    # Plain column rows (no ORM hydration) keep the dashboard cheap to render
+    # even when the notifications table is large.
+    notifications_data = crud.get_notification_rows(db)
+    templates_data = crud.get_template_rows(db)
 
     return templates.TemplateResponse(
         request=request,
@@ -91,8 +181,8 @@ async def root(request: Request, db: Session = Depends(get_db)):
             "notifications": notifications_data,
             "templates": templates_data,
             # Pass the raw data as a JSON string for the frontend to use
-            "notifications_json": json.dumps(notifications_data, default=str),
-            "templates_json": json.dumps(templates_data, default=str),
+            "notifications_json": orjson.dumps(notifications_data).decode(),
+            "templates_json": orjson.dumps(templates_data).decode(),
         },
     )
 
@@ -102,41 +192,247 @@ async def healthcheck():
     return {"message": "Notify.pit is running"}
 
 
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Ready once the schema is at the latest migration and warm-up has run."""
+    ready = migrations.ready() and warmup.finished()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not ready",
+            "migrations": migrations.state,
+            "warmup": warmup.state,
+        },
+    )
+
+
 # --- NOTIFICATIONS ENDPOINTS ---
 
+rate_limiter = RateLimiter.from_env()
 
-@app.post("/v2/notifications/sms", status_code=201)
+
+async def rate_limit(token: dict = Depends(validate_notify_jwt)):
+    """Apply Notify's per-key rate and daily send limits."""
+    await rate_limiter(token.get("iss"))
+
+
+def _send(
+    db: Session,
+    payload,
+    token: dict,
+    type: str,
+    background_tasks: BackgroundTasks = None,
+    **recipient,
+):
+    try:
+        notification = crud.create_notification(
+            db=db,
+            notification=payload,
+            type=type,
+            service_id=token.get("iss"),
+            **recipient,
+        )
+    except crud.DuplicateSend as duplicate:
+        # A retried send: answer as the original did, without a second message
+        return {"id": duplicate.notification_id, "reference": payload.reference}
+    except uploads.UploadError as e:
+        raise NotifyError(400, "ValidationError", f"File attachment: {e}")
+    status_simulator.schedule(notification)
+    if background_tasks is not None:
+        _queue_preview(db, notification, background_tasks)
+    return {"id": notification.id, "reference": notification.reference}
+
+
+def _queue_preview(db: Session, notification, background_tasks: BackgroundTasks):
+    # Rendered after the response is sent, so the first view is a cache hit
+    if not preview_renderer.prerender_sends or not notification.template_id:
+        return
+    template = crud.get_template_row(db, notification.template_id)
+    if template is not None:
+        background_tasks.add_task(
+            preview_renderer.prerender,
+            notification.id,
+            notification.type,
+            template,
+            notification.personalisation,
+            notification.email_address,
+        )
+
+
+@app.post("/v2/notifications/sms", status_code=201, dependencies=[Depends(rate_limit)])
 async def send_sms(
     payload: schemas.SmsRequest,
     token: dict = Depends(validate_notify_jwt),
     db: Session = Depends(get_db),
 ):
-    notification = crud.create_notification(
-        db=db, notification=payload, type="sms", phone_number=payload.phone_number
-    )
-    return {"id": notification.id, "reference": notification.reference}
+    return _send(db, payload, token, "sms", phone_number=payload.phone_number)
+
+
+def _request_body(*models) -> dict:
+    # For routes that parse their body by hand, so /docs still shows it
+    bodies = [model.model_json_schema() for model in models]
+    schema = bodies[0] if len(bodies) == 1 else {"anyOf": bodies}
+    return {
+        "requestBody": {
+            "content": {"application/json": {"schema": schema}},
+            "required": True,
+        }
+    }
 
 
-@app.post("/v2/notifications/email", status_code=201)
+@app.post(
+    "/v2/notifications/email",
+    status_code=201,
+    dependencies=[Depends(rate_limit)],
+    openapi_extra=_request_body(schemas.EmailRequest),
+)
 async def send_email(
-    payload: schemas.EmailRequest,
+    request: Request,
+    background_tasks: BackgroundTasks,
     token: dict = Depends(validate_notify_jwt),
     db: Session = Depends(get_db),
 ):
-    notification = crud.create_notification(
-        db=db, notification=payload, type="email", email_address=payload.email_address
+    """Send an email, streaming any file attachments to the blob store.
+
+    Attachments made with prepare_upload() are decoded as the body arrives,
+    so a large file is never held in memory, and the stored notification
+    refers to the file by its hash instead of carrying its base64.
+    """
+    parser = uploads.StreamingJSONParser(_attachment_sink)
+    body = await _read_body(request, parser, "File attachment", db)
+    try:
+        payload = _validate(schemas.EmailRequest, body)
+    except RequestValidationError:
+        crud.discard_unreferenced_files(db, _streamed_files(parser))
+        raise
+    return _send(
+        db,
+        payload,
+        token,
+        "email",
+        background_tasks,
+        email_address=payload.email_address,
     )
-    return {"id": notification.id, "reference": notification.reference}
 
 
-@app.post("/v2/notifications/letter", status_code=201)
+def _attachment_sink(path: tuple):
+    # personalisation.<key>.file, the attachments crud._is_attachment finds
+    if len(path) == 3 and path[0] == "personalisation" and path[2] == "file":
+        return uploads.Base64BlobSink(crud.blobs)
+    return None
+
+
+def _streamed_files(parser: uploads.StreamingJSONParser) -> set:
+    return {upload["sha256"] for upload in parser.streamed}
+
+
+async def _read_body(
+    request: Request, parser: uploads.StreamingJSONParser, what, db: Session
+):
+    # Files streamed before the body turned out to be bad are discarded,
+    # as they are when it fails validation
+    try:
+        async for chunk in request.stream():
+            parser.feed(chunk)
+        return parser.finish()
+    except uploads.UploadError as e:
+        crud.discard_unreferenced_files(db, _streamed_files(parser))
+        raise NotifyError(400, "ValidationError", f"{what}: {e}")
+    except ValueError as e:
+        crud.discard_unreferenced_files(db, _streamed_files(parser))
+        raise RequestValidationError(
+            [{"type": "json_invalid", "loc": ("body",), "msg": str(e), "input": {}}]
+        )
+
+
+@app.post(
+    "/v2/notifications/letter",
+    status_code=201,
+    dependencies=[Depends(rate_limit)],
+    openapi_extra=_request_body(schemas.LetterRequest, schemas.PrecompiledLetterUpload),
+)
 async def send_letter(
-    payload: schemas.LetterRequest,
+    request: Request,
+    background_tasks: BackgroundTasks,
     token: dict = Depends(validate_notify_jwt),
     db: Session = Depends(get_db),
 ):
-    notification = crud.create_notification(db=db, notification=payload, type="letter")
-    return {"id": notification.id, "reference": notification.reference}
+    """Send a templated letter, or a precompiled one given as a base64 PDF.
+
+    The body is parsed as it arrives, so a precompiled letter's PDF is
+    decoded straight into the blob store and never held in memory.
+    """
+    parser = uploads.StreamingJSONParser(_precompiled_letter_sink)
+    body = await _read_body(request, parser, "Letter content", db)
+
+    if not isinstance(body, dict) or "content" not in body:
+        payload = _validate(schemas.LetterRequest, body)
+        return _send(db, payload, token, "letter", background_tasks)
+
+    upload = body.pop("content")
+    if not isinstance(upload, dict):
+        raise NotifyError(400, "ValidationError", "content is not a base64 string")
+    try:
+        payload = _validate(
+            schemas.PrecompiledLetterRequest,
+            {**body, "file_sha256": upload["sha256"], "file_size": upload["size"]},
+        )
+    except RequestValidationError:
+        crud.discard_unreferenced_files(db, _streamed_files(parser))
+        raise
+    response = _send(db, payload, token, "letter")
+    response["postage"] = payload.postage
+    return response
+
+
+def _precompiled_letter_sink(path: tuple):
+    if path == ("content",):
+        return uploads.Base64BlobSink(crud.blobs, check=_check_pdf)
+    return None
+
+
+def _check_pdf(head: bytes):
+    if not head.startswith(b"%PDF-"):
+        raise uploads.UploadError("not a valid PDF")
+
+
+def _validate(model, body):
+    # Bodies parsed by hand fail validation the way FastAPI's own do
+    try:
+        return model.model_validate(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+
+
+@app.get("/v2/notifications/{notification_id}/pdf", dependencies=[Depends(rate_limit)])
+async def get_letter_pdf(
+    notification_id: str,
+    token: dict = Depends(validate_notify_jwt),
+    db: Session = Depends(get_db),
+):
+    """A letter's PDF.
+
+    Precompiled letters are sent straight from the blob store; templated ones
+    are rendered from their template (see previews.py).
+    """
+    notification = crud.get_notification(db, notification_id)
+    if notification is None:
+        raise NotifyError(404, "NoResultFound", "No result found")
+    if notification.type != "letter":
+        raise NotifyError(400, "BadRequestError", "Notification is not a letter")
+    if notification.file_sha256 and crud.blobs.exists(notification.file_sha256):
+        return FileResponse(
+            crud.blobs.path(notification.file_sha256), media_type="application/pdf"
+        )
+    pdf = None
+    if not notification.file_sha256:
+        # Rendering is CPU-bound, so it runs off the event loop
+        pdf = await asyncio.to_thread(preview_renderer.preview, db, notification)
+    if pdf is None:
+        raise NotifyError(
+            400, "PDFNotReadyError", "PDF not available yet, try again later"
+        )
+    return Response(pdf, media_type="application/pdf")
 
 
 @app.get("/v2/received-text-messages")
@@ -200,7 +496,7 @@ async def get_template_by_id(
     db: Session = Depends(get_db),
 ):
     """Get a specific template."""
-    t = crud.get_template(db, template_id)
+    t = crud.get_template_row(db, template_id)
     if not t:
         raise HTTPException(status_code=404, detail="Template not found")
     return t
@@ -227,7 +523,7 @@ async def preview_template(
     db: Session = Depends(get_db),
 ):
     """Preview a template with personalisation."""
-    template = crud.get_template(db, template_id)
+    template = crud.get_template_row(db, template_id)
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
 
@@ -238,16 +534,18 @@ async def preview_template(
 
     personalisation = body.get("personalisation", {})
 
-    rendered_body = _render_notify_template(template.body, personalisation)
+    rendered_body = _render_notify_template(template["body"], personalisation)
     response = {
-        "id": template.id,
-        "type": template.type,
-        "version": template.version,
+        "id": template["id"],
+        "type": template["type"],
+        "version": template["version"],
         "body": rendered_body,
     }
 
-    if template.type == "email" and template.subject:
-        response["subject"] = _render_notify_template(template.subject, personalisation)
+    if template["type"] == "email" and template["subject"]:
+        response["subject"] = _render_notify_template(
+            template["subject"], personalisation
+        )
 
     return response
 
@@ -255,11 +553,156 @@ async def preview_template(
 # --- PIT MANAGEMENT ENDPOINTS ---
 
 
-@app.get("/pit/notifications")
-async def get_pit_notifications(db: Session = Depends(get_db)):
-    from . import models
+def notification_filters(
+    request: Request, filters: schemas.NotificationFilters = Depends()
+) -> dict:
+    """The query's filters, plus any personalisation.<key>=<value> pairs."""
+    filters = filters.model_dump()
+    filters["personalisation"] = {
+        name.removeprefix("personalisation."): value
+        for name, value in request.query_params.items()
+        if name.startswith("personalisation.") and name != "personalisation."
+    }
+    return filters
+
+
+async def _reaches_archive(filters: dict) -> bool:
+    # Archive reads are file I/O, so they run in a thread
+    return notification_archive is not None and await asyncio.to_thread(
+        notification_archive.reaches, filters["created_after"]
+    )
+
+
+@app.get("/pit/notifications", response_class=ORJSONResponse)
+async def get_pit_notifications(
+    filters: dict = Depends(notification_filters), db: Session = Depends(get_db)
+):
+    rows = crud.get_notification_rows(db, **filters)
+    if await _reaches_archive(filters):
+        archived = await asyncio.to_thread(
+            lambda: list(notification_archive.iter_rows(**filters))
+        )
+        rows = archived + rows
+    return ORJSONResponse(rows)
+
+
+@app.get("/pit/notifications/search", response_class=ORJSONResponse)
+async def search_pit_notifications(
+    q: str = Query(min_length=1),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+):
+    """Notifications matching every word of q, best match first."""
+    # One extra row says whether there is a next page without counting them all
+    rows = search.search(db, q, limit=page_size + 1, offset=(page - 1) * page_size)
+    return ORJSONResponse(
+        {
+            "results": rows[:page_size],
+            "page": page,
+            "page_size": page_size,
+            "has_more": len(rows) > page_size,
+        }
+    )
+
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+@app.get("/pit/notifications/export")
+async def export_pit_notifications(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = False,
+    filters: dict = Depends(notification_filters),
+    db: Session = Depends(get_db),
+):
+    """Stream every matching notification as NDJSON or CSV in constant memory."""
+    rows = crud.iter_notification_rows(db, **filters)
+    # StreamingResponse iterates sync generators in a thread, archive included
+    if await _reaches_archive(filters):
+        rows = itertools.chain(notification_archive.iter_rows(**filters), rows)
+    chunks = (
+        export.ndjson_chunks(rows) if format == "ndjson" else export.csv_chunks(rows)
+    )
+    filename = f"notifications.{format}"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    if gzip:
+        chunks = export.gzip_chunks(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+async def _archived(notification_id: str) -> Optional[dict]:
+    if notification_archive is None:
+        return None
+    return await asyncio.to_thread(notification_archive.get, notification_id)
+
+
+@app.get("/pit/notifications/{notification_id}", response_class=ORJSONResponse)
+async def get_pit_notification(notification_id: str, db: Session = Depends(get_db)):
+    """One notification, from the table or, once purged, the archive."""
+    rows = crud.get_notification_rows_by_id(db, [notification_id])
+    row = rows[0] if rows else await _archived(notification_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return ORJSONResponse(row)
+
+
+@app.get("/pit/notifications/{notification_id}/attachments/{key}")
+async def get_pit_attachment(
+    notification_id: str, key: str, db: Session = Depends(get_db)
+):
+    """Download a file attached to an email, sent straight from the blob store."""
+    notification = crud.get_notification(db, notification_id)
+    attachment = (notification.personalisation or {}).get(key) if notification else None
+    if not isinstance(attachment, dict) or not isinstance(attachment.get("file"), dict):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    sha256 = attachment["file"].get("sha256")
+    if not sha256 or not crud.blobs.exists(sha256):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    filename = attachment.get("filename")
+    media_type = filename and mimetypes.guess_type(filename)[0]
+    return FileResponse(
+        crud.blobs.path(sha256),
+        media_type=media_type or "application/octet-stream",
+        filename=filename,
+    )
+
 
-    return db.query(models.Notification).all()
+@app.get("/pit/notifications/{notification_id}/preview")
+async def get_pit_preview(notification_id: str, db: Session = Depends(get_db)):
+    """A letter as a PDF or an email as HTML, rendered from its template."""
+    notification = crud.get_notification(db, notification_id)
+    if notification is None:
+        archived = await _archived(notification_id)
+        if archived is None:
+            raise HTTPException(status_code=404, detail="Notification not found")
+        notification = SimpleNamespace(**archived)
+    if notification.type not in previews.MEDIA_TYPES:
+        raise HTTPException(
+            status_code=400, detail=f"No preview for {notification.type} notifications"
+        )
+    body = await asyncio.to_thread(preview_renderer.preview, db, notification)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return Response(body, media_type=previews.MEDIA_TYPES[notification.type])
+
+
+@app.post("/pit/received-text-messages", status_code=201)
+async def create_pit_received_text(
+    payload: schemas.ReceivedTextRequest, db: Session = Depends(get_db)
+):
+    """Internal endpoint to inject a received text, as if a user had replied."""
+    notification = crud.create_received_text(
+        db, payload.phone_number, payload.content, service_id=payload.service_id
+    )
+    callback_dispatcher.inbound_received(notification.id)
+    return {"id": notification.id}
 
 
 @app.get("/pit/templates")
@@ -302,4 +745,126 @@ async def delete_pit_template(template_id: str, db: Session = Depends(get_db)):
 @app.delete("/pit/reset")
 async def reset_pit(db: Session = Depends(get_db)):
     crud.reset_db(db)
+    status_simulator.clear()
+    preview_renderer.clear()
+    profiler.clear()
+    query_log.clear()
+    await rate_limiter.clear()
+    if notification_archive is not None:
+        await asyncio.to_thread(notification_archive.clear)
     return {"status": "reset"}
+
+
+@app.get("/pit/callbacks")
+async def get_pit_callbacks(db: Session = Depends(get_db)):
+    """Internal endpoint to list configured service callbacks."""
+    return crud.get_service_callbacks(db)
+
+
+@app.post("/pit/callback")
+async def set_pit_callback(
+    payload: schemas.ServiceCallbackRequest, db: Session = Depends(get_db)
+):
+    """Internal endpoint to set a service's delivery status or inbound SMS callback."""
+    return crud.set_service_callback(db, payload)
+
+
+@app.delete("/pit/callback/{service_id}/{callback_type}")
+async def delete_pit_callback(
+    service_id: str, callback_type: str, db: Session = Depends(get_db)
+):
+    """Internal endpoint to remove a service callback."""
+    if not crud.delete_service_callback(db, service_id, callback_type):
+        raise HTTPException(status_code=404, detail="Callback not found")
+    return {"status": "deleted"}
+
+
+@app.get("/pit/callbacks/metrics")
+async def get_pit_callback_metrics():
+    """Queue depth, latency and failure counts for callback delivery."""
+    return callback_dispatcher.metrics()
+
+
+@app.get("/pit/metrics", include_in_schema=False)
+async def get_pit_metrics(db: Session = Depends(get_db)):
+    """Request, database, queue and notification metrics for Prometheus."""
+    metrics.NOTIFICATIONS.values = {
+        (type, status): count
+        for type, status, count in stats.counts_by_type_and_status(db)
+    }
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/pit/stats")
+async def get_pit_stats(db: Session = Depends(get_db)):
+    """Notification counts by type, status, template and hour of creation."""
+    return stats.summary(db)
+
+
+@app.get("/pit/debug/profiles")
+async def list_pit_profiles():
+    """Recently captured request profiles, newest first."""
+    return profiler.list()
+
+
+def _get_profile(profile_id: str, mode: str = None) -> dict:
+    profile = profiler.get(profile_id)
+    if profile is None or (mode and profile["mode"] != mode):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@app.get("/pit/debug/profiles/{profile_id}")
+async def get_pit_profile(profile_id: str):
+    """A profile's cProfile summary, or its collapsed stacks for sampled profiles."""
+    profile = _get_profile(profile_id)
+    return {k: v for k, v in profile.items() if k != "pstats"}
+
+
+@app.get("/pit/debug/profiles/{profile_id}/pstats")
+async def download_pit_profile_pstats(profile_id: str):
+    """The raw cProfile stats, for pstats, snakeviz or gprof2dot."""
+    return Response(
+        _get_profile(profile_id, "cprofile")["pstats"],
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'},
+    )
+
+
+@app.get("/pit/debug/profiles/{profile_id}/collapsed")
+async def download_pit_profile_collapsed(profile_id: str):
+    """Sampled stacks in the collapsed format read by flamegraph.pl and speedscope."""
+    return PlainTextResponse(_get_profile(profile_id, "sample")["collapsed"])
+
+
+@app.get("/pit/debug/queries")
+async def get_pit_queries(limit: int = 20):
+    """Where database time goes, and requests flagged for issuing too many statements."""
+    return query_log.report(limit)
+
+
+@app.delete("/pit/debug/queries")
+async def clear_pit_queries():
+    """Forget recorded statements, e.g. before measuring one scenario."""
+    query_log.clear()
+    return {"status": "cleared"}
+
+
+@app.get("/pit/config")
+async def get_pit_config():
+    """Current fault injection profile and every profile that can be selected."""
+    return {
+        "fault_profile": fault_injector.active,
+        "profiles": fault_injector.profiles,
+    }
+
+
+@app.put("/pit/config")
+async def update_pit_config(payload: schemas.PitConfigRequest):
+    """Add or replace fault profiles and/or switch the active one."""
+    fault_injector.profiles.update(payload.profiles)
+    if payload.fault_profile is not None:
+        if payload.fault_profile not in fault_injector.profiles:
+            raise HTTPException(status_code=400, detail="Unknown fault profile")
+        fault_injector.active = payload.fault_profile
+    return await get_pit_config()
@@ -0,0 +1,359 @@
+# In-process metrics in the Prometheus text format.
+#
+# Counters, gauges and histograms are plain dicts keyed by label values, so
+# recording a sample is a dict lookup and an addition. With several worker
+# processes, set PIT_METRICS_DIR to a directory shared by the workers: each
+# one periodically writes a snapshot of its metrics there and /pit/metrics
+# adds up the snapshots of every worker. Gauges only count live workers.
+import asyncio
+import bisect
+import json
+import os
+import time
+
+from .config import env_float
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def snapshot(self):
+        return [[list(k), v] for k, v in self.values.items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down.
+
+    With several workers, "livesum" gauges add up the values of live workers
+    and "local" gauges (ones every worker computes identically, such as row
+    counts) only report the scraped worker's value.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), multiprocess_mode="livesum"):
+        super().__init__(name, help, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, *labels, value: float):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value: float):
+        state = self.values.get(labels)
+        if state is None:
+            # per-bucket counts (last one is +Inf), sum
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def snapshot(self):
+        return [[list(k), [list(v[0]), v[1]]] for k, v in self.values.items()]
+
+
+class Registry:
+    def __init__(self, directory: str = None):
+        self.metrics = {}
+        self.collectors = []
+        self.directory = directory
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), multiprocess_mode="livesum"):
+        return self.register(Gauge(name, help, labelnames, multiprocess_mode))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """Register a callable that refreshes derived gauges before a snapshot."""
+        self.collectors.append(collector)
+
+    # --- Multiprocess snapshots ---
+
+    def snapshot(self) -> dict:
+        for collector in self.collectors:
+            collector()
+        return {
+            name: {
+                "type": m.type,
+                "help": m.help,
+                "labelnames": list(m.labelnames),
+                "buckets": list(getattr(m, "buckets", ())),
+                "mode": getattr(m, "multiprocess_mode", None),
+                "values": m.snapshot(),
+            }
+            for name, m in self.metrics.items()
+        }
+
+    def _write(self, snapshot: dict):
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+
+    def _snapshots(self):
+        own = self.snapshot()
+        if not self.directory:
+            return [(True, True, own)]
+        self._write(own)
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            pid = int(name[:-5])
+            if pid == os.getpid():
+                snapshots.append((True, True, own))
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append((_alive(pid), False, json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    async def flush_periodically(self, interval: float):
+        # Collectors read state owned by the event loop, so snapshot here and
+        # only hand the file write to a thread
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self._write, self.snapshot())
+
+    # --- Exposition ---
+
+    def render(self) -> str:
+        merged = {}
+        for alive, own, snapshot in self._snapshots():
+            for name, family in snapshot.items():
+                if family["type"] == "gauge" and not (
+                    own or (alive and family["mode"] == "livesum")
+                ):
+                    continue
+                target = merged.setdefault(name, {**family, "values": {}})
+                for labels, value in family["values"]:
+                    key = tuple(labels)
+                    if family["type"] == "histogram":
+                        current = target["values"].get(key)
+                        if current is None:
+                            target["values"][key] = [list(value[0]), value[1]]
+                        else:
+                            current[0] = [a + b for a, b in zip(current[0], value[0])]
+                            current[1] += value[1]
+                    else:
+                        target["values"][key] = target["values"].get(key, 0) + value
+
+        lines = []
+        for name, family in merged.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            labelnames = family["labelnames"]
+            for key, value in family["values"].items():
+                if family["type"] == "histogram":
+                    lines.extend(
+                        _histogram_lines(
+                            name, labelnames, key, family["buckets"], value
+                        )
+                    )
+                else:
+                    lines.append(f"{name}{_labels(labelnames, key)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(name, labelnames, key, buckets, value):
+    counts, total = value
+    cumulative = 0
+    for bound, count in zip(list(buckets) + ["+Inf"], counts):
+        cumulative += count
+        le = bound if bound == "+Inf" else _number(bound)
+        labels = _labels(labelnames + ["le"], key + (le,))
+        yield f"{name}_bucket{labels} {cumulative}"
+    yield f"{name}_sum{_labels(labelnames, key)} {_number(total)}"
+    yield f"{name}_count{_labels(labelnames, key)} {cumulative}"
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry(os.environ.get("PIT_METRICS_DIR"))
+FLUSH_INTERVAL = env_float("PIT_METRICS_FLUSH_INTERVAL", 5.0)
+
+REQUESTS = registry.counter(
+    "notify_pit_requests_total",
+    "HTTP requests handled.",
+    ["method", "route", "status"],
+)
+REQUEST_DURATION = registry.histogram(
+    "notify_pit_request_duration_seconds",
+    "Time spent handling HTTP requests.",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = registry.gauge(
+    "notify_pit_requests_in_progress", "HTTP requests currently being handled."
+)
+DB_QUERY_DURATION = registry.histogram(
+    "notify_pit_db_query_duration_seconds", "Time spent executing SQL statements."
+)
+DB_CONNECTIONS = registry.gauge(
+    "notify_pit_db_connections_checked_out",
+    "Database connections currently checked out of the pool.",
+)
+NOTIFICATIONS = registry.gauge(
+    "notify_pit_notifications",
+    "Stored notifications by type and status.",
+    ["type", "status"],
+    multiprocess_mode="local",
+)
+STATUS_PENDING = registry.gauge(
+    "notify_pit_status_transitions_pending",
+    "Simulated delivery status transitions waiting to be applied.",
+)
+CALLBACK_QUEUE = registry.gauge(
+    "notify_pit_callback_queue_depth",
+    "Callbacks waiting to be sent or retried.",
+)
+CALLBACK_DELIVERIES = registry.gauge(
+    "notify_pit_callback_deliveries",
+    "Callbacks since this worker started: sent, failed, dropped_queue_full"
+    " (the queue was full) or dropped_retries_exhausted (gave up retrying).",
+    ["result"],
+)
+RETENTION_PURGED = registry.counter(
+    "notify_pit_retention_purged_total",
+    "Notifications deleted by retention, by type and reason (max_age or max_rows).",
+    ["type", "reason"],
+)
+CACHE_REQUESTS = registry.counter(
+    "notify_pit_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss).",
+    ["cache", "result"],
+)
+
+
+def watch_pool(engine):
+    """Report engine's checked out connections. Statement timing is in querylog."""
+
+    def _connections():
+        checkedout = getattr(engine.pool, "checkedout", None)
+        if checkedout is not None:
+            DB_CONNECTIONS.set(value=checkedout())
+
+    registry.add_collector(_connections)
+
+
+class MetricsMiddleware:
+    """Count and time every HTTP request by method, route template and status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        root_path = scope.get("root_path", "")
+        REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.dec()
+            labels = (scope["method"], route_label(scope, root_path), str(status))
+            REQUESTS.inc(*labels)
+            REQUEST_DURATION.observe(*labels, value=elapsed)
+
+
+def route_label(scope, root_path: str) -> str:
+    # The router records the matched route (or, for mounts, extends root_path)
+    # on the scope, so the label is the path template rather than the path.
+    # Unmatched paths share one label so 404 scans can't blow up cardinality.
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    mounted = scope.get("root_path", "")
+    if mounted != root_path:
+        return mounted[len(root_path) :] + "/{path:path}"
+    return "unmatched"
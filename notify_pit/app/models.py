@@ -1,6 +1,16 @@
 import uuid
 
-from sqlalchemy import JSON, Column, DateTime, Integer, String
+from sqlalchemy import (
+    DDL,
+    JSON,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+    event,
+)
 from sqlalchemy.sql import func
 
 from .database import Base
@@ -29,6 +39,144 @@ class Notification(Base):
     service_id = Column(String, nullable=True)
     notify_number = Column(String, nullable=True)
     user_number = Column(String, nullable=True)
+    # For precompiled letters: the PDF in the blob store, and its postage
+    file_sha256 = Column(String, nullable=True)
+    file_size = Column(Integer, nullable=True)
+    postage = Column(String, nullable=True)
+
+    # Retention finds the oldest rows of each type through this index
+    __table_args__ = (Index("ix_notifications_type_created_at", "type", "created_at"),)
+
+
+class PersonalisationValue(Base):
+    """A promoted personalisation value, copied out of the JSON for indexing.
+
+    Only the keys listed in PIT_PROMOTED_KEYS are copied (see crud.py), so
+    filters on them are an index lookup rather than a scan of every
+    notification's personalisation.
+    """
+
+    __tablename__ = "personalisation_values"
+    __table_args__ = (Index("ix_personalisation_values_key_value", "key", "value"),)
+
+    notification_id = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
+
+
+class NotificationFile(Base):
+    """A stored file that a notification refers to.
+
+    Precompiled letter PDFs and email attachments both live in the blob store
+    (see blobstore.py), and identical uploads share one file. These rows say
+    which notifications still use each file, so it is removed with its last.
+    """
+
+    __tablename__ = "notification_files"
+    __table_args__ = (Index("ix_notification_files_sha256", "sha256"),)
+
+    notification_id = Column(String, primary_key=True)
+    sha256 = Column(String, primary_key=True)
+
+
+class IdempotencyKey(Base):
+    """The notification first sent with a reference, for idempotent sends.
+
+    The primary key is what rejects a repeated (service_id, reference); see
+    PIT_IDEMPOTENCY_WINDOW in crud.py.
+    """
+
+    __tablename__ = "idempotency_keys"
+
+    # "" when the token has no issuer
+    service_id = Column(String, primary_key=True)
+    reference = Column(String, primary_key=True)
+    notification_id = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+
+# Full-text search over notifications (see search.py). On SQLite an FTS5
+# table shares rowids with notifications and is kept in step by triggers; on
+# PostgreSQL a GIN index covers the same tsvector expression search.py uses.
+SEARCH_DDL = {
+    "sqlite": [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS notifications_fts USING fts5(
+            content, reference, phone_number, email_address, personalisation
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS notifications_fts_insert
+        AFTER INSERT ON notifications BEGIN
+            INSERT INTO notifications_fts (
+                rowid, content, reference, phone_number, email_address,
+                personalisation
+            ) VALUES (
+                NEW.rowid, NEW.content, NEW.reference, NEW.phone_number,
+                NEW.email_address,
+                (SELECT group_concat(atom, ' ') FROM json_tree(NEW.personalisation)
+                 WHERE atom IS NOT NULL)
+            );
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS notifications_fts_update
+        AFTER UPDATE OF content, reference, phone_number, email_address,
+            personalisation ON notifications BEGIN
+            DELETE FROM notifications_fts WHERE rowid = OLD.rowid;
+            INSERT INTO notifications_fts (
+                rowid, content, reference, phone_number, email_address,
+                personalisation
+            ) VALUES (
+                NEW.rowid, NEW.content, NEW.reference, NEW.phone_number,
+                NEW.email_address,
+                (SELECT group_concat(atom, ' ') FROM json_tree(NEW.personalisation)
+                 WHERE atom IS NOT NULL)
+            );
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS notifications_fts_delete
+        AFTER DELETE ON notifications BEGIN
+            DELETE FROM notifications_fts WHERE rowid = OLD.rowid;
+        END""",
+    ],
+    "postgresql": [
+        """CREATE INDEX IF NOT EXISTS ix_notifications_search ON notifications
+        USING gin ((
+            to_tsvector('simple', coalesce(content, '') || ' ' ||
+                coalesce(reference, '') || ' ' || coalesce(phone_number, '') ||
+                ' ' || coalesce(email_address, ''))
+            || jsonb_to_tsvector('simple', coalesce(personalisation::jsonb,
+                '{}'), '["string", "numeric"]')
+        ))""",
+    ],
+}
+
+for dialect, statements in SEARCH_DDL.items():
+    for statement in statements:
+        event.listen(
+            Notification.__table__,
+            "after_create",
+            DDL(statement).execute_if(dialect=dialect),
+        )
+# Triggers go with the table; the FTS5 table has to be dropped separately
+event.listen(
+    Notification.__table__,
+    "after_drop",
+    DDL("DROP TABLE IF EXISTS notifications_fts").execute_if(dialect="sqlite"),
+)
+
+
+class NotificationStat(Base):
+    """Running count of notifications per type, status, template and hour.
+
+    Kept up to date in the same transaction as every insert, status change
+    and delete, so /pit/stats never has to scan the notifications table.
+    """
+
+    __tablename__ = "notification_stats"
+
+    type = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    # "" for notifications without a template, such as received texts
+    template_id = Column(String, primary_key=True)
+    # Start of the hour the notification was created, "2026-01-10T13:00:00Z"
+    hour = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
 
 
 class Template(Base):
@@ -43,3 +191,17 @@ class Template(Base):
     subject = Column(String, nullable=True)
     version = Column(Integer, default=1)
     created_by = Column(String, default="notify-pit@example.com")
+
+
+class ServiceCallback(Base):
+    __tablename__ = "service_callbacks"
+    __table_args__ = (UniqueConstraint("service_id", "callback_type"),)
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    service_id = Column(String, nullable=False, index=True)
+    # "delivery_status" or "inbound_sms", as in Notify's service settings
+    callback_type = Column(String, nullable=False)
+    url = Column(String, nullable=False)
+    bearer_token = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
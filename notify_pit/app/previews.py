@@ -0,0 +1,196 @@
+# Rendered previews of sent notifications: a PDF for templated letters and
+# an HTML page for emails, built from the template and the notification's
+# personalisation.
+#
+# Rendering costs far more than serving bytes, so previews are kept in a
+# byte-bounded LRU keyed by (notification id, template version). Editing a
+# template bumps its version, so later views render the new wording. This
+# differs from Notify on purpose: Notify renders a notification from the
+# template version it was sent with, but the pit keeps no history of
+# template versions to render an old one from. Sends queue a pre-render as a background task, so the first
+# view is usually a cache hit too. The cache belongs to one worker, though:
+# with several, a view served by another worker than the send renders again.
+# Renders run in a thread, off the event loop.
+import textwrap
+
+from . import crud
+from .cache import LRUCache
+from .config import env_bool, env_int
+
+MEDIA_TYPES = {"letter": "application/pdf", "email": "text/html; charset=utf-8"}
+
+# A4 in points, with 1 inch margins
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 72
+FONT_SIZE = 11
+LEADING = 14
+WRAP_COLUMNS = 80
+
+
+class PreviewRenderer:
+    """Renders and caches previews of letters and emails.
+
+    ``render(content, values)`` fills in a template's ((placeholders)); it is
+    the same function that serves /v2/template/{id}/preview.
+    """
+
+    def __init__(self, render, jinja_env, cache: LRUCache, prerender_sends=True):
+        self.render = render
+        self.jinja_env = jinja_env
+        self.cache = cache
+        self.prerender_sends = prerender_sends
+
+    @classmethod
+    def from_env(cls, render, jinja_env):
+        return cls(
+            render,
+            jinja_env,
+            LRUCache("previews", env_int("PIT_PREVIEW_CACHE_BYTES", 64 * 1024 * 1024)),
+            prerender_sends=env_bool("PIT_PREVIEW_PRERENDER", True),
+        )
+
+    def preview(self, db, notification):
+        """The preview's bytes, or None if it has no template (any longer)."""
+        if not notification.template_id:
+            return None
+        template = crud.get_template_row(db, notification.template_id)
+        if template is None:
+            return None
+        return self.prerender(
+            notification.id,
+            notification.type,
+            template,
+            notification.personalisation,
+            notification.email_address,
+        )
+
+    def prerender(
+        self, notification_id, type, template, personalisation, email_address=None
+    ) -> bytes:
+        """Render a preview into the cache, unless it is there already.
+
+        Takes the template row rather than a session, so it can run as a
+        background task after the request's session has closed.
+        """
+        key = (notification_id, template["version"])
+        body = self.cache.get(key)
+        if body is None:
+            values = _values(notification_id, personalisation)
+            if type == "letter":
+                body = self._letter(template, values)
+            else:
+                body = self._email(template, values, email_address)
+            self.cache.put(key, body)
+        return body
+
+    def _letter(self, template: dict, values: dict) -> bytes:
+        # Notify letters take their address from address_line_1 to 7
+        address = [
+            str(values[f"address_line_{n}"])
+            for n in range(1, 8)
+            if values.get(f"address_line_{n}")
+        ]
+        if values.get("postcode"):
+            address.append(str(values["postcode"]))
+        heading = self.render(template["subject"] or "", values)
+        return letter_pdf(address, heading, self.render(template["body"], values))
+
+    def _email(self, template: dict, values: dict, email_address) -> bytes:
+        body = self.render(template["body"], values)
+        return (
+            self.jinja_env.get_template("email_preview.html")
+            .render(
+                subject=self.render(template["subject"] or "", values),
+                email_address=email_address,
+                paragraphs=[
+                    paragraph.splitlines()
+                    for paragraph in body.replace("\r\n", "\n").split("\n\n")
+                    if paragraph.strip()
+                ],
+            )
+            .encode()
+        )
+
+    def clear(self):
+        self.cache.clear()
+
+
+def _values(notification_id: str, personalisation) -> dict:
+    # An attachment is shown as its download link, as Notify's emails do
+    values = dict(personalisation or {})
+    for key, value in values.items():
+        if isinstance(value, dict) and isinstance(value.get("file"), dict):
+            values[key] = f"/pit/notifications/{notification_id}/attachments/{key}"
+    return values
+
+
+def letter_pdf(address: list, heading: str, body: str) -> bytes:
+    """A plain A4 PDF: the address block, a bold heading, then the body."""
+    lines = [("F1", line) for line in address]
+    if heading:
+        lines += [("F1", ""), ("F2", heading)]
+    lines.append(("F1", ""))
+    for paragraph in body.replace("\r\n", "\n").split("\n"):
+        wrapped = textwrap.wrap(paragraph, WRAP_COLUMNS) or [""]
+        lines += [("F1", line) for line in wrapped]
+
+    per_page = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+    pages = [lines[i : i + per_page] for i in range(0, len(lines), per_page)]
+    streams = []
+    for page in pages:
+        stream = bytearray()
+        y = PAGE_HEIGHT - MARGIN
+        for font, text in page:
+            if text:
+                stream += b"BT /%s %d Tf %d %d Td (%s) Tj ET\n" % (
+                    font.encode(),
+                    FONT_SIZE,
+                    MARGIN,
+                    y,
+                    _pdf_string(text),
+                )
+            y -= LEADING
+        streams.append(bytes(stream))
+    return _pdf_document(streams)
+
+
+def _pdf_string(text: str) -> bytes:
+    data = text.encode("cp1252", errors="replace")
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _pdf_document(streams: list) -> bytes:
+    # Objects: 1 catalog, 2 page tree, 3 and 4 fonts, then a page and its
+    # content stream for each page
+    font = b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>"
+    kids = b" ".join(b"%d 0 R" % (5 + 2 * n) for n in range(len(streams)))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(streams)),
+        font % b"Helvetica",
+        font % b"Helvetica-Bold",
+    ]
+    for n, stream in enumerate(streams):
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d]"
+            b" /Resources << /Font << /F1 3 0 R /F2 4 0 R >> >>"
+            b" /Contents %d 0 R >>" % (PAGE_WIDTH, PAGE_HEIGHT, 6 + 2 * n)
+        )
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(out)
@@ -0,0 +1,197 @@
+# On-demand profiling of single requests.
+#
+# With PIT_PROFILING=true, a request carrying an ``X-Pit-Profile`` header or a
+# ``pit_profile`` query parameter is run under a profiler and the result is
+# kept in memory for /pit/debug/profiles/{id}. The profile id is returned in
+# the X-Pit-Profile-Id response header.
+#
+# Two modes are available:
+#
+#   cprofile  deterministic, via cProfile; downloadable as a pstats file
+#   sample    a thread samples every thread's stack every interval; the
+#             result is in the collapsed-stack format flamegraph.pl and
+#             speedscope read
+#
+# cProfile only sees the event loop thread, and so also whatever other
+# requests run alongside the profiled one; use ``sample`` for sync endpoints,
+# which run in the thread pool. When PIT_PROFILING is off the middleware is
+# not installed at all.
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+
+from .config import env_bool, env_float, env_int
+
+HEADER = "x-pit-profile"
+QUERY_PARAM = "pit_profile"
+
+
+class Sampler:
+    """Counts the collapsed stacks of every other thread every interval."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                self.stacks[_collapse(names.get(ident, str(ident)), frame)] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def _collapse(thread: str, frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.append(thread)
+    return ";".join(reversed(names))
+
+
+class Profiler:
+    def __init__(
+        self, enabled: bool = False, keep: int = 20, sample_interval: float = 0.001
+    ):
+        self.enabled = enabled
+        self.keep = keep
+        self.sample_interval = sample_interval
+        self.profiles = OrderedDict()
+        self.busy = False
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=env_bool("PIT_PROFILING"),
+            keep=env_int("PIT_PROFILING_KEEP", 20),
+            sample_interval=env_float("PIT_PROFILING_INTERVAL", 0.001),
+        )
+
+    def requested_mode(self, scope):
+        """The profiling mode a request asks for, or None."""
+        value = Headers(scope=scope).get(HEADER)
+        if value is None:
+            values = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            if QUERY_PARAM not in values:
+                return None
+            value = values[QUERY_PARAM][0]
+        value = value.strip().lower()
+        if value in ("", "0", "false", "no"):
+            return None
+        return "sample" if value == "sample" else "cprofile"
+
+    def clear(self):
+        self.profiles.clear()
+
+    def begin(self, mode: str):
+        self.busy = True
+        if mode == "sample":
+            session = Sampler(self.sample_interval)
+            session.start()
+        else:
+            session = cProfile.Profile()
+            session.enable()
+        return session
+
+    def finish(self, session, profile_id: str, scope, mode: str, elapsed: float):
+        try:
+            if mode == "sample":
+                session.stop()
+                profile = {"samples": session.samples, "collapsed": session.collapsed()}
+            else:
+                session.disable()
+                summary = io.StringIO()
+                stats = pstats.Stats(session, stream=summary)
+                # Serialised the way Stats.dump_stats writes a .prof file
+                data = marshal.dumps(stats.stats)
+                stats.sort_stats("cumulative").print_stats(40)
+                profile = {"summary": summary.getvalue(), "pstats": data}
+        finally:
+            self.busy = False
+
+        self.profiles[profile_id] = {
+            "id": profile_id,
+            "mode": mode,
+            "method": scope["method"],
+            "path": scope["path"],
+            "duration_ms": round(elapsed * 1000, 3),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            **profile,
+        }
+        while len(self.profiles) > self.keep:
+            self.profiles.popitem(last=False)
+
+    def list(self):
+        return [_describe(p) for p in reversed(self.profiles.values())]
+
+    def get(self, profile_id: str):
+        return self.profiles.get(profile_id)
+
+
+def _describe(profile: dict) -> dict:
+    return {k: v for k, v in profile.items() if k not in ("pstats", "collapsed")}
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = self.profiler.requested_mode(scope)
+        # One profile at a time: a second profiler would see the first's work
+        if mode is None or self.profiler.busy:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-pit-profile-id", profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        session = self.profiler.begin(mode)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.profiler.finish(session, profile_id, scope, mode, elapsed)
@@ -0,0 +1,175 @@
+# SQL statement timing, slow-query logging and N+1 detection.
+#
+# install() hooks the engine's cursor events. Every statement's duration goes
+# into the query duration histogram, a ring buffer of recent statements and
+# per-statement totals keyed by normalised SQL (literals and IN lists folded),
+# so /pit/debug/queries can show which statements dominate database time.
+# Statements slower than PIT_SLOW_QUERY_MS are logged. QueryLogMiddleware
+# counts statements per request and flags requests issuing more than
+# PIT_N_PLUS_ONE_THRESHOLD, which usually means a query in a loop.
+import logging
+import re
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from . import metrics
+from .config import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+# Statements issued by the current request; a mutable Counter so work done in
+# the thread pool (which runs in a copy of the context) is still counted
+_request_statements: ContextVar = ContextVar("request_statements", default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_NAMED = re.compile(r"(?:%\(\w+\)s|:\w+|\$\d+|%s)")
+
+
+def normalise(statement: str) -> str:
+    """SQL with literals and placeholders as ?, IN lists folded, on one line."""
+    statement = _STRING.sub("?", statement)
+    statement = _NAMED.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _IN_LIST.sub("(?...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+class QueryLog:
+    def __init__(
+        self,
+        size: int = 1000,
+        slow_threshold_ms: float = 100.0,
+        n_plus_one_threshold: int = 20,
+    ):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.recent = deque(maxlen=size)
+        self.flagged = deque(maxlen=100)
+        # normalised SQL -> [count, total ms, max ms]
+        self.totals = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            size=env_int("PIT_QUERY_LOG_SIZE", 1000),
+            slow_threshold_ms=env_float("PIT_SLOW_QUERY_MS", 100.0),
+            n_plus_one_threshold=env_int("PIT_N_PLUS_ONE_THRESHOLD", 20),
+        )
+
+    def record(self, statement: str, elapsed: float):
+        metrics.DB_QUERY_DURATION.observe(value=elapsed)
+        ms = elapsed * 1000
+        sql = normalise(statement)
+        self.recent.append((time.time(), ms, sql))
+        totals = self.totals.get(sql)
+        if totals is None:
+            self.totals[sql] = [1, ms, ms]
+        else:
+            totals[0] += 1
+            totals[1] += ms
+            if ms > totals[2]:
+                totals[2] = ms
+
+        statements = _request_statements.get()
+        if statements is not None:
+            statements[sql] += 1
+        if ms >= self.slow_threshold_ms:
+            logger.warning("Slow query (%.1f ms): %s", ms, sql)
+
+    def request_finished(self, method: str, path: str, statements: Counter):
+        count = sum(statements.values())
+        if count <= self.n_plus_one_threshold:
+            return
+        sql, repeats = statements.most_common(1)[0]
+        self.flagged.append(
+            {
+                "at": datetime.now(timezone.utc).isoformat(),
+                "method": method,
+                "path": path,
+                "statements": count,
+                "most_repeated": {"sql": sql, "count": repeats},
+            }
+        )
+        logger.warning(
+            "%s %s issued %d SQL statements (%d x %s)",
+            method,
+            path,
+            count,
+            repeats,
+            sql,
+        )
+
+    def report(self, limit: int = 20) -> dict:
+        def summary(sql, totals):
+            count, total, worst = totals
+            return {
+                "sql": sql,
+                "count": count,
+                "total_ms": round(total, 3),
+                "mean_ms": round(total / count, 3),
+                "max_ms": round(worst, 3),
+            }
+
+        by_total = sorted(self.totals.items(), key=lambda i: i[1][1], reverse=True)
+        by_count = sorted(self.totals.items(), key=lambda i: i[1][0], reverse=True)
+        slowest = sorted(self.recent, key=lambda r: r[1], reverse=True)[:limit]
+        return {
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "n_plus_one_threshold": self.n_plus_one_threshold,
+            "most_time": [summary(*i) for i in by_total[:limit]],
+            "most_frequent": [summary(*i) for i in by_count[:limit]],
+            "slowest_recent": [
+                {
+                    "at": datetime.fromtimestamp(at, timezone.utc).isoformat(),
+                    "ms": round(ms, 3),
+                    "sql": sql,
+                }
+                for at, ms, sql in slowest
+            ],
+            "n_plus_one": list(self.flagged),
+        }
+
+    def clear(self):
+        self.recent.clear()
+        self.flagged.clear()
+        self.totals.clear()
+
+
+def install(engine, querylog: QueryLog):
+    """Time every statement engine executes into querylog."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info["querylog_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop("querylog_start", None)
+        if start is not None:
+            querylog.record(statement, time.perf_counter() - start)
+
+
+class QueryLogMiddleware:
+    """Counts the SQL statements each request issues."""
+
+    def __init__(self, app, querylog: QueryLog):
+        self.app = app
+        self.querylog = querylog
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        statements = Counter()
+        token = _request_statements.set(statements)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_statements.reset(token)
+            self.querylog.request_finished(scope["method"], scope["path"], statements)
@@ -0,0 +1,164 @@
+# Token-bucket rate limiting that mirrors Notify's API limits.
+#
+# Each API key (JWT ``iss``) gets a bucket holding up to ``limit`` tokens that
+# refills at ``limit / period`` tokens per second, plus a count of messages
+# sent today. By default state lives in this process; pointing
+# PIT_RATE_LIMIT_STATE at a file shares one budget between uvicorn workers
+# through a small SQLite database. Either way a check is a single keyed
+# lookup and update.
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from .config import env_bool, env_float, env_int
+from .errors import NotifyError
+
+
+def take(state, now: float, today: str, limit: int, period: float, daily_limit: int):
+    """Apply one request to a (tokens, updated, day, sent) state.
+
+    Returns the new state and None, or the unchanged state and a NotifyError.
+    """
+    if state is None:
+        tokens, updated, day, sent = float(limit), now, today, 0
+    else:
+        tokens, updated, day, sent = state
+    tokens = min(float(limit), tokens + (now - updated) * limit / period)
+    if day != today:
+        day, sent = today, 0
+
+    if tokens < 1:
+        return state, NotifyError(
+            429,
+            "RateLimitError",
+            f"Exceeded rate limit for key type LIVE of {limit} requests per "
+            f"{int(period)} seconds",
+        )
+    if daily_limit and sent >= daily_limit:
+        return state, NotifyError(
+            429,
+            "TooManyRequestsError",
+            f"Exceeded send limits ({daily_limit}) for today",
+        )
+    return (tokens - 1, now, day, sent + 1), None
+
+
+class MemoryStore:
+    """Per-process bucket state."""
+
+    blocking = False
+
+    def __init__(self):
+        self._state = {}
+
+    def apply(self, key: str, fn):
+        state, error = fn(self._state.get(key))
+        self._state[key] = state
+        return error
+
+    def clear(self):
+        self._state.clear()
+
+
+class SqliteStore:
+    """Bucket state shared between processes through a SQLite file."""
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, "
+                "tokens REAL, updated REAL, day TEXT, sent INTEGER)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def apply(self, key: str, fn):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated, day, sent FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            state, error = fn(row)
+            if error is None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?)",
+                    (key, *state),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return error
+
+    def clear(self):
+        self._connection().execute("DELETE FROM buckets")
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        limit: int = 3000,
+        period: float = 60.0,
+        daily_limit: int = 250_000,
+        store=None,
+        enabled: bool = True,
+        clock=time.time,
+    ):
+        self.limit = limit
+        self.period = period
+        self.daily_limit = daily_limit
+        self.store = store or MemoryStore()
+        self.enabled = enabled
+        self.clock = clock
+
+    @classmethod
+    def from_env(cls):
+        state = os.environ.get("PIT_RATE_LIMIT_STATE")
+        return cls(
+            limit=env_int("PIT_RATE_LIMIT", 3000),
+            period=env_float("PIT_RATE_LIMIT_PERIOD", 60.0),
+            daily_limit=env_int("PIT_DAILY_LIMIT", 250_000),
+            store=SqliteStore(state) if state else MemoryStore(),
+            enabled=env_bool("PIT_RATE_LIMIT_ENABLED"),
+        )
+
+    def check(self, key: str):
+        """Spend one token for key, raising NotifyError when over a limit."""
+        now = self.clock()
+        today = datetime.fromtimestamp(now, timezone.utc).date().isoformat()
+        error = self.store.apply(
+            key,
+            lambda state: take(
+                state, now, today, self.limit, self.period, self.daily_limit
+            ),
+        )
+        if error is not None:
+            raise error
+
+    async def clear(self):
+        """Refill every bucket and forget today's counts."""
+        if self.store.blocking:
+            await asyncio.to_thread(self.store.clear)
+        else:
+            self.store.clear()
+
+    async def __call__(self, key: str):
+        if not self.enabled:
+            return
+        if self.store.blocking:
+            await asyncio.to_thread(self.check, key)
+        else:
+            self.check(key)
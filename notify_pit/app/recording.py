@@ -0,0 +1,134 @@
+# Records incoming /v2/* API traffic for replay (see replay.py).
+#
+# With PIT_RECORD_FILE set, every /v2/ request is appended to that file as one
+# NDJSON line once its response is sent:
+#
+#   {"t": 1760911200.125, "m": "POST", "p": "/v2/notifications/sms",
+#    "i": "service-id", "s": 201, "d": 0.004, "b": "{...}"}
+#
+# t is the arrival time (Unix seconds), i the token's issuer, s the response
+# status, d the seconds taken and b the request body. Tokens themselves are
+# not kept: replay mints fresh ones for the same issuer. Each line is written
+# with a single append, so several workers can share one file.
+import base64
+import os
+import time
+
+import jwt
+import orjson
+from starlette.datastructures import Headers
+
+from .config import env_int
+
+RECORD_FILE = os.environ.get("PIT_RECORD_FILE")
+
+
+class Recorder:
+    """Appends recorded requests to a file."""
+
+    def __init__(self, path: str, max_body: int = 1024 * 1024):
+        # Bodies larger than max_body (such as big attachments) are recorded
+        # without their body, and skipped by replay
+        self.path = path
+        self.max_body = max_body
+        self._fd = None
+
+    @classmethod
+    def from_env(cls):
+        if not RECORD_FILE:
+            return None
+        return cls(RECORD_FILE, max_body=env_int("PIT_RECORD_MAX_BODY", 1024 * 1024))
+
+    def record(self, entry: dict):
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._fd, orjson.dumps(entry) + b"\n")
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def read(path: str):
+    """The recorded requests in a file, one dict at a time."""
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)
+
+
+def body_of(entry: dict):
+    """A recorded request's body as bytes, or None if it was too large to keep."""
+    if "b" in entry:
+        return entry["b"].encode()
+    if "b64" in entry:
+        return base64.b64decode(entry["b64"])
+    return None if entry.get("truncated") else b""
+
+
+def _issuer(headers: Headers):
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, options={"verify_signature": False}).get("iss")
+    except jwt.PyJWTError:
+        return None
+
+
+class RecordingMiddleware:
+    def __init__(self, app, recorder: Recorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/v2/"):
+            await self.app(scope, receive, send)
+            return
+
+        arrived = time.time()
+        began = time.perf_counter()
+        chunks = []
+        size = 0
+        status = None
+
+        async def recording_receive():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                size += len(body)
+                if size <= self.recorder.max_body:
+                    chunks.append(body)
+            return message
+
+        async def recording_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, recording_receive, recording_send)
+        finally:
+            path = scope["path"]
+            if scope.get("query_string"):
+                path += "?" + scope["query_string"].decode("latin-1")
+            entry = {
+                "t": round(arrived, 6),
+                "m": scope["method"],
+                "p": path,
+                "i": _issuer(Headers(scope=scope)),
+                "s": status,
+                "d": round(time.perf_counter() - began, 6),
+            }
+            if size > self.recorder.max_body:
+                entry["truncated"] = True
+            elif size:
+                body = b"".join(chunks)
+                try:
+                    entry["b"] = body.decode()
+                except UnicodeDecodeError:
+                    entry["b64"] = base64.b64encode(body).decode()
+            self.recorder.record(entry)
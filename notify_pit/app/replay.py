@@ -0,0 +1,159 @@
+# Replays traffic recorded with PIT_RECORD_FILE (see recording.py).
+#
+# Requests are re-issued in the order they arrived, with the recorded gaps
+# between them divided by --speed, so a day of traffic can be replayed at 1x,
+# 10x or 100x. Each gets a freshly minted JWT for the issuer it was recorded
+# with. Prints achieved against target request rate, how late requests went
+# out, and latency, as JSON.
+#
+# In-process, through httpx's ASGI transport:
+#
+#   python -m app.replay traffic.ndjson --speed 10
+#
+# Against a running pit:
+#
+#   python -m app.replay traffic.ndjson --url http://localhost:8000 --speed 100
+#
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+from . import recording
+from .auth import SECRET
+from .bench import TokenCache, in_process_client, summarise
+
+
+async def replay(
+    client: httpx.AsyncClient,
+    entries,
+    speed: float = 1.0,
+    max_in_flight: int = 1000,
+    secret: str = SECRET,
+    iss: str = None,
+) -> dict:
+    """Replay recorded entries with an already configured client.
+
+    At most ``max_in_flight`` requests are outstanding at once. When the
+    target is slower than the schedule, requests go out late rather than
+    piling up without bound, and the lateness is reported.
+
+    Entries are replayed in order of arrival. A recording lists them as
+    they completed, so they are sorted first, which reads them all.
+    """
+    if speed <= 0:
+        raise ValueError("speed must be positive")
+    entries = sorted(entries, key=lambda entry: entry["t"])
+    tokens = {}
+    slots = asyncio.Semaphore(max_in_flight)
+    pending = set()
+    latencies = []
+    lags = []
+    statuses = Counter()
+    errors = Counter()
+    skipped = 0
+    first = last = None
+    start = time.perf_counter()
+
+    async def issue(entry, body):
+        issuer = iss or entry.get("i") or "notify-pit-replay"
+        if issuer not in tokens:
+            tokens[issuer] = TokenCache(secret, issuer)
+        headers = tokens[issuer].headers()
+        if body:
+            headers["Content-Type"] = "application/json"
+        began = time.perf_counter()
+        try:
+            response = await client.request(
+                entry["m"], entry["p"], content=body, headers=headers
+            )
+        except httpx.HTTPError as e:
+            errors[type(e).__name__] += 1
+            return
+        finally:
+            slots.release()
+        latencies.append(time.perf_counter() - began)
+        statuses[response.status_code] += 1
+        if response.is_error:
+            errors[f"HTTP {response.status_code}"] += 1
+
+    for entry in entries:
+        body = recording.body_of(entry)
+        if body is None:
+            skipped += 1
+            continue
+        if first is None:
+            first = entry["t"]
+        last = entry["t"]
+        due = start + (entry["t"] - first) / speed
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await slots.acquire()
+        lags.append(max(0.0, time.perf_counter() - due))
+        task = asyncio.create_task(issue(entry, body))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    if pending:
+        await asyncio.gather(*pending)
+    elapsed = time.perf_counter() - start
+
+    issued = len(lags)
+    recorded_seconds = (last - first) if issued else 0.0
+    target_seconds = recorded_seconds / speed
+    return {
+        "speed": speed,
+        "requests": issued,
+        "skipped": skipped,
+        "recorded_seconds": round(recorded_seconds, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        # The recorded rate, sped up; the first request starts the clock
+        "target_rps": round(issued / target_seconds, 1) if target_seconds else None,
+        "achieved_rps": round(issued / elapsed, 1) if elapsed else None,
+        "errors": dict(errors),
+        "status_codes": {str(k): v for k, v in sorted(statuses.items())},
+        "lag_ms": summarise(lags),
+        "latency_ms": summarise(latencies),
+    }
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.replay")
+    parser.add_argument("file", help="A recording made with PIT_RECORD_FILE")
+    parser.add_argument("--url", help="Replay against a running service")
+    parser.add_argument("--speed", type=float, default=1.0, help="(default 1)")
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--secret", default=SECRET)
+    parser.add_argument("--iss", help="Send every request as this issuer")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        client = httpx.AsyncClient(
+            base_url=args.url,
+            timeout=30,
+            limits=httpx.Limits(max_connections=args.max_in_flight),
+        )
+    else:
+        client = in_process_client()
+
+    async with client:
+        result = await replay(
+            client,
+            recording.read(args.file),
+            speed=args.speed,
+            max_in_flight=args.max_in_flight,
+            secret=args.secret,
+            iss=args.iss,
+        )
+    result = {"mode": "socket" if args.url else "asgi", "file": args.file, **result}
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,27 @@
+from typing import Any
+
+import orjson
+from fastapi import responses
+
+from .tracing import span
+
+
+class JSONResponse(responses.JSONResponse):
+    """FastAPI's JSONResponse, with rendering traced. The app's default."""
+
+    def render(self, content: Any) -> bytes:
+        with span("render json"):
+            return super().render(content)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson.
+
+    Used for endpoints that already hand back plain dicts/lists (see the
+    ``*_rows`` readers in ``crud``), so FastAPI's ``jsonable_encoder`` walk can
+    be skipped entirely. orjson serialises datetimes natively as ISO 8601.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with span("render json"):
+            return orjson.dumps(content)
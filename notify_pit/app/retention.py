@@ -0,0 +1,225 @@
+# Bounded retention for the notifications table.
+#
+# A background task periodically deletes notifications older than a maximum
+# age and/or beyond a maximum row count, per notification type. Deletes run
+# in small batches of ids found through the (type, created_at) index, each
+# in its own short transaction with a pause in between, so the write lock is
+# never held for long and requests keep getting through.
+#
+#   PIT_RETENTION_MAX_AGE=7d          applies to every type
+#   PIT_RETENTION_MAX_ROWS=100000
+#   PIT_RETENTION_MAX_AGE_SMS=1d      per-type overrides
+#   PIT_RETENTION_MAX_ROWS_EMAIL=5000
+#
+# With an archive (see archive.py), each batch is copied to a compressed
+# segment before it is deleted.
+#
+# Every worker runs a purger, but each round is taken by one of them: the
+# purger holding a lock file named after the database. The others skip the
+# round. Counts are taken after the lock is acquired, so a round that
+# follows another's never deletes the same excess twice.
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from . import crud, metrics
+from .config import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+TYPES = ("sms", "email", "letter")
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(value: str) -> float:
+    """Seconds in a duration such as "90", "30m", "12h" or "7d"."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*", value.lower())
+    if not match:
+        raise ValueError(f"Invalid duration {value!r}")
+    return float(match.group(1)) * UNITS.get(match.group(2) or "s")
+
+
+@dataclass
+class Policy:
+    max_age: Optional[float] = None  # seconds
+    max_rows: Optional[int] = None
+
+
+class RetentionPurger:
+    def __init__(
+        self,
+        session_factory,
+        policies: dict,
+        interval: float = 60.0,
+        batch_size: int = 500,
+        pause: float = 0.05,
+        clock=time.time,
+        archive=None,
+        lock_path: str = None,
+    ):
+        self.session_factory = session_factory
+        self.policies = policies
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.clock = clock
+        self.archive = archive
+        self.lock_path = lock_path
+        self._task = None
+
+    @classmethod
+    def from_env(cls, session_factory, archive=None, database_url: str = ""):
+        def duration(name):
+            value = os.environ.get(name)
+            return parse_duration(value) if value else None
+
+        def rows(name):
+            value = os.environ.get(name)
+            return int(value) if value else None
+
+        default = Policy(
+            duration("PIT_RETENTION_MAX_AGE"), rows("PIT_RETENTION_MAX_ROWS")
+        )
+        policies = {}
+        for type in TYPES:
+            suffix = type.upper()
+            max_age = duration(f"PIT_RETENTION_MAX_AGE_{suffix}")
+            max_rows = rows(f"PIT_RETENTION_MAX_ROWS_{suffix}")
+            policy = Policy(
+                default.max_age if max_age is None else max_age,
+                default.max_rows if max_rows is None else max_rows,
+            )
+            if policy.max_age is not None or policy.max_rows is not None:
+                policies[type] = policy
+        return cls(
+            session_factory,
+            policies,
+            interval=env_float("PIT_RETENTION_INTERVAL", 60.0),
+            batch_size=env_int("PIT_RETENTION_BATCH_SIZE", 500),
+            archive=archive,
+            lock_path=os.environ.get("PIT_RETENTION_LOCK")
+            or default_lock(database_url),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.policies)
+
+    # --- Batches (blocking; run in a thread) ---
+
+    def _delete_batch(self, type: str, limit: int, created_before=None) -> int:
+        with self.session_factory() as db:
+            if self.archive is None:
+                ids = crud.oldest_notification_ids(db, type, limit, created_before)
+                return crud.delete_notifications(db, ids) if ids else 0
+            # Under the lock, so two workers never archive the same rows
+            with self.archive.locked():
+                ids = crud.oldest_notification_ids(db, type, limit, created_before)
+                if not ids:
+                    return 0
+                self.archive.append(crud.get_notification_rows_by_id(db, ids))
+                return crud.delete_notifications(db, ids)
+
+    def _count(self, type: str) -> int:
+        with self.session_factory() as db:
+            return crud.count_notifications_of_type(db, type)
+
+    # --- Purging ---
+
+    async def _purge(self, type: str, reason: str, remaining=None, cutoff=None):
+        purged = 0
+        while remaining is None or remaining > 0:
+            limit = (
+                self.batch_size
+                if remaining is None
+                else min(self.batch_size, remaining)
+            )
+            deleted = await asyncio.to_thread(self._delete_batch, type, limit, cutoff)
+            if deleted:
+                purged += deleted
+                metrics.RETENTION_PURGED.inc(type, reason, amount=deleted)
+                if remaining is not None:
+                    remaining -= deleted
+            if deleted < limit:
+                break
+            await asyncio.sleep(self.pause)
+        return purged
+
+    async def purge_once(self) -> dict:
+        """Apply every policy once; returns counts purged by type and reason."""
+        purged = {}
+        for type, policy in self.policies.items():
+            if policy.max_age is not None:
+                cutoff = datetime.fromtimestamp(self.clock(), timezone.utc) - timedelta(
+                    seconds=policy.max_age
+                )
+                purged[(type, "max_age")] = await self._purge(
+                    type, "max_age", cutoff=cutoff
+                )
+            if policy.max_rows is not None:
+                excess = await asyncio.to_thread(self._count, type) - policy.max_rows
+                if excess > 0:
+                    purged[(type, "max_rows")] = await self._purge(
+                        type, "max_rows", remaining=excess
+                    )
+        return purged
+
+    @contextmanager
+    def _elected(self):
+        """Whether this purger takes the round, holding the lock while it does."""
+        if self.lock_path is None:
+            yield True
+            return
+        with open(self.lock_path, "w") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    async def purge_if_elected(self) -> Optional[dict]:
+        """purge_once, or None when another worker is purging this round."""
+        with self._elected() as elected:
+            if not elected:
+                return None
+            return await self.purge_once()
+
+    async def run(self):
+        while True:
+            try:
+                purged = await self.purge_if_elected() or {}
+                total = sum(purged.values())
+                if total:
+                    logger.info("Retention purged %d notifications", total)
+            except Exception:
+                logger.exception("Retention purge failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+def default_lock(database_url: str) -> str:
+    """A lock file shared by the workers of one database, and no others."""
+    digest = hashlib.sha256(database_url.encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"notify-pit-retention-{digest}.lock")
@@ -1,9 +1,22 @@
-from typing import Any, Dict, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, Literal, Optional
 
-from pydantic import UUID4, BaseModel
+from pydantic import UUID4, BaseModel, Field, field_validator, model_validator
 
+from .tracing import span
 
-class NotificationBase(BaseModel):
+
+class TracedModel(BaseModel):
+    """A request body whose parsing shows up as a span in traced requests."""
+
+    @model_validator(mode="wrap")
+    @classmethod
+    def _trace_validation(cls, data, handler):
+        with span(f"validate {cls.__name__}"):
+            return handler(data)
+
+
+class NotificationBase(TracedModel):
     template_id: UUID4
     personalisation: Optional[Dict[str, Any]] = None
     reference: Optional[str] = None
@@ -21,8 +34,88 @@ class LetterRequest(NotificationBase):
     personalisation: Dict[str, Any]
 
 
-class CreateTemplateRequest(BaseModel):
+class PrecompiledLetterUpload(BaseModel):
+    """A precompiled letter as sent; documents the request body only.
+
+    The PDF is streamed to disk as it arrives and the rest is validated as a
+    PrecompiledLetterRequest.
+    """
+
+    reference: str
+    content: str = Field(description="The PDF, base64 encoded")
+    postage: Literal["first", "second", "economy", "europe", "rest-of-world"] = "second"
+
+
+class PrecompiledLetterRequest(TracedModel):
+    """A precompiled letter, once its base64 PDF has been streamed to disk."""
+
+    reference: str
+    postage: Literal["first", "second", "economy", "europe", "rest-of-world"] = "second"
+    # Filled in from the upload, not the request
+    file_sha256: str
+    file_size: int
+    # Precompiled letters have no template
+    template_id: None = None
+    personalisation: None = None
+
+
+class ReceivedTextRequest(TracedModel):
+    phone_number: str
+    content: str
+    service_id: Optional[str] = None
+
+
+class CreateTemplateRequest(TracedModel):
     type: str
     name: str
     body: str
     subject: Optional[str] = None
+
+
+class ServiceCallbackRequest(TracedModel):
+    service_id: str
+    callback_type: Literal["delivery_status", "inbound_sms"]
+    url: str
+    bearer_token: str
+
+
+class NotificationFilters(BaseModel):
+    type: Optional[str] = None
+    status: Optional[str] = None
+    template_id: Optional[str] = None
+    reference: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+    @field_validator("created_after", "created_before")
+    @classmethod
+    def as_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # Timestamps are stored in UTC; SQLite drops the offset on comparison
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value
+
+
+class LatencySpec(BaseModel):
+    distribution: Literal["fixed", "normal", "percentiles"] = "fixed"
+    # fixed
+    ms: float = Field(0, ge=0)
+    # normal
+    mean_ms: float = Field(0, ge=0)
+    stddev_ms: float = Field(0, ge=0)
+    # percentiles, e.g. {"50": 80, "99": 900, "100": 3000}
+    percentiles: Dict[float, float] = {}
+
+
+class FaultRule(BaseModel):
+    latency: Optional[LatencySpec] = None
+    error_rate: float = Field(0, ge=0, le=1)
+    error_status: int = 500
+    timeout_rate: float = Field(0, ge=0, le=1)
+    timeout_seconds: float = Field(30, ge=0)
+
+
+class PitConfigRequest(BaseModel):
+    fault_profile: Optional[str] = None
+    # Profiles map a path glob (e.g. "/v2/notifications/*") to its faults
+    profiles: Dict[str, Dict[str, FaultRule]] = {}
@@ -0,0 +1,80 @@
+# Ranked full-text search over notifications, for finding the message a
+# failing test sent without downloading every notification.
+#
+# The index covers content, reference, phone_number, email_address and the
+# values in personalisation (see SEARCH_DDL in models.py). Each word of the
+# query must match, as a prefix, somewhere in a notification:
+#
+#   SQLite      FTS5, ranked by bm25
+#   PostgreSQL  tsvector with prefix tsquery, ranked by ts_rank
+#   others      LIKE on each column, newest first
+import re
+
+from sqlalchemy import String, cast, func, literal_column, or_, select, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+SEARCHED = ("content", "reference", "phone_number", "email_address")
+
+
+def terms(q: str) -> list:
+    """The words in a query, without the punctuation both indexes split on."""
+    return [term for term in re.split(r"[^\w]+", q.lower()) if term]
+
+
+def _sqlite(q: str):
+    table = models.Notification.__table__
+    # Quoted, so FTS5 operators in the query are taken literally
+    match = " ".join(f'"{term}"*' for term in terms(q))
+    return (
+        select(*table.columns)
+        .select_from(
+            table.join(
+                text("notifications_fts"),
+                literal_column("notifications_fts.rowid")
+                == literal_column("notifications.rowid"),
+            )
+        )
+        .where(text("notifications_fts MATCH :match").bindparams(match=match))
+        .order_by(text("bm25(notifications_fts)"))
+    )
+
+
+def _postgresql(q: str):
+    table = models.Notification.__table__
+    # Must match the expression indexed in models.SEARCH_DDL
+    document = literal_column(
+        "to_tsvector('simple', coalesce(content, '') || ' ' || "
+        "coalesce(reference, '') || ' ' || coalesce(phone_number, '') || ' ' || "
+        "coalesce(email_address, '')) || jsonb_to_tsvector('simple', "
+        "coalesce(personalisation::jsonb, '{}'), '[\"string\", \"numeric\"]')"
+    )
+    query = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms(q)))
+    return (
+        select(*table.columns)
+        .where(document.op("@@")(query))
+        .order_by(func.ts_rank(document, query).desc())
+    )
+
+
+def _like(q: str):
+    table = models.Notification.__table__
+    columns = [table.c[name] for name in SEARCHED]
+    columns.append(cast(table.c.personalisation, String))
+    statement = select(*table.columns)
+    for term in terms(q):
+        pattern = f"%{term}%"
+        statement = statement.where(or_(*(c.ilike(pattern) for c in columns)))
+    return statement.order_by(table.c.created_at.desc())
+
+
+def search(db: Session, q: str, limit: int = 50, offset: int = 0) -> list:
+    """Notifications matching every word of q, best match first."""
+    if not terms(q):
+        return []
+    dialect = db.get_bind().dialect.name
+    build = {"sqlite": _sqlite, "postgresql": _postgresql}.get(dialect, _like)
+    result = db.execute(build(q).limit(limit).offset(offset))
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
@@ -0,0 +1,114 @@
+# Incrementally maintained notification counts behind /pit/stats.
+#
+# Every change to the notifications table adds its deltas to the
+# notification_stats summary table, keyed by (type, status, template_id,
+# hour), within the same transaction. Reading the stats therefore costs one
+# scan of the summary table, whose size depends on how many combinations
+# occur, not on how many notifications there are.
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+TABLE = models.NotificationStat.__table__
+KEY = ("type", "status", "template_id", "hour")
+
+
+def hour_of(created_at: datetime) -> str:
+    # SQLite hands back naive datetimes, which are UTC
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    created_at = created_at.astimezone(timezone.utc)
+    return created_at.strftime("%Y-%m-%dT%H:00:00Z")
+
+
+def key(type: str, status: str, template_id, created_at: datetime) -> tuple:
+    return (type, status, template_id or "", hour_of(created_at))
+
+
+def _upsert(db: Session, rows: list):
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        dialect_insert = None
+
+    if dialect_insert is not None:
+        statement = dialect_insert(TABLE)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=list(KEY),
+                set_={"count": TABLE.c.count + statement.excluded.count},
+            ),
+            rows,
+        )
+        return
+    # Other databases: update, then insert the keys that weren't there yet
+    for row in rows:
+        matches = [TABLE.c[name] == row[name] for name in KEY]
+        result = db.execute(
+            update(TABLE).where(*matches).values(count=TABLE.c.count + row["count"])
+        )
+        if result.rowcount == 0:
+            db.execute(insert(TABLE), [row])
+
+
+def record(db: Session, deltas: Counter):
+    """Add count deltas, keyed by key(), to the summary; the caller commits."""
+    # Rows are upserted in key order, so concurrent transactions lock summary
+    # rows in the same order and can't deadlock each other on PostgreSQL
+    rows = [
+        dict(zip(KEY, stat_key), count=delta)
+        for stat_key, delta in sorted(deltas.items())
+        if delta
+    ]
+    if rows:
+        _upsert(db, rows)
+
+
+def clear(db: Session):
+    db.execute(delete(TABLE))
+
+
+def summary(db: Session) -> dict:
+    by_type = defaultdict(int)
+    by_status = defaultdict(int)
+    by_type_and_status = defaultdict(lambda: defaultdict(int))
+    by_template = defaultdict(int)
+    by_hour = defaultdict(int)
+    total = 0
+    result = db.execute(
+        select(*(TABLE.c[name] for name in KEY), TABLE.c.count).where(TABLE.c.count > 0)
+    )
+    for type, status, template_id, hour, count in result:
+        total += count
+        by_type[type] += count
+        by_status[status] += count
+        by_type_and_status[type][status] += count
+        if template_id:
+            by_template[template_id] += count
+        by_hour[hour] += count
+    return {
+        "total": total,
+        "by_type": dict(by_type),
+        "by_status": dict(by_status),
+        "by_type_and_status": {
+            type: dict(statuses) for type, statuses in by_type_and_status.items()
+        },
+        "by_template": dict(by_template),
+        "by_hour": dict(sorted(by_hour.items())),
+    }
+
+
+def counts_by_type_and_status(db: Session):
+    """(type, status, count) for every combination that has notifications."""
+    return db.execute(
+        select(TABLE.c.type, TABLE.c.status, func.sum(TABLE.c.count))
+        .group_by(TABLE.c.type, TABLE.c.status)
+        .having(func.sum(TABLE.c.count) > 0)
+    ).all()
@@ -0,0 +1,258 @@
+# Lightweight request tracing, exported as OpenTelemetry JSON.
+#
+# With PIT_TRACE_SAMPLE_RATE above 0, that share of requests (plus any request
+# arriving with a sampled W3C ``traceparent`` header) is traced. The request
+# is the root span. JWT validation, request body parsing, crud calls and
+# response rendering are child spans. Each finished trace is written as one
+# line of OTLP/JSON (the format the OpenTelemetry collector's file exporter
+# writes and otel-tui, Jaeger and friends import) to PIT_TRACE_FILE, or to
+# stdout when that is "-". The trace id is returned in the X-Pit-Trace-Id
+# response header.
+#
+# Outside a sampled request span() is a single contextvar lookup, and when
+# the sample rate is 0 the middleware isn't installed at all.
+import functools
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import orjson
+from starlette.datastructures import Headers
+
+from .config import env_float
+from .metrics import route_label
+
+SERVER = 2
+INTERNAL = 1
+STATUS_ERROR = 2
+# traceparent flags with the sampled bit set
+SAMPLED_FLAGS = {f"{flags:02x}" for flags in range(256) if flags & 1}
+
+_current: ContextVar = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = (
+        "trace",
+        "span_id",
+        "parent_id",
+        "name",
+        "kind",
+        "start",
+        "end",
+        "attributes",
+        "error",
+    )
+
+    def __init__(self, trace, name: str, parent_id: str = None, kind=INTERNAL):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = {}
+        self.error = None
+        self.start = time.time_ns()
+        self.end = None
+        trace.spans.append(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end or time.time_ns()),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id: str = None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.spans = []
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a child span of the current span, if this request is traced."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id)
+    child.attributes.update(attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        child.end = time.time_ns()
+        _current.reset(token)
+
+
+def traced(fn, name: str = None):
+    """Wrap a sync function so each call is a span."""
+    name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return fn(*args, **kwargs)
+        with span(name):
+            return fn(*args, **kwargs)
+
+    wrapper.traced = True
+    return wrapper
+
+
+def instrument(module):
+    """Trace every public function defined in module, e.g. crud."""
+    for name, fn in list(vars(module).items()):
+        if (
+            inspect.isfunction(fn)
+            and not name.startswith("_")
+            and fn.__module__ == module.__name__
+            and not getattr(fn, "traced", False)
+        ):
+            setattr(module, name, traced(fn))
+
+
+class Exporter:
+    """Appends one OTLP/JSON ExportTraceServiceRequest per trace to a file."""
+
+    def __init__(self, path: str = "-", service_name: str = "notify-pit"):
+        self.path = path
+        self.resource = {"attributes": [_attribute("service.name", service_name)]}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, trace: Trace):
+        line = orjson.dumps(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": self.resource,
+                        "scopeSpans": [
+                            {
+                                "scope": {"name": "notify_pit"},
+                                "spans": [s.to_otlp() for s in trace.spans],
+                            }
+                        ],
+                    }
+                ]
+            }
+        )
+        with self._lock:
+            if self.path == "-":
+                sys.stdout.buffer.write(line + b"\n")
+                sys.stdout.flush()
+                return
+            if self._file is None:
+                self._file = open(self.path, "ab", buffering=0)
+            self._file.write(line + b"\n")
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = 0.0, exporter=None, rng=None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter or Exporter()
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            sample_rate=env_float("PIT_TRACE_SAMPLE_RATE", 0.0),
+            exporter=Exporter(os.environ.get("PIT_TRACE_FILE", "-")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def sample(self, traceparent: str = None):
+        """(trace id, parent span id) if a request should be traced, else None.
+
+        A sampled W3C traceparent joins the caller's trace; otherwise both ids
+        are None and a new trace is started.
+        """
+        if traceparent:
+            parts = traceparent.split("-")
+            if (
+                len(parts) == 4
+                and len(parts[1]) == 32
+                and len(parts[2]) == 16
+                and parts[3] in SAMPLED_FLAGS
+            ):
+                return parts[1], parts[2]
+        if self.rng.random() < self.sample_rate:
+            return None, None
+        return None
+
+
+class TracingMiddleware:
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        sampled = self.tracer.sample(Headers(scope=scope).get("traceparent"))
+        if sampled is None:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id = sampled
+        root_path = scope.get("root_path", "")
+        root = Span(Trace(trace_id), scope["method"], parent_id, kind=SERVER)
+        root.attributes["http.request.method"] = scope["method"]
+        root.attributes["url.path"] = scope["path"]
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.response.status_code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-pit-trace-id", root.trace.trace_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current.set(root)
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        except BaseException as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            root.end = time.time_ns()
+            route = route_label(scope, root_path)
+            root.name = f"{scope['method']} {route}"
+            root.attributes["http.route"] = route
+            self.tracer.exporter.export(root.trace)
@@ -0,0 +1,227 @@
+# Streaming parser for request bodies that carry files as base64 strings,
+# such as precompiled letters ({"content": "<base64 PDF>", ...}) and email
+# attachments ({"personalisation": {"report": {"file": "<base64>", ...}}}).
+#
+# The body is read chunk by chunk. A string at one of the chosen paths is
+# base64-decoded as it arrives and written to the blob store. It is never
+# held in memory whole. The rest of the document is small, so it is collected
+# and parsed with orjson at the end. In the parsed document, each streamed
+# string is replaced by whatever its sink returns, such as the file's hash.
+import base64
+import binascii
+
+import orjson
+
+WHITESPACE = b" \t\r\n"
+# JSON escapes that can appear in base64 text: "\/" for "/" and escaped
+# line breaks from MIME-style base64
+BASE64_ESCAPES = {b"\\/": b"/", b"\\n": b"", b"\\r": b"", b"\\t": b""}
+
+
+class UploadError(ValueError):
+    """The file in an upload is unusable, as opposed to the JSON around it."""
+
+
+class Base64Decoder:
+    """Decodes base64 that arrives in arbitrary pieces."""
+
+    def __init__(self):
+        self._pending = b""
+
+    def feed(self, data: bytes) -> bytes:
+        data = self._pending + bytes(data).translate(None, WHITESPACE)
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        try:
+            return base64.b64decode(data[:usable], validate=True)
+        except binascii.Error as e:
+            raise UploadError(f"Invalid base64: {e}") from None
+
+    def finish(self):
+        if self._pending:
+            raise UploadError("Invalid base64: incomplete data")
+
+
+class Base64BlobSink:
+    """Decodes a base64 string into a new blob."""
+
+    def __init__(self, blobs, check=None):
+        # check(head) sees the first KiB of the file and raises UploadError
+        # if it isn't the expected kind of file
+        self.writer = blobs.writer()
+        self.decoder = Base64Decoder()
+        self.check = check
+        self._head = b""
+
+    def write(self, text: bytes):
+        data = self.decoder.feed(text)
+        if self.check is not None and len(self._head) < 1024:
+            self._head += data[: 1024 - len(self._head)]
+        try:
+            self.writer.write(data)
+        except ValueError as e:
+            raise UploadError(str(e)) from None
+
+    def close(self) -> dict:
+        self.decoder.finish()
+        if self.check is not None:
+            self.check(self._head)
+        sha256, size = self.writer.commit()
+        return {"sha256": sha256, "size": size}
+
+    def abort(self):
+        self.writer.abort()
+
+
+class StreamingJSONParser:
+    """Parses a JSON document fed in chunks, streaming chosen strings to sinks.
+
+    ``sink_for(path)`` is called for each string value with its path, a tuple
+    of object keys and array indexes. It returns a sink to stream that
+    string's raw text into, or None to keep the string in the document.
+    """
+
+    def __init__(self, sink_for):
+        self.sink_for = sink_for
+        self._out = bytearray()
+        # One entry per open container: [is_object, key or index, awaiting_key]
+        self._stack = []
+        self._mode = None  # None, "key", "string" or "stream"
+        self._escape = False
+        self._key = bytearray()
+        self._sink = None
+        self._sinks = []
+        # What each sink returned, in document order
+        self.streamed = []
+
+    def _path(self) -> tuple:
+        return tuple(entry[1] for entry in self._stack)
+
+    def feed(self, chunk: bytes):
+        try:
+            self._feed(bytes(chunk))
+        except BaseException:
+            self.abort()
+            raise
+
+    def _feed(self, chunk: bytes):
+        i, n = 0, len(chunk)
+        while i < n:
+            if self._mode == "stream":
+                i = self._stream(chunk, i)
+            elif self._mode is not None:
+                i = self._string(chunk, i)
+            else:
+                i = self._structure(chunk, i)
+
+    def _structure(self, chunk: bytes, i: int) -> int:
+        c = chunk[i]
+        top = self._stack[-1] if self._stack else None
+        if c == ord('"'):
+            if top is not None and top[0] and top[2]:
+                self._mode = "key"
+                self._key.clear()
+            else:
+                self._sink = self.sink_for(self._path())
+                if self._sink is not None:
+                    self._sinks.append(self._sink)
+                    self._mode = "stream"
+                    return i + 1
+                self._mode = "string"
+        elif c == ord("{"):
+            self._stack.append([True, None, True])
+        elif c == ord("["):
+            self._stack.append([False, 0, False])
+        elif c in (ord("}"), ord("]")):
+            if not self._stack:
+                raise ValueError("Invalid JSON: unbalanced brackets")
+            self._stack.pop()
+        elif c == ord(","):
+            if top is not None:
+                if top[0]:
+                    top[2] = True
+                else:
+                    top[1] += 1
+        self._out.append(c)
+        return i + 1
+
+    def _string(self, chunk: bytes, i: int) -> int:
+        start = i
+        n = len(chunk)
+        while i < n:
+            if self._escape:
+                self._escape = False
+                i += 1
+                continue
+            # Skip to the next quote or backslash without a Python-level loop
+            quote = chunk.find(b'"', i)
+            slash = chunk.find(b"\\", i)
+            if slash != -1 and (quote == -1 or slash < quote):
+                self._escape = True
+                i = slash + 1
+                continue
+            if quote == -1:
+                i = n
+                break
+            i = quote + 1
+            self._end_string(chunk[start:quote])
+            self._out.append(ord('"'))
+            return i
+        self._take(chunk[start:i])
+        return i
+
+    def _take(self, text: bytes):
+        if self._mode == "key":
+            self._key += text
+        self._out += text
+
+    def _end_string(self, text: bytes):
+        self._take(text)
+        if self._mode == "key":
+            top = self._stack[-1]
+            top[1] = orjson.loads(b'"' + bytes(self._key) + b'"')
+            top[2] = False
+        self._mode = None
+
+    def _stream(self, chunk: bytes, i: int) -> int:
+        # Base64 never contains a quote, so the first one ends the string
+        end = chunk.find(b'"', i)
+        text = chunk[i:] if end == -1 else chunk[i:end]
+        if self._escape:
+            text = b"\\" + text
+            self._escape = False
+        if end == -1 and text.endswith(b"\\"):
+            # An escape split across chunks
+            text = text[:-1]
+            self._escape = True
+        if b"\\" in text:
+            for escape, replacement in BASE64_ESCAPES.items():
+                text = text.replace(escape, replacement)
+            if b"\\" in text:
+                raise UploadError("Invalid base64: unexpected escape")
+        self._sink.write(text)
+        if end == -1:
+            return len(chunk)
+        result = self._sink.close()
+        self.streamed.append(result)
+        self._out += orjson.dumps(result)
+        self._sinks.remove(self._sink)
+        self._sink = None
+        self._mode = None
+        return end + 1
+
+    def finish(self):
+        """The parsed document, with streamed strings replaced."""
+        if self._mode is not None or self._stack:
+            self.abort()
+            raise ValueError("Invalid JSON: unexpected end of document")
+        try:
+            return orjson.loads(bytes(self._out))
+        except orjson.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}") from None
+
+    def abort(self):
+        """Discard the files of strings that were still being streamed."""
+        for sink in self._sinks:
+            sink.abort()
+        self._sinks.clear()
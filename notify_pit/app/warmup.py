@@ -0,0 +1,61 @@
+# Warm-up after startup, so the first wave of requests after a restart
+# doesn't pay for opening database connections, compiling the dashboard
+# template and loading Notify templates. It also indexes keys newly added to
+# PIT_PROMOTED_KEYS for notifications that already exist, unless `python -m
+# app serve` has done that once before starting the workers. /readyz reports
+# not ready until this has finished.
+import logging
+import time
+
+from . import crud
+from .config import env_bool
+
+logger = logging.getLogger(__name__)
+
+# Outcome of run(), reported by /readyz
+state = {"status": "pending"}
+
+
+def open_connections(engine) -> int:
+    """Open (then return to the pool) as many connections as the pool keeps."""
+    size = getattr(engine.pool, "size", None)
+    count = size() if callable(size) else 1
+    connections = [engine.connect() for _ in range(count)]
+    for conn in connections:
+        conn.exec_driver_sql("SELECT 1")
+        conn.close()
+    return count
+
+
+def run(engine, session_factory, jinja_env):
+    start = time.perf_counter()
+    state.update(status="running")
+    try:
+        connections = open_connections(engine)
+        jinja_env.get_template("dashboard.html")
+        with session_factory() as db:
+            templates = crud.preload_templates(db)
+            promoted = (
+                crud.promote_existing(db)
+                if env_bool("PIT_PROMOTE_EXISTING", True)
+                else 0
+            )
+    except Exception as e:
+        # Warm-up only saves time; a failure shouldn't keep the pit out of service
+        logger.exception("Warm-up failed")
+        state.clear()
+        state.update(status="failed", error=f"{type(e).__name__}: {e}")
+        return state
+    state.clear()
+    state.update(
+        status="done",
+        connections=connections,
+        templates=templates,
+        promoted_values=promoted,
+        duration_ms=round((time.perf_counter() - start) * 1000, 1),
+    )
+    return state
+
+
+def finished() -> bool:
+    return state["status"] in ("done", "failed")
@@ -0,0 +1,104 @@
+# Compares the ORM + jsonable_encoder path that /pit/notifications used to take
+# with the Core row + orjson path it takes now.
+#
+# Run from the notify_pit directory:
+#
+#   python -m benchmarks.list_notifications --rows 100000
+#
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+from app.database import Base
+from app.responses import ORJSONResponse
+
+
+def seed(session_factory, rows):
+    now = datetime.now(timezone.utc)
+    batch = []
+    with session_factory() as db:
+        for i in range(rows):
+            batch.append(
+                {
+                    "id": str(uuid.uuid4()),
+                    "type": "sms" if i % 2 else "email",
+                    "created_at": now,
+                    "template_id": str(uuid.uuid4()),
+                    "reference": f"ref-{i}",
+                    "phone_number": "07700900000" if i % 2 else None,
+                    "email_address": None if i % 2 else "test@example.com",
+                    "personalisation": {"username": f"user{i}", "password": "pw"},
+                    "status": "created",
+                }
+            )
+            if len(batch) == 10_000:
+                db.execute(insert(models.Notification), batch)
+                batch = []
+        if batch:
+            db.execute(insert(models.Notification), batch)
+        db.commit()
+
+
+def orm_path(db):
+    notifications = db.query(models.Notification).all()
+    return JSONResponse(jsonable_encoder(notifications)).body
+
+
+def core_path(db):
+    return ORJSONResponse(crud.get_notification_rows(db)).body
+
+
+def measure(session_factory, fn):
+    # Time and memory are taken from separate runs: tracemalloc slows
+    # allocation-heavy code down far too much to time it at the same time.
+    with session_factory() as db:
+        start = time.perf_counter()
+        body = fn(db)
+        elapsed = time.perf_counter() - start
+    del body
+    with session_factory() as db:
+        tracemalloc.start()
+        body = fn(db)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "seconds": round(elapsed, 3),
+        "peak_mib": round(peak / 1024 / 1024, 1),
+        "bytes": len(body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        seed(session_factory, args.rows)
+
+        results = {
+            "rows": args.rows,
+            "orm_jsonable_encoder": measure(session_factory, orm_path),
+            "core_orjson": measure(session_factory, core_path),
+        }
+        engine.dispose()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
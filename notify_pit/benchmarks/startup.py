@@ -0,0 +1,86 @@
+# Measures cold start: importing app.main plus the startup migration step,
+# each in a fresh interpreter, against a fresh database, a database already at
+# head (the fast path) and the same database upgraded through Alembic as
+# startup used to do.
+#
+# Run from the notify_pit directory:
+#
+#   python -m benchmarks.startup --repeats 10
+#
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+from app import migrations
+if sys.argv[1] == "alembic":
+    migrations.upgrade()
+else:
+    migrations.run(app.main.engine)
+done = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "migrate_ms": (done - imported) * 1000,
+    "alembic_imported": "alembic.command" in sys.modules,
+}))
+"""
+
+
+def run_child(database_url: str, mode: str) -> dict:
+    env = {**os.environ, "DATABASE_URL": database_url}
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, mode],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(out.splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def summarise(runs) -> dict:
+    return {
+        key: round(statistics.median(r[key] for r in runs), 1)
+        for key in ("import_ms", "migrate_ms", "process_ms")
+    } | {"alembic_imported": runs[0]["alembic_imported"]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {"repeats": args.repeats}
+    with tempfile.TemporaryDirectory() as tmp:
+        fresh = []
+        for i in range(args.repeats):
+            url = f"sqlite:///{os.path.join(tmp, f'fresh{i}.db')}"
+            fresh.append(run_child(url, "fast"))
+        results["fresh_database"] = summarise(fresh)
+
+        url = f"sqlite:///{os.path.join(tmp, 'head.db')}"
+        run_child(url, "fast")
+        results["at_head_fast_path"] = summarise(
+            [run_child(url, "fast") for _ in range(args.repeats)]
+        )
+        results["at_head_alembic"] = summarise(
+            [run_child(url, "alembic") for _ in range(args.repeats)]
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
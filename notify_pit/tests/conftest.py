@@ -1,9 +1,18 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
+from app import crud, models, schemas
+from app.auth import SECRET
+from app.blobstore import BlobStore
+
 # Import models so Base.metadata is populated
 from app.database import Base, get_db
 from app.main import app as fastapi_app
@@ -42,3 +51,69 @@ def client(db_session):
     fastapi_app.dependency_overrides[get_db] = override_get_db
     yield TestClient(fastapi_app)
     fastapi_app.dependency_overrides.clear()
+
+
+# Helpers shared by several test modules
+
+TEMPLATE_ID = "550e8400-e29b-41d4-a716-446655440000"
+
+# A fixed "now" for tests that age notifications
+NOW = datetime(2026, 1, 10, tzinfo=timezone.utc)
+
+
+def get_token(secret=SECRET, iat=None):
+    """Helper to generate JWTs with configurable timing/secrets."""
+    payload = {"iss": "test-service", "iat": iat or int(time.time())}
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def headers():
+    return {
+        "Authorization": f"Bearer {get_token()}",
+        "Content-Type": "application/json",
+    }
+
+
+def send(client, channel, **payload):
+    """Send through the API; returns the new notification's id."""
+    response = client.post(
+        f"/v2/notifications/{channel}",
+        json={"template_id": TEMPLATE_ID, **payload},
+        headers={"Authorization": f"Bearer {get_token()}"},
+    )
+    return response.json()["id"]
+
+
+def send_sms(db, phone_number):
+    """Create an SMS through crud, without a request."""
+    payload = schemas.SmsRequest(phone_number=phone_number, template_id=TEMPLATE_ID)
+    return crud.create_notification(db, payload, type="sms", phone_number=phone_number)
+
+
+def add_notifications(db, type, count, age_days=0):
+    created_at = NOW - timedelta(days=age_days)
+    for i in range(count):
+        db.add(
+            models.Notification(type=type, created_at=created_at + timedelta(seconds=i))
+        )
+    db.commit()
+
+
+def remaining(db, type):
+    return db.query(models.Notification).filter_by(type=type).count()
+
+
+@pytest.fixture
+def blobs(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / "blobs"))
+    monkeypatch.setattr(crud, "blobs", store)
+    return store
+
+
+def stored_files(blobs):
+    return [
+        name
+        for _, _, names in os.walk(blobs.directory)
+        for name in names
+        if name != ".lock"
+    ]
@@ -1,14 +1,10 @@
+import csv
+import gzip
+import io
+import json
 import time
 
-import jwt
-
-from app.auth import SECRET
-
-
-def get_token(secret=SECRET, iat=None):
-    """Helper to generate JWTs with configurable timing/secrets."""
-    payload = {"iss": "test-service", "iat": iat or int(time.time())}
-    return jwt.encode(payload, secret, algorithm="HS256")
+from tests.conftest import get_token
 
 
 def test_dashboard_at_root(client):
@@ -323,3 +319,91 @@ def test_pit_reset(client):
     # Check template list directly via v2 to ensure it's empty
     res_t = client.get("/v2/templates", headers={"Authorization": f"Bearer {token}"})
     assert res_t.json()["templates"] == []
+
+
+def test_pit_notifications_rows(client):
+    client.delete("/pit/reset")
+    token = get_token()
+    r = client.post(
+        "/v2/notifications/sms",
+        json={
+            "phone_number": "07700900000",
+            "template_id": "550e8400-e29b-41d4-a716-446655440000",
+            "personalisation": {"username": "user1"},
+            "reference": "ref-1",
+        },
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    res = client.get("/pit/notifications")
+    assert res.status_code == 200
+    [row] = res.json()
+    assert row["id"] == r.json()["id"]
+    assert row["type"] == "sms"
+    assert row["reference"] == "ref-1"
+    assert row["personalisation"] == {"username": "user1"}
+    assert row["status"] == "created"
+    assert row["created_at"].startswith("20")
+
+
+def _seed_mixed(client):
+    client.delete("/pit/reset")
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    template_id = "550e8400-e29b-41d4-a716-446655440000"
+    client.post(
+        "/v2/notifications/sms",
+        json={"phone_number": "07700900000", "template_id": template_id},
+        headers=headers,
+    )
+    client.post(
+        "/v2/notifications/email",
+        json={
+            "email_address": "test@example.com",
+            "template_id": template_id,
+            "personalisation": {"name": "Amala"},
+        },
+        headers=headers,
+    )
+
+
+def test_pit_notifications_filters(client):
+    _seed_mixed(client)
+
+    res = client.get("/pit/notifications?type=email")
+    assert [n["type"] for n in res.json()] == ["email"]
+    assert client.get("/pit/notifications?status=delivered").json() == []
+    assert (
+        client.get("/pit/notifications?created_after=2000-01-01T00:00:00Z").json() != []
+    )
+    assert (
+        client.get("/pit/notifications?created_before=2000-01-01T00:00:00Z").json()
+        == []
+    )
+
+
+def test_export_ndjson(client):
+    _seed_mixed(client)
+
+    res = client.get("/pit/notifications/export?type=email")
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/x-ndjson"
+    [row] = [json.loads(line) for line in res.text.splitlines()]
+    assert row["email_address"] == "test@example.com"
+    assert row["personalisation"] == {"name": "Amala"}
+
+
+def test_export_csv_gzip(client):
+    _seed_mixed(client)
+
+    res = client.get("/pit/notifications/export?format=csv&gzip=true")
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/gzip"
+    assert "notifications.csv.gz" in res.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(res.content).decode())))
+    assert sorted(r["type"] for r in rows) == ["email", "sms"]
+    email = next(r for r in rows if r["type"] == "email")
+    assert json.loads(email["personalisation"]) == {"name": "Amala"}
+
+
+def test_export_rejects_unknown_format(client):
+    assert client.get("/pit/notifications/export?format=xml").status_code == 422
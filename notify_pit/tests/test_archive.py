@@ -0,0 +1,121 @@
+import asyncio
+import gzip
+from datetime import datetime, timedelta, timezone
+
+import orjson
+
+from app import main
+from app.archive import Archive
+from app.retention import Policy, RetentionPurger
+from tests.conftest import NOW, TestingSessionLocal, add_notifications, remaining
+
+
+def row(id, type, created_at, status="delivered"):
+    return {"id": id, "type": type, "status": status, "created_at": created_at}
+
+
+def test_segments_record_their_time_range(tmp_path):
+    archive = Archive(str(tmp_path), codec="gzip")
+    assert archive.newest() is None
+    archive.append([row("a", "sms", NOW), row("b", "sms", NOW + timedelta(hours=1))])
+
+    (segment,) = archive.segments()
+    assert segment["rows"] == 2
+    assert segment["max_created_at"] == "2026-01-10T01:00:00+00:00"
+    assert archive.newest() == NOW + timedelta(hours=1)
+    with gzip.open(tmp_path / segment["file"]) as f:
+        assert [orjson.loads(line)["id"] for line in f] == ["a", "b"]
+
+
+def test_reads_only_overlapping_segments(tmp_path, monkeypatch):
+    archive = Archive(str(tmp_path), codec="gzip")
+    archive.append([row("old", "sms", NOW - timedelta(days=5))])
+    archive.append(
+        [row("sms", "sms", NOW), row("email", "email", NOW, status="failed")]
+    )
+
+    opened = []
+    original = archive._open
+    monkeypatch.setattr(
+        archive, "_open", lambda segment: opened.append(segment) or original(segment)
+    )
+    rows = list(archive.iter_rows(type="sms", created_after=NOW - timedelta(days=1)))
+    assert [r["id"] for r in rows] == ["sms"]
+    assert rows[0]["created_at"] == NOW
+    assert [s["number"] for s in opened] == [2]
+
+    assert not archive.reaches(None)
+    assert not archive.reaches(NOW + timedelta(seconds=1))
+    assert archive.reaches(NOW.replace(tzinfo=None))
+
+
+def test_ids_are_found_through_the_index(tmp_path, monkeypatch):
+    archive = Archive(str(tmp_path), codec="gzip")
+    archive.append([row(f"first-{n}", "sms", NOW) for n in range(5)])
+    archive.append([row("second-10", "sms", NOW), row("second-2", "email", NOW)])
+
+    opened = []
+    original = archive._open
+    monkeypatch.setattr(
+        archive, "_open", lambda segment: opened.append(segment) or original(segment)
+    )
+    assert archive.get("first-3")["created_at"] == NOW
+    assert archive.get("second-2")["type"] == "email"
+    assert archive.get("first-9") is None
+    assert archive.get("x" * 20) is None
+    # Only the segment holding each id was decompressed
+    assert [s["number"] for s in opened] == [1, 2]
+
+    # Segments archived before the index existed are searched in full
+    segments = archive.segments()
+    del segments[0]["ids"]
+    archive._save_segments(segments)
+    assert archive.get("first-4")["id"] == "first-4"
+
+
+def test_retention_archives_before_deleting(db_session, client, tmp_path, monkeypatch):
+    archive = Archive(str(tmp_path))
+    add_notifications(db_session, "sms", 5, age_days=10)
+    add_notifications(db_session, "sms", 1)
+
+    purger = RetentionPurger(
+        TestingSessionLocal,
+        {"sms": Policy(max_age=86400)},
+        batch_size=2,
+        pause=0,
+        clock=lambda: NOW.timestamp(),
+        archive=archive,
+    )
+    asyncio.run(purger.purge_once())
+    assert remaining(db_session, "sms") == 1
+    assert [s["rows"] for s in archive.segments()] == [2, 2, 1]
+
+    monkeypatch.setattr(main, "notification_archive", archive)
+    assert len(client.get("/pit/notifications").json()) == 1
+    since = (NOW - timedelta(days=30)).isoformat()
+    listed = client.get("/pit/notifications", params={"created_after": since})
+    assert len(listed.json()) == 6
+
+    exported = client.get(
+        "/pit/notifications/export", params={"created_after": since}
+    ).text.splitlines()
+    assert len(exported) == 6
+    first = orjson.loads(exported[0])
+    assert datetime.fromisoformat(first["created_at"]).replace(
+        tzinfo=timezone.utc
+    ) == NOW - timedelta(days=10)
+
+    # Archived notifications are still found by id
+    found = client.get(f"/pit/notifications/{first['id']}")
+    assert found.status_code == 200 and found.json()["id"] == first["id"]
+    preview = client.get(f"/pit/notifications/{first['id']}/preview")
+    assert preview.json()["detail"] == "No preview for sms notifications"
+    assert client.get("/pit/notifications/missing").status_code == 404
+
+    # Reset empties the archive along with the table
+    client.delete("/pit/reset")
+    assert archive.segments() == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == [".lock", "manifest.json"]
+    assert client.get(f"/pit/notifications/{first['id']}").status_code == 404
+    listed = client.get("/pit/notifications", params={"created_after": since})
+    assert listed.json() == []
@@ -0,0 +1,91 @@
+import os
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.assets import IMMUTABLE_CACHE, CachedStaticFiles, precompress
+from app.compression import compress, negotiate, supported_encodings
+
+CSS = b"body { color: #0b0c0c; }\n" * 200
+
+
+def static_client(directory):
+    app = FastAPI()
+    app.mount("/static", CachedStaticFiles(directory=directory), name="static")
+    return TestClient(app)
+
+
+def test_precompressed_variant_served(tmp_path):
+    (tmp_path / "site-1.2.3.css").write_bytes(CSS)
+    written = precompress(str(tmp_path))
+    assert os.path.join(str(tmp_path), "site-1.2.3.css.gz") in written
+    # A second run leaves fresh variants alone
+    assert precompress(str(tmp_path)) == []
+
+    client = static_client(str(tmp_path))
+    r = client.get("/static/site-1.2.3.css", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["content-type"].startswith("text/css")
+    assert r.headers["cache-control"] == IMMUTABLE_CACHE
+    assert r.headers["vary"] == "Accept-Encoding"
+    assert int(r.headers["content-length"]) < len(CSS)
+    assert r.content == CSS
+
+    raw = client.get("/static/site-1.2.3.css", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in raw.headers
+    assert raw.content == CSS
+
+
+def test_missing_brotli_variant_falls_back_to_gzip(tmp_path):
+    (tmp_path / "site.css").write_bytes(CSS)
+    (tmp_path / "site.css.gz").write_bytes(compress(CSS, "gzip"))
+    r = static_client(str(tmp_path)).get(
+        "/static/site.css", headers={"Accept-Encoding": "br, gzip"}
+    )
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.content == CSS
+
+
+def test_unversioned_assets_get_short_cache(tmp_path):
+    (tmp_path / "favicon.ico").write_bytes(b"\x00" * 10)
+    r = static_client(str(tmp_path)).get("/static/favicon.ico")
+    assert r.headers["cache-control"] == "public, max-age=86400"
+
+
+def test_static_and_assets_share_one_mount(client):
+    css = client.get("/static/govuk-frontend-5.13.0.min.css")
+    assert css.status_code == 200
+    assert css.headers["cache-control"] == IMMUTABLE_CACHE
+    assert client.get("/assets/govuk-frontend-5.13.0.min.css").content == css.content
+
+
+def test_negotiate():
+    assert negotiate("gzip, deflate") == "gzip"
+    assert negotiate("gzip;q=0") is None
+    assert negotiate("*") == supported_encodings()[0]
+    assert negotiate("") is None
+
+
+def test_large_json_is_compressed(client, db_session):
+    from app import crud
+
+    client.delete("/pit/reset")
+    for i in range(20):
+        crud.create_received_text(db_session, "07700900000", f"message {i}")
+
+    r = client.get("/pit/notifications", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert len(r.json()) == 20
+
+    assert r.headers["vary"] == "Accept-Encoding"
+
+    small = client.get("/healthcheck", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert "vary" not in small.headers
+
+    plain = client.get("/pit/notifications", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    # Could have been compressed, so caches must key on Accept-Encoding
+    assert plain.headers["vary"] == "Accept-Encoding"
+    assert len(plain.json()) == 20
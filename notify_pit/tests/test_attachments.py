@@ -0,0 +1,100 @@
+import base64
+import os
+
+from app import crud, models, schemas
+from tests.conftest import headers, stored_files
+
+TEMPLATE_ID = "550e8400-e29b-41d4-a716-446655440000"
+REPORT = b"name,score\n" + os.urandom(300_000)
+
+
+def upload(data=REPORT, filename="report.csv"):
+    # The shape of notifications_python_client.prepare_upload()
+    return {
+        "file": base64.b64encode(data).decode(),
+        "filename": filename,
+        "confirm_email_before_download": True,
+        "retention_period": "26 weeks",
+    }
+
+
+def send_email(client, **personalisation):
+    return client.post(
+        "/v2/notifications/email",
+        json={
+            "template_id": TEMPLATE_ID,
+            "email_address": "a@example.com",
+            "personalisation": personalisation,
+        },
+        headers=headers(),
+    )
+
+
+def test_attachments_are_stored_once_by_reference(client, db_session, blobs):
+    first = send_email(client, report=upload(), name="Ada").json()["id"]
+    second = send_email(client, report=upload(filename="copy.csv")).json()["id"]
+
+    row = db_session.get(models.Notification, first)
+    reference = row.personalisation["report"]
+    assert row.personalisation["name"] == "Ada"
+    assert reference["filename"] == "report.csv"
+    assert reference["retention_period"] == "26 weeks"
+    assert reference["file"]["size"] == len(REPORT)
+    assert stored_files(blobs) == [reference["file"]["sha256"]]
+
+    download = client.get(f"/pit/notifications/{first}/attachments/report")
+    assert download.status_code == 200
+    assert download.content == REPORT
+    assert download.headers["content-type"].startswith("text/csv")
+    assert 'filename="report.csv"' in download.headers["content-disposition"]
+    assert client.get(f"/pit/notifications/{first}/attachments/name").status_code == 404
+
+    # The shared file goes with the last notification using it
+    crud.delete_notifications(db_session, [first])
+    assert blobs.exists(reference["file"]["sha256"])
+    # Past the grace period an upload of the same file would have had
+    blobs.grace = 0
+    crud.delete_notifications(db_session, [second])
+    assert stored_files(blobs) == []
+
+
+def test_attachments_outside_the_streamed_path(db_session, blobs):
+    payload = schemas.SmsRequest(
+        template_id=TEMPLATE_ID,
+        phone_number="07700900000",
+        personalisation={"report": upload(b"hello"), "note": {"file": 1}},
+    )
+    row = crud.create_notification(db_session, payload, "sms")
+    assert row.personalisation["report"]["file"]["size"] == 5
+    assert row.personalisation["note"] == {"file": 1}
+    # The request itself is left untouched
+    assert isinstance(payload.personalisation["report"]["file"], str)
+    assert db_session.query(models.NotificationFile).count() == 1
+
+
+def test_rejected_attachments_leave_nothing_behind(client, db_session, blobs):
+    invalid = send_email(client, report={"file": "not*base64"})
+    assert invalid.status_code == 400
+    assert invalid.json()["errors"][0]["message"].startswith("File attachment:")
+
+    no_address = client.post(
+        "/v2/notifications/email",
+        json={"template_id": TEMPLATE_ID, "personalisation": {"report": upload()}},
+        headers=headers(),
+    )
+    assert no_address.status_code == 422
+    assert stored_files(blobs) == []
+    assert db_session.query(models.Notification).count() == 0
+
+
+def test_attachments_with_extra_keys_are_recorded(client, db_session, blobs):
+    sent = send_email(client, report={**upload(), "note": "extra"}).json()["id"]
+    row = db_session.get(models.Notification, sent)
+    assert row.personalisation["report"]["note"] == "extra"
+    sha256 = row.personalisation["report"]["file"]["sha256"]
+    files = db_session.query(models.NotificationFile).all()
+    assert [(f.notification_id, f.sha256) for f in files] == [(sent, sha256)]
+
+    blobs.grace = 0
+    crud.delete_notifications(db_session, [sent])
+    assert stored_files(blobs) == []
@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import bench, database
+from app.main import app
+
+
+def test_parse_mix():
+    assert bench.parse_mix("sms=3,received") == {"sms": 3.0, "received": 1.0}
+    with pytest.raises(ValueError):
+        bench.parse_mix("fax=1")
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert bench.percentile(values, 50) == 50
+    assert bench.percentile(values, 99) == 99
+    assert bench.percentile([], 50) is None
+
+
+def test_in_process_run(client):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://notify-pit"
+        ) as http:
+            return await bench.run(
+                http,
+                bench.parse_mix("sms=2,email=1,letter=1,received=1,preview=1,list=1"),
+                concurrency=4,
+                requests=40,
+                seed=1,
+            )
+
+    result = asyncio.run(scenario())
+    assert result["requests"] == 40
+    assert result["errors"] == {}
+    assert set(result["status_codes"]) <= {"200", "201"}
+    assert result["latency_ms"]["p50"] <= result["latency_ms"]["p99"]
+    assert sum(op["count"] for op in result["operations"].values()) == 40
+
+
+def test_a_full_pool_does_not_stall_the_event_loop(tmp_path, monkeypatch):
+    # Far more concurrent requests than connections: requests waiting for
+    # one must not block the requests that would return it
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'bench.db'}",
+        connect_args={"check_same_thread": False},
+        pool_size=2,
+        max_overflow=0,
+        pool_timeout=5,
+    )
+    database.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(
+        database, "SessionLocal", sessionmaker(autoflush=False, bind=engine)
+    )
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://notify-pit"
+        ) as http:
+            return await asyncio.wait_for(
+                bench.run(
+                    http, bench.parse_mix("sms=1,list=1"), concurrency=20, requests=60
+                ),
+                timeout=30,
+            )
+
+    result = asyncio.run(scenario())
+    engine.dispose()
+    assert result["requests"] == 60
+    assert result["errors"] == {}
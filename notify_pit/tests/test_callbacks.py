@@ -0,0 +1,185 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app import crud, schemas
+from app.callbacks import CallbackDispatcher, Delivery
+from tests.conftest import TestingSessionLocal
+
+SERVICE_ID = "test-service"
+
+
+class Receiver:
+    """Stand-in for a service's callback handler."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.received = []
+        self.app = FastAPI()
+
+        @self.app.post("/callback")
+        async def callback(request: Request):
+            if self.failures:
+                self.failures -= 1
+                return JSONResponse({}, status_code=503)
+            self.received.append(
+                (request.headers["authorization"], await request.json())
+            )
+            return {}
+
+    def transport(self):
+        return httpx.ASGITransport(app=self.app)
+
+
+def configure(db, callback_type):
+    crud.set_service_callback(
+        db,
+        schemas.ServiceCallbackRequest(
+            service_id=SERVICE_ID,
+            callback_type=callback_type,
+            url="http://receiver/callback",
+            bearer_token="secret-token",
+        ),
+    )
+
+
+def run(dispatcher, trigger, until):
+    async def scenario():
+        dispatcher.start()
+        trigger()
+        for _ in range(200):
+            if until():
+                break
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+
+    asyncio.run(scenario())
+
+
+def test_delivery_status_callback(db_session):
+    configure(db_session, "delivery_status")
+    payload = schemas.SmsRequest(
+        phone_number="07700900000",
+        template_id="550e8400-e29b-41d4-a716-446655440000",
+        reference="ref-1",
+    )
+    n = crud.create_notification(
+        db_session, payload, "sms", phone_number="07700900000", service_id=SERVICE_ID
+    )
+    receiver = Receiver()
+    dispatcher = CallbackDispatcher(TestingSessionLocal, transport=receiver.transport())
+
+    run(
+        dispatcher,
+        lambda: dispatcher.status_changed([(n.id, "sending"), (n.id, "delivered")]),
+        lambda: receiver.received,
+    )
+
+    [(auth, body)] = receiver.received
+    assert auth == "Bearer secret-token"
+    assert body["id"] == n.id
+    assert body["status"] == "delivered"
+    assert body["reference"] == "ref-1"
+    assert body["to"] == "07700900000"
+    assert dispatcher.metrics()["sent"] == 1
+
+
+def test_inbound_sms_callback_retries(db_session):
+    configure(db_session, "inbound_sms")
+    n = crud.create_received_text(
+        db_session, "07700900123", "STOP", service_id=SERVICE_ID
+    )
+    receiver = Receiver(failures=2)
+    dispatcher = CallbackDispatcher(
+        TestingSessionLocal, base_delay=0.01, transport=receiver.transport()
+    )
+
+    run(
+        dispatcher,
+        lambda: dispatcher.inbound_received(n.id),
+        lambda: receiver.received,
+    )
+
+    [(_, body)] = receiver.received
+    assert body["source_number"] == "07700900123"
+    assert body["message"] == "STOP"
+    metrics = dispatcher.metrics()
+    assert metrics["failed"] == 2
+    assert metrics["sent"] == 1
+    assert metrics["retry_depth"] == 0
+
+
+def test_services_without_callbacks_are_skipped(db_session):
+    n = crud.create_received_text(db_session, "07700900123", "Hi", service_id="other")
+    dispatcher = CallbackDispatcher(TestingSessionLocal)
+    assert dispatcher.resolve([("inbound_sms", n.id, None)]) == []
+
+
+def test_gives_up_after_max_attempts():
+    async def scenario():
+        dispatcher = CallbackDispatcher(
+            None,
+            max_attempts=2,
+            base_delay=0.001,
+            transport=httpx.MockTransport(lambda request: httpx.Response(500)),
+        )
+        dispatcher.start()
+        await dispatcher._deliveries.put(Delivery("http://x/cb", "t", {}))
+        for _ in range(100):
+            if dispatcher.dropped_retries_exhausted:
+                break
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        return dispatcher.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["failed"] == 2
+    assert metrics["dropped_retries_exhausted"] == 1
+    assert metrics["dropped_queue_full"] == 0
+
+
+def test_full_queue_drops_are_counted_separately():
+    dispatcher = CallbackDispatcher(None)
+    dispatcher._events = asyncio.Queue(maxsize=1)
+    dispatcher.inbound_received("a")
+    dispatcher.inbound_received("b")
+    metrics = dispatcher.metrics()
+    assert metrics["dropped_queue_full"] == 1
+    assert metrics["dropped_retries_exhausted"] == 0
+
+
+def test_callback_config_endpoints(client):
+    body = {
+        "service_id": SERVICE_ID,
+        "callback_type": "delivery_status",
+        "url": "https://example.com/cb",
+        "bearer_token": "token-1",
+    }
+    assert client.post("/pit/callback", json=body).status_code == 200
+    body["url"] = "https://example.com/cb2"
+    client.post("/pit/callback", json=body)
+
+    [callback] = client.get("/pit/callbacks").json()
+    assert callback["url"] == "https://example.com/cb2"
+
+    assert client.get("/pit/callbacks/metrics").json()["sent"] == 0
+    assert (
+        client.delete(f"/pit/callback/{SERVICE_ID}/delivery_status").status_code == 200
+    )
+    assert (
+        client.delete(f"/pit/callback/{SERVICE_ID}/delivery_status").status_code == 404
+    )
+
+
+def test_inject_received_text(client):
+    client.delete("/pit/reset")
+    r = client.post(
+        "/pit/received-text-messages",
+        json={"phone_number": "07700900123", "content": "Hello"},
+    )
+    assert r.status_code == 201
+    [row] = client.get("/pit/notifications").json()
+    assert row["id"] == r.json()["id"]
+    assert row["content"] == "Hello"
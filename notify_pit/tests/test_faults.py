@@ -0,0 +1,102 @@
+import random
+import time
+
+import pytest
+
+from app import main
+from app.faults import BUILTIN_PROFILES, sample_latency
+from app.schemas import LatencySpec
+from tests.conftest import get_token
+
+SMS = {
+    "phone_number": "07700900000",
+    "template_id": "550e8400-e29b-41d4-a716-446655440000",
+}
+
+
+@pytest.fixture(autouse=True)
+def reset_faults():
+    yield
+    main.fault_injector.profiles = dict(BUILTIN_PROFILES)
+    main.fault_injector.active = "none"
+
+
+def send(client, **headers):
+    headers["Authorization"] = f"Bearer {get_token()}"
+    return client.post("/v2/notifications/sms", json=SMS, headers=headers)
+
+
+def test_latency_distributions():
+    rng = random.Random(7)
+    assert sample_latency(LatencySpec(ms=250), rng) == 0.25
+
+    normal = LatencySpec(distribution="normal", mean_ms=100, stddev_ms=10)
+    samples = [sample_latency(normal, rng) for _ in range(1000)]
+    assert 0.095 < sum(samples) / len(samples) < 0.105
+
+    tail = LatencySpec(
+        distribution="percentiles", percentiles={50: 10, 99: 1000, 100: 2000}
+    )
+    samples = sorted(sample_latency(tail, rng) for _ in range(10000))
+    assert samples[0] == 0.01
+    assert samples[4000] == 0.01
+    assert 0.5 < samples[9800] < 1.0
+    assert samples[-1] <= 2.0
+
+
+def test_config_switches_profile(client):
+    r = client.put(
+        "/pit/config",
+        json={
+            "fault_profile": "broken",
+            "profiles": {
+                "broken": {
+                    "/v2/notifications/*": {"error_rate": 1, "error_status": 503}
+                }
+            },
+        },
+    )
+    assert r.status_code == 200
+    assert r.json()["fault_profile"] == "broken"
+    assert "broken" in client.get("/pit/config").json()["profiles"]
+
+    r = send(client)
+    assert r.status_code == 503
+    assert r.json()["errors"][0]["error"] == "ServiceUnavailable"
+    # Other routes and the pit's own endpoints are unaffected
+    assert client.get("/healthcheck").status_code == 200
+    assert client.get("/pit/notifications").status_code == 200
+
+    client.put("/pit/config", json={"fault_profile": "none"})
+    assert send(client).status_code == 201
+
+
+def test_header_selects_profile_per_request(client):
+    client.put(
+        "/pit/config",
+        json={
+            "profiles": {
+                "sluggish": {"/v2/*": {"latency": {"distribution": "fixed", "ms": 50}}}
+            }
+        },
+    )
+    start = time.perf_counter()
+    assert send(client, **{"X-Pit-Fault-Profile": "sluggish"}).status_code == 201
+    assert time.perf_counter() - start >= 0.05
+
+    assert send(client, **{"X-Pit-Fault-Profile": "missing"}).status_code == 400
+
+
+def test_injected_timeout(client):
+    client.put(
+        "/pit/config",
+        json={
+            "fault_profile": "hang",
+            "profiles": {"hang": {"/v2/*": {"timeout_rate": 1, "timeout_seconds": 0}}},
+        },
+    )
+    assert send(client).status_code == 504
+
+
+def test_unknown_profile_rejected(client):
+    assert client.put("/pit/config", json={"fault_profile": "nope"}).status_code == 400
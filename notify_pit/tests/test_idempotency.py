@@ -0,0 +1,117 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+from app.auth import SECRET
+from app.cache import TTLCache
+from app.database import Base
+from tests.conftest import send
+
+TEMPLATE_ID = "550e8400-e29b-41d4-a716-446655440000"
+
+
+@pytest.fixture
+def idempotent(monkeypatch):
+    monkeypatch.setattr(crud, "IDEMPOTENCY_WINDOW", 60.0)
+    monkeypatch.setattr(crud, "recent_sends", TTLCache("idempotency", ttl=60.0))
+
+
+def sms(client, reference=None):
+    return send(client, "sms", phone_number="07700900000", reference=reference)
+
+
+def count(db):
+    return db.query(models.Notification).count()
+
+
+def test_off_by_default(client, db_session):
+    assert sms(client, "ref-1") != sms(client, "ref-1")
+    assert count(db_session) == 2
+
+
+def test_repeats_return_the_original(client, db_session, idempotent):
+    first = sms(client, "ref-1")
+    assert sms(client, "ref-1") == first
+    assert sms(client, "ref-2") != first
+    assert sms(client) != sms(client)
+    assert count(db_session) == 4
+
+    # A cold cache (a restart, or another worker) falls back on the key
+    crud.recent_sends.clear()
+    assert sms(client, "ref-1") == first
+    assert count(db_session) == 4
+    assert db_session.query(models.IdempotencyKey).count() == 2
+
+
+def test_references_are_per_service(client, db_session, idempotent):
+    first = sms(client, "ref-1")
+    token = jwt.encode({"iss": "other-service", "iat": int(time.time())}, SECRET)
+    response = client.post(
+        "/v2/notifications/sms",
+        json={
+            "template_id": TEMPLATE_ID,
+            "phone_number": "07700900000",
+            "reference": "ref-1",
+        },
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.json()["id"] != first
+
+
+def test_a_reference_can_be_reused_after_the_window(client, db_session, idempotent):
+    first = sms(client, "ref-1")
+    key = db_session.query(models.IdempotencyKey).one()
+    key.created_at -= timedelta(seconds=61)
+    db_session.commit()
+    crud.recent_sends.clear()
+
+    second = sms(client, "ref-1")
+    assert second != first
+    assert sms(client, "ref-1") == second
+    assert db_session.query(models.IdempotencyKey).one().notification_id == second
+
+
+def test_a_stale_key_reused_by_two_sends_at_once(tmp_path, idempotent, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pit.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(autoflush=False, bind=engine)
+    key = ("test-service", "ref-1")
+    now = datetime.now(timezone.utc)
+    with Session() as db:
+        db.add(
+            models.IdempotencyKey(
+                service_id=key[0],
+                reference=key[1],
+                notification_id="stale",
+                created_at=now - timedelta(seconds=61),
+            )
+        )
+        db.commit()
+
+    def notification(id):
+        return models.Notification(
+            id=id, type="sms", reference="ref-1", created_at=now, status="created"
+        )
+
+    # The other send takes the stale key over while this one is about to
+    add_notification = crud._add_notification
+
+    def racing_add(db, n, files=()):
+        if n.id == "loser":
+            with Session() as other:
+                crud._commit_idempotent(other, notification("winner"), key)
+        add_notification(db, n, files)
+
+    monkeypatch.setattr(crud, "_add_notification", racing_add)
+    with Session() as db:
+        with pytest.raises(crud.DuplicateSend) as raised:
+            crud._commit_idempotent(db, notification("loser"), key)
+        assert raised.value.notification_id == "winner"
+        keys = db.query(models.IdempotencyKey).all()
+        assert [k.notification_id for k in keys] == ["winner"]
+        assert db.query(models.Notification.id).all() == [("winner",)]
@@ -0,0 +1,132 @@
+import base64
+import os
+
+import pytest
+
+from app import main, models
+from app.uploads import Base64BlobSink, StreamingJSONParser, UploadError
+from tests.conftest import headers, stored_files
+
+PDF = b"%PDF-1.4\n" + os.urandom(200_000) + b"\n%%EOF\n"
+
+
+def post_letter(client, body: bytes):
+    return client.post("/v2/notifications/letter", content=body, headers=headers())
+
+
+def precompiled(pdf=PDF, reference="letter-1", extra=""):
+    content = base64.b64encode(pdf).decode().replace("/", "\\/")
+    return f'{{"reference": "{reference}", "content": "{content}"{extra}}}'.encode()
+
+
+def test_parser_streams_only_the_chosen_strings(blobs):
+    document = precompiled(extra=', "nested": {"content": "kept"}')
+    parser = StreamingJSONParser(
+        lambda path: Base64BlobSink(blobs) if path == ("content",) else None
+    )
+    for start in range(0, len(document), 1000):
+        parser.feed(document[start : start + 1000])
+    body = parser.finish()
+
+    assert body["nested"] == {"content": "kept"}
+    assert body["content"]["size"] == len(PDF)
+    with open(blobs.path(body["content"]["sha256"]), "rb") as f:
+        assert f.read() == PDF
+
+
+def test_invalid_base64_leaves_nothing_behind(blobs):
+    parser = StreamingJSONParser(lambda path: Base64BlobSink(blobs))
+    with pytest.raises(UploadError):
+        parser.feed(b'{"content": "not*base64"}')
+    assert stored_files(blobs) == []
+
+
+def test_precompiled_letter_round_trip(client, db_session, blobs):
+    response = post_letter(client, precompiled(extra=', "postage": "first"'))
+    assert response.status_code == 201
+    body = response.json()
+    assert body["reference"] == "letter-1" and body["postage"] == "first"
+
+    row = db_session.get(models.Notification, body["id"])
+    assert row.file_size == len(PDF) and row.template_id is None
+    assert row.personalisation is None
+
+    pdf = client.get(f"/v2/notifications/{body['id']}/pdf", headers=headers())
+    assert pdf.status_code == 200
+    assert pdf.headers["content-type"] == "application/pdf"
+    assert pdf.content == PDF
+
+    # The same PDF again is stored once
+    second = post_letter(client, precompiled(reference="letter-2")).json()
+    assert db_session.get(models.Notification, second["id"]).postage == "second"
+    assert stored_files(blobs) == [row.file_sha256]
+
+    client.delete("/pit/reset")
+    assert not blobs.exists(row.file_sha256)
+
+
+def test_precompiled_letter_errors(client, blobs):
+    not_pdf = post_letter(client, precompiled(pdf=b"hello world"))
+    assert not_pdf.status_code == 400
+    assert not_pdf.json()["errors"][0]["message"] == "Letter content: not a valid PDF"
+
+    no_reference = post_letter(client, b'{"content": "' + base64.b64encode(PDF) + b'"}')
+    assert no_reference.status_code == 422
+    assert stored_files(blobs) == []
+
+    assert post_letter(client, b'{"content": ').status_code == 422
+    # Streamed in full before the document turned out to be broken
+    broken = b'{"content": "' + base64.b64encode(PDF) + b'", "reference": }'
+    assert post_letter(client, broken).status_code == 422
+    assert stored_files(blobs) == []
+
+
+def test_files_another_send_just_uploaded_are_kept(blobs):
+    sha256, _ = blobs.put(PDF)
+    # A second send uploads the same PDF, and hasn't written its row yet
+    blobs.put(PDF)
+    blobs.remove(sha256)
+    assert blobs.exists(sha256)
+
+    # Not filed again within the grace period
+    blobs.remove(sha256)
+    assert blobs.exists(sha256)
+    blobs.grace = 0
+    blobs.remove(sha256)
+    assert stored_files(blobs) == []
+
+
+def test_templated_letters_still_work(client, blobs):
+    response = post_letter(
+        client,
+        b'{"template_id": "550e8400-e29b-41d4-a716-446655440000",'
+        b' "personalisation": {"address_line_1": "A", "postcode": "SW1A 1AA"}}',
+    )
+    assert response.status_code == 201
+    pdf = client.get(
+        f"/v2/notifications/{response.json()['id']}/pdf", headers=headers()
+    )
+    assert pdf.status_code == 400
+    assert pdf.json()["errors"][0]["error"] == "PDFNotReadyError"
+
+    assert post_letter(client, b'{"personalisation": {}}').status_code == 422
+    missing = client.get(
+        "/v2/notifications/00000000-0000-0000-0000-000000000000/pdf", headers=headers()
+    )
+    assert missing.status_code == 404
+
+
+def test_send_bodies_are_documented():
+    paths = main.app.openapi()["paths"]
+    email = paths["/v2/notifications/email"]["post"]["requestBody"]
+    schema = email["content"]["application/json"]["schema"]
+    assert schema["title"] == "EmailRequest"
+    assert "email_address" in schema["required"]
+
+    letter = paths["/v2/notifications/letter"]["post"]["requestBody"]
+    bodies = letter["content"]["application/json"]["schema"]["anyOf"]
+    assert [body["title"] for body in bodies] == [
+        "LetterRequest",
+        "PrecompiledLetterUpload",
+    ]
+    assert bodies[1]["required"] == ["reference", "content"]
@@ -0,0 +1,122 @@
+import asyncio
+import random
+
+from app import models
+from app.lifecycle import StatusSimulator, normalise_recipient
+from tests.conftest import TestingSessionLocal, send_sms
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def status_of(notification_id):
+    with TestingSessionLocal() as db:
+        return db.get(models.Notification, notification_id).status
+
+
+def test_transitions_follow_delays(db_session):
+    clock = FakeClock()
+    simulator = StatusSimulator(
+        TestingSessionLocal, sending_delay=1, delivery_delay=5, clock=clock
+    )
+    n = send_sms(db_session, "07700900000")
+    simulator.schedule(n)
+
+    assert simulator.pop_due(0.5) == []
+    clock.now = 1
+    batch = simulator.pop_due(clock.now)
+    assert batch == [(n.id, "sending")]
+    simulator.apply(batch)
+    assert status_of(n.id) == "sending"
+
+    assert simulator.pop_due(5.9) == []
+    batch = simulator.pop_due(6)
+    simulator.apply(batch)
+    assert status_of(n.id) == "delivered"
+    assert len(simulator) == 0
+
+
+def test_magic_recipients_force_outcome():
+    simulator = StatusSimulator(None, permanent_failure_rate=1.0)
+    assert simulator.outcome_for("sms", "+44 7700 900003") == "temporary-failure"
+    assert simulator.outcome_for("sms", "07700900002") == "permanent-failure"
+    assert simulator.outcome_for("sms", "07700900111") == "delivered"
+    assert (
+        simulator.outcome_for("email", "Temp-Fail@simulator.notify")
+        == "temporary-failure"
+    )
+    assert simulator.outcome_for("sms", "07123456789") == "permanent-failure"
+    assert normalise_recipient("+447700900000") == "07700900000"
+
+
+def test_outcome_probabilities():
+    simulator = StatusSimulator(
+        None,
+        permanent_failure_rate=0.2,
+        temporary_failure_rate=0.3,
+        rng=random.Random(1),
+    )
+    outcomes = [simulator.outcome_for("email", "a@example.com") for _ in range(2000)]
+    assert 300 < outcomes.count("permanent-failure") < 500
+    assert 500 < outcomes.count("temporary-failure") < 700
+    assert simulator.outcome_for("letter", None) in (
+        "received",
+        "permanent-failure",
+        "temporary-failure",
+    )
+
+
+def test_batches_are_bounded(db_session):
+    clock = FakeClock()
+    simulator = StatusSimulator(
+        TestingSessionLocal, sending_delay=0, batch_size=2, clock=clock
+    )
+    for _ in range(5):
+        simulator.schedule(send_sms(db_session, "07700900000"))
+
+    assert len(simulator.pop_due(0)) == 2
+    assert len(simulator.pop_due(0)) == 2
+    assert len(simulator.pop_due(0)) == 1
+    # Follow-up transitions are queued for later, never in the same batch
+    assert len(simulator) == 5
+
+
+def test_max_pending_drops_excess(db_session):
+    simulator = StatusSimulator(TestingSessionLocal, max_pending=1)
+    simulator.schedule(send_sms(db_session, "07700900000"))
+    simulator.schedule(send_sms(db_session, "07700900000"))
+    assert len(simulator) == 1
+    assert simulator.dropped == 1
+
+
+def test_disabled_simulator_schedules_nothing(db_session):
+    simulator = StatusSimulator(TestingSessionLocal, enabled=False)
+    simulator.schedule(send_sms(db_session, "07700900000"))
+    assert len(simulator) == 0
+
+
+def test_run_loop_applies_and_notifies(db_session):
+    simulator = StatusSimulator(
+        TestingSessionLocal, sending_delay=0.01, delivery_delay=0.01
+    )
+    n = send_sms(db_session, "07700900002")
+    seen = []
+    simulator.listeners.append(seen.extend)
+
+    async def scenario():
+        simulator.start()
+        simulator.schedule(n)
+        for _ in range(100):
+            if len(seen) == 2:
+                break
+            await asyncio.sleep(0.01)
+        await simulator.stop()
+
+    asyncio.run(scenario())
+    assert seen == [(n.id, "sending"), (n.id, "permanent-failure")]
+    assert status_of(n.id) == "permanent-failure"
@@ -0,0 +1,91 @@
+import json
+import os
+
+from app import metrics
+from app.metrics import Registry
+from tests.conftest import get_token
+
+SMS = {
+    "phone_number": "07700900000",
+    "template_id": "550e8400-e29b-41d4-a716-446655440000",
+}
+
+
+def sample(body: str, line_start: str) -> float:
+    for line in body.splitlines():
+        if line.startswith(line_start + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_render_text_format():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ["route"])
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    requests.inc('/a"b')
+    requests.inc('/a"b', amount=2)
+    latency.observe(value=0.05)
+    latency.observe(value=0.5)
+    latency.observe(value=5)
+
+    body = registry.render()
+    assert "# TYPE requests_total counter" in body
+    assert 'requests_total{route="/a\\"b"} 3' in body
+    assert 'latency_seconds_bucket{le="0.1"} 1' in body
+    assert 'latency_seconds_bucket{le="1"} 2' in body
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in body
+    assert "latency_seconds_sum 5.55" in body
+    assert "latency_seconds_count 3" in body
+
+
+def test_multiprocess_snapshots_are_aggregated(tmp_path):
+    def worker(pid, requests, in_flight, rows):
+        registry = Registry()
+        registry.counter("requests_total", "Requests.").inc(amount=requests)
+        registry.gauge("in_flight", "In flight.").set(value=in_flight)
+        registry.gauge("rows", "Rows.", multiprocess_mode="local").set(value=rows)
+        (tmp_path / f"{pid}.json").write_text(json.dumps(registry.snapshot()))
+
+    worker(os.getppid(), requests=5, in_flight=2, rows=10)
+    worker(2**22 + 1, requests=7, in_flight=3, rows=10)  # no such process
+
+    registry = Registry(str(tmp_path))
+    registry.counter("requests_total", "Requests.").inc()
+    registry.gauge("in_flight", "In flight.").set(value=1)
+    registry.gauge("rows", "Rows.", multiprocess_mode="local").set(value=10)
+    body = registry.render()
+
+    # Counters keep dead workers' counts, live gauges only count live workers
+    # and local gauges report this worker's value alone
+    assert sample(body, "requests_total") == 13
+    assert sample(body, "in_flight") == 3
+    assert sample(body, "rows") == 10
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+
+def test_metrics_endpoint(client):
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    route = 'method="POST",route="/v2/notifications/sms",status="201"'
+    before = sample(
+        client.get("/pit/metrics").text, f"notify_pit_requests_total{{{route}}}"
+    )
+    client.post("/v2/notifications/sms", json=SMS, headers=headers)
+    client.post("/v2/notifications/sms", json=SMS, headers=headers)
+    client.get("/v2/template/not-a-real-id", headers=headers)
+
+    response = client.get("/pit/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert sample(body, f"notify_pit_requests_total{{{route}}}") == before + 2
+    assert 'route="/v2/template/{template_id}",status="404"' in body, (
+        "labelled by route template, not by path"
+    )
+    assert f"notify_pit_request_duration_seconds_count{{{route}}}" in body
+    assert sample(body, 'notify_pit_notifications{type="sms",status="created"}') == 2
+
+
+def test_cache_counter_labels():
+    before = metrics.CACHE_REQUESTS.values.get(("test", "hit"), 0)
+    metrics.CACHE_REQUESTS.inc("test", "hit")
+    assert metrics.CACHE_REQUESTS.values[("test", "hit")] == before + 1
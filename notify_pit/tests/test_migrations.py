@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import create_engine
+
+from app import migrations, warmup
+
+
+@pytest.fixture
+def restore_state():
+    saved = dict(migrations.state)
+    yield
+    migrations.state.clear()
+    migrations.state.update(saved)
+
+
+def test_script_heads_match_alembic():
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    scripts = ScriptDirectory.from_config(Config(migrations.ALEMBIC_INI))
+    assert migrations.script_heads() == set(scripts.get_heads())
+
+
+def test_script_heads_with_a_merge(tmp_path):
+    scripts = {
+        "a.py": 'revision = "a"\ndown_revision = None\n',
+        "b.py": 'revision: str = "b"\ndown_revision: str = "a"\n',
+        "c.py": 'revision = "c"\ndown_revision = "a"\n',
+        "d.py": 'revision = "d"\ndown_revision = ("b", "c")\n',
+        "e.py": 'revision = "e"\ndown_revision = "a"\n',
+    }
+    for name, source in scripts.items():
+        (tmp_path / name).write_text(source)
+    assert migrations.script_heads(str(tmp_path)) == {"d", "e"}
+
+
+def test_upgrade_runs_once_then_takes_the_fast_path(
+    tmp_path, monkeypatch, restore_state
+):
+    url = f"sqlite:///{tmp_path / 'pit.db'}"
+    monkeypatch.setenv("DATABASE_URL", url)
+    engine = create_engine(url)
+
+    state = migrations.run(engine)
+    assert state["status"] == "migrated"
+    assert state["current"] == state["head"] == sorted(migrations.script_heads())
+
+    def fail(*args):
+        raise AssertionError("Alembic should not run at head")
+
+    monkeypatch.setattr(migrations, "upgrade", fail)
+    assert migrations.run(engine)["status"] == "up_to_date"
+    assert migrations.ready()
+    engine.dispose()
+
+
+def test_failures_are_reported_by_readyz(client, monkeypatch, restore_state):
+    def broken(*args):
+        raise RuntimeError("no such table: notifications")
+
+    monkeypatch.setattr(migrations, "current_revisions", broken)
+    migrations.run(None)
+
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["migrations"] == {
+        "status": "failed",
+        "error": "RuntimeError: no such table: notifications",
+    }
+
+    migrations.state.clear()
+    migrations.state.update(status="up_to_date", current=["x"], head=["x"])
+    monkeypatch.setitem(warmup.state, "status", "done")
+    assert client.get("/readyz").status_code == 200
@@ -0,0 +1,119 @@
+import pytest
+
+from app import crud, models
+from tests.conftest import send
+
+
+@pytest.fixture
+def promoted(monkeypatch):
+    monkeypatch.setattr(crud, "PROMOTED_KEYS", frozenset({"username", "code"}))
+
+
+def ids(client, **params):
+    return [row["id"] for row in client.get("/pit/notifications", params=params).json()]
+
+
+def test_promoted_keys_are_indexed_on_insert(client, db_session, promoted):
+    ada = send(
+        client,
+        "sms",
+        phone_number="07700900000",
+        personalisation={"username": "ada", "code": 1815, "colour": "green"},
+    )
+    grace = send(
+        client,
+        "email",
+        email_address="g@example.com",
+        personalisation={"username": "grace"},
+    )
+    stored = {
+        (v.notification_id, v.key): v.value
+        for v in db_session.query(models.PersonalisationValue)
+    }
+    assert stored == {
+        (ada, "username"): "ada",
+        (ada, "code"): "1815",
+        (grace, "username"): "grace",
+    }
+
+    assert ids(client, **{"personalisation.username": "ada"}) == [ada]
+    assert ids(client, **{"personalisation.code": "1815"}) == [ada]
+    assert ids(client, **{"personalisation.username": "grace", "type": "sms"}) == []
+    # Keys that aren't promoted are matched inside the JSON instead
+    assert ids(client, **{"personalisation.colour": "green"}) == [ada]
+    assert ids(client, **{"personalisation.colour": "blue"}) == []
+
+    export = client.get(
+        "/pit/notifications/export", params={"personalisation.username": "grace"}
+    )
+    assert len(export.text.splitlines()) == 1
+
+    client.delete("/pit/reset")
+    assert db_session.query(models.PersonalisationValue).count() == 0
+
+
+def test_newly_promoted_keys_are_backfilled(client, db_session, monkeypatch):
+    monkeypatch.setattr(crud, "PROMOTED_KEYS", frozenset({"username"}))
+    ada = send(
+        client,
+        "sms",
+        phone_number="07700900000",
+        personalisation={"username": "ada", "colour": "green"},
+    )
+    assert crud.promote_existing(db_session) == 0
+
+    monkeypatch.setattr(crud, "PROMOTED_KEYS", frozenset({"username", "colour"}))
+    assert crud.promote_existing(db_session) == 1
+    assert ids(client, **{"personalisation.colour": "green"}) == [ada]
+    assert crud.promote_existing(db_session) == 0
+
+
+def test_backfill_works_in_batches_and_skips_copied_values(
+    client, db_session, monkeypatch
+):
+    sent = [
+        send(
+            client,
+            "sms",
+            phone_number="07700900000",
+            personalisation={"colour": colour, "size": n},
+        )
+        for n, colour in enumerate(["red", "green", "blue", "red", "green"])
+    ]
+    monkeypatch.setattr(crud, "PROMOTED_KEYS", frozenset({"colour", "size"}))
+    # Another worker got to one value first
+    db_session.add(
+        models.PersonalisationValue(notification_id=sent[2], key="colour", value="blue")
+    )
+    db_session.commit()
+
+    assert crud.promote_existing(db_session, batch_size=2) == 9
+    assert db_session.query(models.PersonalisationValue).count() == 10
+    assert sorted(ids(client, **{"personalisation.colour": "red"})) == sorted(
+        [sent[0], sent[3]]
+    )
+    assert ids(client, **{"personalisation.size": "4"}) == [sent[4]]
+
+
+def test_unpromoted_values_match_like_promoted_ones(client, promoted):
+    sent = send(
+        client,
+        "sms",
+        phone_number="07700900000",
+        personalisation={"flag": True, "count": 3, "ratio": 1.5, "name": "true"},
+    )
+    other = send(
+        client,
+        "sms",
+        phone_number="07700900000",
+        personalisation={"flag": False, "count": "3", "none": None},
+    )
+    assert ids(client, **{"personalisation.flag": "true"}) == [sent]
+    assert ids(client, **{"personalisation.flag": "false"}) == [other]
+    assert sorted(ids(client, **{"personalisation.count": "3"})) == sorted(
+        [sent, other]
+    )
+    assert ids(client, **{"personalisation.ratio": "1.5"}) == [sent]
+    assert ids(client, **{"personalisation.ratio": "1.50"}) == []
+    assert ids(client, **{"personalisation.name": "true"}) == [sent]
+    assert ids(client, **{"personalisation.none": "null"}) == []
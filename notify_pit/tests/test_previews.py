@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from app import main
+from app.cache import LRUCache
+from tests.conftest import headers
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = LRUCache("previews", max_bytes=1_000_000)
+    monkeypatch.setattr(main.preview_renderer, "cache", cache)
+    return cache
+
+
+def create_template(client, type, body, subject=None):
+    response = client.post(
+        "/pit/template",
+        json={
+            "type": type,
+            "name": f"{type} template",
+            "body": body,
+            "subject": subject,
+        },
+    )
+    return response.json()["id"]
+
+
+def send(client, channel, template_id, **payload):
+    response = client.post(
+        f"/v2/notifications/{channel}",
+        json={"template_id": template_id, **payload},
+        headers=headers(),
+    )
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def test_email_preview_is_rendered_when_sent(client, cache):
+    template_id = create_template(
+        client,
+        "email",
+        "Hello ((name)),\n\nYour code is ((code)).",
+        "Code for ((name))",
+    )
+    notification_id = send(
+        client,
+        "email",
+        template_id,
+        email_address="a@example.com",
+        personalisation={"name": "<Ada>", "code": 1815},
+    )
+    # Pre-rendered by the send's background task
+    assert (notification_id, 1) in cache
+
+    preview = client.get(f"/pit/notifications/{notification_id}/preview")
+    assert preview.headers["content-type"] == "text/html; charset=utf-8"
+    assert "<title>Code for &lt;Ada&gt;</title>" in preview.text
+    assert "Hello &lt;Ada&gt;,</p>" in preview.text
+    assert "Your code is 1815.</p>" in preview.text
+    assert "To: a@example.com" in preview.text
+
+
+def test_letter_pdf_follows_the_template_version(client, cache):
+    template_id = create_template(
+        client, "letter", "Dear ((name)),\n(Reference ((ref)))", "Your claim"
+    )
+    notification_id = send(
+        client,
+        "letter",
+        template_id,
+        personalisation={
+            "address_line_1": "Ada Lovelace",
+            "address_line_2": "1 Street",
+            "postcode": "SW1A 1AA",
+            "name": "Ada",
+            "ref": "X1",
+        },
+    )
+    pdf = client.get(f"/v2/notifications/{notification_id}/pdf", headers=headers())
+    assert pdf.status_code == 200
+    assert pdf.headers["content-type"] == "application/pdf"
+    assert pdf.content.startswith(b"%PDF-1.4") and pdf.content.endswith(b"%%EOF\n")
+    for text in (b"(Ada Lovelace)", b"(SW1A 1AA)", b"/F2 11 Tf", b"(Dear Ada,)"):
+        assert text in pdf.content
+    assert b"(\\(Reference X1\\))" in pdf.content
+
+    client.put(
+        f"/pit/template/{template_id}",
+        json={"type": "letter", "name": "letter", "body": "Hi ((name))"},
+    )
+    updated = client.get(f"/pit/notifications/{notification_id}/preview")
+    assert b"(Hi Ada)" in updated.content
+    assert len(cache) == 2
+
+
+def test_previews_without_prerendering(client, cache, monkeypatch):
+    monkeypatch.setattr(main.preview_renderer, "prerender_sends", False)
+    template_id = create_template(client, "email", "Hi", "Subject")
+    notification_id = send(client, "email", template_id, email_address="a@b.com")
+    assert len(cache) == 0
+    assert (
+        client.get(f"/pit/notifications/{notification_id}/preview").status_code == 200
+    )
+    assert len(cache) == 1
+
+    sms = send(client, "sms", template_id, phone_number="07700900000")
+    assert client.get(f"/pit/notifications/{sms}/preview").status_code == 400
+    missing = send(
+        client,
+        "email",
+        "550e8400-e29b-41d4-a716-446655440000",
+        email_address="a@b.com",
+    )
+    assert client.get(f"/pit/notifications/{missing}/preview").status_code == 404
+
+
+def test_lru_cache_is_bounded_by_bytes():
+    cache = LRUCache("test", max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+    cache.put("c", b"1234")
+    # "b" was the least recently used
+    assert cache.get("b") is None
+    assert cache.size == 8 and len(cache) == 2
+    cache.put("big", b"x" * 11)
+    assert "big" not in cache
+
+
+def test_previews_render_off_the_event_loop(client, cache, monkeypatch):
+    on_loop = []
+    prerender = main.preview_renderer.prerender
+
+    def recording_prerender(*args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return prerender(*args, **kwargs)
+
+    monkeypatch.setattr(main.preview_renderer, "prerender_sends", False)
+    monkeypatch.setattr(main.preview_renderer, "prerender", recording_prerender)
+    template_id = create_template(client, "letter", "Dear ((name))", "Hello")
+    notification_id = send(
+        client, "letter", template_id, personalisation={"name": "Ada"}
+    )
+
+    preview = client.get(f"/pit/notifications/{notification_id}/preview")
+    assert preview.status_code == 200
+    pdf = client.get(f"/v2/notifications/{notification_id}/pdf", headers=headers())
+    assert pdf.status_code == 200
+    assert on_loop == [False, False]
@@ -0,0 +1,71 @@
+import marshal
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.profiling import Profiler, ProfilingMiddleware
+from tests.conftest import get_token
+
+
+@pytest.fixture
+def profiled(client, monkeypatch):
+    profiler = Profiler(enabled=True, keep=2)
+    monkeypatch.setattr(main, "profiler", profiler)
+    return TestClient(ProfilingMiddleware(main.app, profiler=profiler)), profiler
+
+
+def received(client, **kwargs):
+    headers = {"Authorization": f"Bearer {get_token()}", **kwargs.pop("headers", {})}
+    return client.get("/v2/received-text-messages", headers=headers, **kwargs)
+
+
+def test_unprofiled_requests_are_untouched(profiled):
+    client, profiler = profiled
+    response = received(client)
+    assert response.status_code == 200
+    assert "x-pit-profile-id" not in response.headers
+    assert profiler.profiles == {}
+
+
+def test_cprofile_by_header(profiled):
+    client, profiler = profiled
+    response = received(client, headers={"X-Pit-Profile": "1"})
+    assert response.status_code == 200
+    profile_id = response.headers["x-pit-profile-id"]
+
+    profile = client.get(f"/pit/debug/profiles/{profile_id}").json()
+    assert profile["mode"] == "cprofile"
+    assert profile["path"] == "/v2/received-text-messages"
+    assert "get_received_texts" in profile["summary"]
+
+    stats = client.get(f"/pit/debug/profiles/{profile_id}/pstats")
+    assert stats.headers["content-type"] == "application/octet-stream"
+    assert any(
+        name == "get_received_texts" for _, _, name in marshal.loads(stats.content)
+    )
+    assert client.get(f"/pit/debug/profiles/{profile_id}/collapsed").status_code == 404
+
+
+def test_sampling_by_query_param(profiled):
+    client, profiler = profiled
+    profiler.sample_interval = 0.0005
+    response = received(client, params={"pit_profile": "sample"})
+    profile_id = response.headers["x-pit-profile-id"]
+
+    collapsed = client.get(f"/pit/debug/profiles/{profile_id}/collapsed").text
+    for line in collapsed.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert ";" in stack and int(count) > 0
+
+
+def test_only_recent_profiles_are_kept(profiled):
+    client, profiler = profiled
+    ids = [
+        received(client, headers={"X-Pit-Profile": "1"}).headers["x-pit-profile-id"]
+        for _ in range(3)
+    ]
+    listed = client.get("/pit/debug/profiles").json()
+    assert [p["id"] for p in listed] == ids[:0:-1]
+    assert "pstats" not in listed[0]
+    assert client.get(f"/pit/debug/profiles/{ids[0]}").status_code == 404
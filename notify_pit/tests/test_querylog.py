@@ -0,0 +1,85 @@
+import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import main, metrics, querylog
+from app.querylog import normalise
+from tests.conftest import engine, get_token
+
+# The app's query log is installed on its own engine; record the test engine too
+querylog.install(engine, main.query_log)
+
+
+@pytest.fixture
+def query_log():
+    log = main.query_log
+    thresholds = log.slow_threshold_ms, log.n_plus_one_threshold
+    log.clear()
+    yield log
+    log.slow_threshold_ms, log.n_plus_one_threshold = thresholds
+    log.clear()
+
+
+def test_normalise():
+    assert (
+        normalise(
+            "SELECT * FROM t\n  WHERE a = 'it''s' AND b = 42 AND c IN (?, ?, ?) AND d = :d"
+        )
+        == "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (?...) AND d = ?"
+    )
+    assert normalise("SELECT * FROM t WHERE id IN (%(id_1)s, %(id_2)s)") == (
+        "SELECT * FROM t WHERE id IN (?...)"
+    )
+
+
+def test_install_times_queries_into_the_metrics():
+    engine = create_engine("sqlite://")
+    log = querylog.QueryLog()
+    querylog.install(engine, log)
+    before = sum(
+        c for counts, _ in metrics.DB_QUERY_DURATION.values.values() for c in counts
+    )
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        conn.execute(text("SELECT 2"))
+    after = sum(
+        c for counts, _ in metrics.DB_QUERY_DURATION.values.values() for c in counts
+    )
+    assert after == before + 2
+    assert len(log.recent) == 2
+
+
+def test_statements_are_aggregated(client, query_log):
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    client.delete("/pit/debug/queries")
+    for _ in range(3):
+        client.get("/v2/received-text-messages", headers=headers)
+
+    report = client.get("/pit/debug/queries").json()
+    frequent = report["most_frequent"][0]
+    assert frequent["sql"].startswith("SELECT")
+    assert "received" in frequent["sql"] or "notifications" in frequent["sql"]
+    assert frequent["count"] >= 3
+    assert frequent["max_ms"] >= frequent["mean_ms"]
+    assert len(report["slowest_recent"]) >= 3
+    assert report["n_plus_one"] == []
+
+
+def test_slow_queries_are_logged(client, query_log, caplog):
+    query_log.slow_threshold_ms = 0
+    with caplog.at_level(logging.WARNING, logger="app.querylog"):
+        client.get("/pit/notifications")
+    assert any("Slow query" in r.message for r in caplog.records)
+
+
+def test_requests_with_many_statements_are_flagged(client, query_log):
+    # reset issues one DELETE per table, listing templates a single SELECT
+    query_log.n_plus_one_threshold = 1
+    client.get("/pit/templates")
+    client.delete("/pit/reset")
+
+    flagged = client.get("/pit/debug/queries").json()["n_plus_one"]
+    assert [f["path"] for f in flagged] == ["/pit/reset"]
+    assert flagged[0]["statements"] > 1
+    assert flagged[0]["most_repeated"]["sql"].startswith("DELETE")
@@ -0,0 +1,128 @@
+import time
+
+import pytest
+
+from app import main
+from app.errors import NotifyError
+from app.ratelimit import MemoryStore, RateLimiter, SqliteStore
+from tests.conftest import get_token
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore()
+    return SqliteStore(str(tmp_path / "ratelimit.db"))
+
+
+def test_bucket_refills(store):
+    clock = FakeClock()
+    limiter = RateLimiter(limit=2, period=1, store=store, clock=clock)
+    limiter.check("key")
+    limiter.check("key")
+    with pytest.raises(NotifyError) as e:
+        limiter.check("key")
+    assert e.value.error == "RateLimitError"
+    # Other keys have their own budget
+    limiter.check("other-key")
+
+    clock.now += 0.5
+    limiter.check("key")
+    with pytest.raises(NotifyError):
+        limiter.check("key")
+
+
+def test_daily_limit(store):
+    clock = FakeClock()
+    limiter = RateLimiter(limit=100, daily_limit=2, store=store, clock=clock)
+    limiter.check("key")
+    limiter.check("key")
+    with pytest.raises(NotifyError) as e:
+        limiter.check("key")
+    assert e.value.error == "TooManyRequestsError"
+
+    clock.now += 24 * 60 * 60
+    limiter.check("key")
+
+
+def test_shared_state_between_limiters(tmp_path):
+    path = str(tmp_path / "ratelimit.db")
+    clock = FakeClock()
+    first = RateLimiter(limit=2, store=SqliteStore(path), clock=clock)
+    second = RateLimiter(limit=2, store=SqliteStore(path), clock=clock)
+    first.check("key")
+    second.check("key")
+    with pytest.raises(NotifyError):
+        first.check("key")
+
+
+def test_send_returns_notify_shaped_429(client, monkeypatch):
+    monkeypatch.setattr(
+        main, "rate_limiter", RateLimiter(limit=1, period=60, enabled=True)
+    )
+    payload = {
+        "phone_number": "07700900000",
+        "template_id": "550e8400-e29b-41d4-a716-446655440000",
+    }
+    headers = {"Authorization": f"Bearer {get_token()}"}
+
+    assert (
+        client.post("/v2/notifications/sms", json=payload, headers=headers).status_code
+        == 201
+    )
+    r = client.post("/v2/notifications/sms", json=payload, headers=headers)
+    assert r.status_code == 429
+    assert r.json() == {
+        "status_code": 429,
+        "errors": [
+            {
+                "error": "RateLimitError",
+                "message": "Exceeded rate limit for key type LIVE of 1 requests "
+                "per 60 seconds",
+            }
+        ],
+    }
+
+
+def test_reset_refills_the_buckets(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        main,
+        "rate_limiter",
+        RateLimiter(
+            limit=1,
+            period=60,
+            store=SqliteStore(str(tmp_path / "limits.db")),
+            enabled=True,
+        ),
+    )
+    payload = {
+        "phone_number": "07700900000",
+        "template_id": "550e8400-e29b-41d4-a716-446655440000",
+    }
+    headers = {"Authorization": f"Bearer {get_token()}"}
+
+    def send():
+        return client.post("/v2/notifications/sms", json=payload, headers=headers)
+
+    assert send().status_code == 201
+    assert send().status_code == 429
+    client.delete("/pit/reset")
+    assert send().status_code == 201
+
+
+def test_letter_pdfs_are_rate_limited(client, monkeypatch):
+    monkeypatch.setattr(
+        main, "rate_limiter", RateLimiter(limit=1, period=60, enabled=True)
+    )
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    missing = "/v2/notifications/00000000-0000-0000-0000-000000000000/pdf"
+    assert client.get(missing, headers=headers).status_code == 404
+    assert client.get(missing, headers=headers).status_code == 429
@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app import main, models, recording, replay
+from tests.conftest import get_token
+
+TEMPLATE_ID = "550e8400-e29b-41d4-a716-446655440000"
+
+
+def test_recording_captures_v2_requests(client, tmp_path):
+    recorder = recording.Recorder(str(tmp_path / "traffic.ndjson"), max_body=500)
+    recorded = TestClient(recording.RecordingMiddleware(main.app, recorder=recorder))
+    headers = {"Authorization": f"Bearer {get_token()}"}
+
+    sms = {"template_id": TEMPLATE_ID, "phone_number": "07700900000"}
+    recorded.post("/v2/notifications/sms", json=sms, headers=headers)
+    recorded.post(
+        "/v2/notifications/email",
+        json={**sms, "email_address": "a@example.com", "reference": "x" * 600},
+        headers=headers,
+    )
+    recorded.get("/v2/received-text-messages?older_than=abc", headers=headers)
+    recorded.get("/pit/notifications")
+    recorder.close()
+
+    entries = list(recording.read(recorder.path))
+    assert [(e["m"], e["p"], e["s"]) for e in entries] == [
+        ("POST", "/v2/notifications/sms", 201),
+        ("POST", "/v2/notifications/email", 201),
+        ("GET", "/v2/received-text-messages?older_than=abc", 200),
+    ]
+    assert all(e["i"] == "test-service" for e in entries)
+    assert entries[0]["t"] <= entries[1]["t"] <= entries[2]["t"]
+    assert b'"07700900000"' in recording.body_of(entries[0])
+    # Too large to keep, so replay skips it
+    assert recording.body_of(entries[1]) is None
+    assert recording.body_of(entries[2]) == b""
+
+
+def test_replay_keeps_the_scaled_schedule(client, db_session):
+    body = '{"template_id": "%s", "phone_number": "07700900000"}' % TEMPLATE_ID
+    entries = [
+        {"t": 100.0 + n * 0.1, "m": "POST", "p": "/v2/notifications/sms", "b": body}
+        for n in range(10)
+    ]
+    entries[3]["i"] = "other-service"
+    entries.append(
+        {"t": 101.0, "m": "POST", "p": "/v2/notifications/sms", "truncated": True}
+    )
+    entries.append({"t": 101.0, "m": "GET", "p": "/v2/received-text-messages"})
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://notify-pit"
+        ) as http:
+            return await replay.replay(http, entries, speed=10)
+
+    result = asyncio.run(scenario())
+    assert result["requests"] == 11 and result["skipped"] == 1
+    assert result["errors"] == {}
+    assert result["status_codes"] == {"200": 1, "201": 10}
+    assert result["recorded_seconds"] == 1.0
+    assert result["target_rps"] == 110.0
+    # The last request is due 0.1s in at 10x
+    assert result["elapsed_seconds"] >= 0.1
+    services = [n.service_id for n in db_session.query(models.Notification)]
+    assert services.count("other-service") == 1
+    assert services.count("notify-pit-replay") == 9
+
+
+def test_replay_follows_arrival_order(client, tmp_path):
+    # Lines are written as requests complete, so a slow request that arrived
+    # first is recorded after the quick ones that followed it
+    body = '{"template_id": "%s", "phone_number": "07700900000"}' % TEMPLATE_ID
+    recorder = recording.Recorder(str(tmp_path / "traffic.ndjson"))
+    for t, d in [(100.1, 0.01), (100.2, 0.01), (100.0, 0.5), (100.4, 0.01)]:
+        entry = {"t": t, "m": "POST", "p": "/v2/notifications/sms", "d": d}
+        recorder.record({**entry, "b": body})
+    recorder.close()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://notify-pit"
+        ) as http:
+            return await replay.replay(http, recording.read(recorder.path), speed=10)
+
+    result = asyncio.run(scenario())
+    assert result["requests"] == 4 and result["errors"] == {}
+    assert result["recorded_seconds"] == 0.4
+    assert result["target_rps"] == 100.0
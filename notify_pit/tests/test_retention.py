@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from app import metrics, models
+from app.retention import Policy, RetentionPurger, parse_duration
+from tests.conftest import NOW, TestingSessionLocal, add_notifications, remaining
+
+
+def purger(policies, batch_size=3, lock_path=None):
+    return RetentionPurger(
+        TestingSessionLocal,
+        policies,
+        batch_size=batch_size,
+        pause=0,
+        clock=lambda: NOW.timestamp(),
+        lock_path=lock_path,
+    )
+
+
+def test_parse_duration():
+    assert parse_duration("90") == 90
+    assert parse_duration("30m") == 1800
+    assert parse_duration("1.5h") == 5400
+    assert parse_duration("7d") == 7 * 86400
+    with pytest.raises(ValueError):
+        parse_duration("soon")
+
+
+def test_from_env_applies_per_type_overrides(monkeypatch):
+    monkeypatch.setenv("PIT_RETENTION_MAX_AGE", "7d")
+    monkeypatch.setenv("PIT_RETENTION_MAX_ROWS_SMS", "100")
+    monkeypatch.setenv("PIT_RETENTION_MAX_AGE_LETTER", "30d")
+
+    policies = RetentionPurger.from_env(TestingSessionLocal).policies
+    assert policies["sms"] == Policy(max_age=7 * 86400, max_rows=100)
+    assert policies["email"] == Policy(max_age=7 * 86400)
+    assert policies["letter"] == Policy(max_age=30 * 86400)
+
+
+def test_disabled_without_policies(monkeypatch):
+    for name in ("PIT_RETENTION_MAX_AGE", "PIT_RETENTION_MAX_ROWS"):
+        monkeypatch.delenv(name, raising=False)
+    assert not RetentionPurger.from_env(TestingSessionLocal).enabled
+
+
+def test_purges_by_age_in_batches(db_session):
+    add_notifications(db_session, "sms", 7, age_days=10)
+    add_notifications(db_session, "sms", 2)
+    add_notifications(db_session, "email", 4, age_days=10)
+    before = metrics.RETENTION_PURGED.values.get(("sms", "max_age"), 0)
+
+    purged = asyncio.run(purger({"sms": Policy(max_age=86400)}).purge_once())
+
+    assert purged == {("sms", "max_age"): 7}
+    assert remaining(db_session, "sms") == 2
+    assert remaining(db_session, "email") == 4
+    assert metrics.RETENTION_PURGED.values[("sms", "max_age")] == before + 7
+
+
+def test_one_worker_purges_each_round(db_session, tmp_path):
+    add_notifications(db_session, "sms", 8)
+    lock = str(tmp_path / "retention.lock")
+    policies = {"sms": Policy(max_rows=3)}
+    first, second = purger(policies, lock_path=lock), purger(policies, lock_path=lock)
+
+    async def rounds():
+        with first._elected() as elected:
+            assert elected
+            # Another worker's purger skips the round while this one holds it
+            assert await second.purge_if_elected() is None
+            purged = await first.purge_once()
+        return purged, await second.purge_if_elected()
+
+    purged, later = asyncio.run(rounds())
+    assert purged == {("sms", "max_rows"): 5}
+    # The next round recounts, so the excess isn't deleted twice
+    assert later == {}
+    assert remaining(db_session, "sms") == 3
+
+
+def test_purges_oldest_rows_beyond_max_rows(db_session):
+    add_notifications(db_session, "email", 5, age_days=2)
+    add_notifications(db_session, "email", 3)
+
+    purged = asyncio.run(purger({"email": Policy(max_rows=3)}).purge_once())
+
+    assert purged == {("email", "max_rows"): 5}
+    oldest = db_session.query(models.Notification).order_by("created_at").first()
+    assert oldest.created_at.date() == NOW.date()
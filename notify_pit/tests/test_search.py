@@ -0,0 +1,51 @@
+from app import crud, search
+from tests.conftest import send
+
+
+def test_terms_drop_punctuation():
+    assert search.terms('ada@Example.com "OR" *') == ["ada", "example", "com", "or"]
+    assert search.terms("  ") == []
+
+
+def test_search_ranks_and_paginates(client):
+    ada = send(
+        client,
+        "email",
+        email_address="ada@example.com",
+        personalisation={"name": "Ada Lovelace", "code": 1815},
+    )
+    send(client, "sms", phone_number="07700900123", reference="grace-1")
+    just_ada = send(
+        client, "sms", phone_number="07700900456", personalisation={"name": "Ada"}
+    )
+
+    def ids(q, **params):
+        body = client.get("/pit/notifications/search", params={"q": q, **params})
+        return [row["id"] for row in body.json()["results"]]
+
+    assert ids("ada@example.com") == [ada]
+    assert ids("lovelace") == [ada]
+    assert ids("1815") == [ada]
+    assert len(ids("077009")) == 2
+    assert ids("grace") and ids("grace 07700900123") == ids("grace")
+    assert ids("grace nobody") == []
+
+    # bm25 favours the shorter document, where "ada" is more of the text
+    assert ids("ada") == [just_ada, ada]
+    first = client.get(
+        "/pit/notifications/search", params={"q": "ada", "page_size": 1}
+    ).json()
+    assert first["has_more"] and first["results"][0]["id"] == just_ada
+    second = client.get(
+        "/pit/notifications/search", params={"q": "ada", "page": 2, "page_size": 1}
+    ).json()
+    assert not second["has_more"] and second["results"][0]["id"] == ada
+
+
+def test_index_follows_deletes(client, db_session):
+    crud.create_received_text(db_session, "07700900789", "Reply STOP to unsubscribe")
+    assert len(search.search(db_session, "unsubscribe")) == 1
+
+    client.delete("/pit/reset")
+    assert search.search(db_session, "unsubscribe") == []
+    assert client.get("/pit/notifications/search").status_code == 422
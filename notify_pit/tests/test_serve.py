@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from app import __main__ as cli
+
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    # serve sets some of these for its workers by writing os.environ. Setting
+    # each first makes monkeypatch record its original value, so it is put
+    # back whatever the test leaves behind.
+    for name in (
+        "PIT_METRICS_DIR",
+        "PIT_RATE_LIMIT_ENABLED",
+        "PIT_RATE_LIMIT_STATE",
+        "PIT_PROFILING",
+        "PIT_PROMOTE_EXISTING",
+    ):
+        monkeypatch.setenv(name, "")
+        monkeypatch.delenv(name)
+
+
+def test_memory_sqlite_is_refused_for_several_workers(clean_env):
+    with pytest.raises(SystemExit, match="in-memory SQLite"):
+        cli.check_workers("sqlite:///:memory:", 4)
+    assert cli.check_workers("sqlite:///:memory:", 1) == []
+
+
+def test_several_workers_share_a_metrics_directory(clean_env, tmp_path, monkeypatch):
+    warnings = cli.check_workers("sqlite:///./pit.db", 2)
+    directory = os.environ["PIT_METRICS_DIR"]
+    assert os.path.isdir(directory)
+    assert not any("Rate limits" in w for w in warnings)
+    os.rmdir(directory)
+
+    # A configured directory is emptied of the previous run's snapshots
+    (tmp_path / "123.json").write_text("{}")
+    monkeypatch.setenv("PIT_METRICS_DIR", str(tmp_path))
+    monkeypatch.setenv("PIT_RATE_LIMIT_ENABLED", "true")
+    warnings = cli.check_workers("postgresql://pit@db/pit", 2)
+    assert list(tmp_path.iterdir()) == []
+    assert any("PIT_RATE_LIMIT_STATE" in w for w in warnings)
+    for feature in ("PUT /pit/config", "/pit/debug/queries", "DELETE /pit/reset"):
+        assert any(feature in w for w in warnings)
+    assert not any("/pit/debug/profiles" in w for w in warnings)
+    monkeypatch.setenv("PIT_PROFILING", "true")
+    assert any(
+        "/pit/debug/profiles" in w
+        for w in cli.check_workers("postgresql://pit@db/pit", 2)
+    )
+
+
+def test_one_worker_by_default(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(cli, "serve", lambda args: calls.update(vars(args)))
+    monkeypatch.delenv("PIT_WORKERS", raising=False)
+    cli.main(["serve"])
+    assert calls["workers"] == 1
+
+
+def test_serve_options(monkeypatch):
+    calls = {}
+    monkeypatch.setattr(cli, "serve", lambda args: calls.update(vars(args)))
+    monkeypatch.setenv("PIT_WORKERS", "3")
+    cli.main(["serve", "--port", "9000", "--no-access-log"])
+    assert calls["workers"] == 3
+    assert calls["port"] == 9000
+    assert calls["access_log"] is False
+    assert calls["limit_concurrency"] is None
+    assert cli.event_loop() in ("uvloop", "asyncio")
+    assert cli.http_protocol() in ("httptools", "h11")
+
+
+def test_serve_backfills_promoted_keys_for_the_workers(
+    clean_env, db_session, monkeypatch
+):
+    from app import crud, main, warmup
+    from tests.conftest import TestingSessionLocal, engine
+
+    monkeypatch.setattr(crud, "promote_existing", lambda db: 3)
+    cli.promote_existing()
+    assert os.environ["PIT_PROMOTE_EXISTING"] == "false"
+
+    # So the workers' warm-up doesn't scan again
+    monkeypatch.setattr(crud, "promote_existing", pytest.fail)
+    monkeypatch.setattr(warmup, "state", {})
+    state = warmup.run(engine, TestingSessionLocal, main.templates.env)
+    assert state["status"] == "done" and state["promoted_values"] == 0
+
+
+def test_serve_settings_do_not_outlive_the_tests():
+    # Runs after the tests above: nothing they set for workers is left over
+    assert "PIT_PROMOTE_EXISTING" not in os.environ
+    directory = os.environ.get("PIT_METRICS_DIR")
+    assert directory is None or os.path.isdir(directory)
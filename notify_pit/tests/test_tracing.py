@@ -0,0 +1,104 @@
+import json
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud, main, tracing
+from app.tracing import Exporter, Tracer, TracingMiddleware
+from tests.conftest import get_token
+
+tracing.instrument(crud)
+
+
+class ListExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+
+@pytest.fixture
+def traced(client):
+    exporter = ListExporter()
+    tracer = Tracer(sample_rate=1.0, exporter=exporter)
+    return TestClient(TracingMiddleware(main.app, tracer=tracer)), exporter
+
+
+def send_sms(client, **headers):
+    template = client.post(
+        "/pit/template", json={"type": "sms", "name": "T", "body": "Hi"}
+    ).json()
+    return client.post(
+        "/v2/notifications/sms",
+        json={"phone_number": "07700900000", "template_id": template["id"]},
+        headers={"Authorization": f"Bearer {get_token()}", **headers},
+    )
+
+
+def test_request_spans(traced):
+    client, exporter = traced
+    response = send_sms(client)
+    assert response.status_code == 201
+
+    trace = exporter.traces[-1]
+    assert response.headers["x-pit-trace-id"] == trace.trace_id
+    root = trace.spans[0]
+    assert root.name == "POST /v2/notifications/sms"
+    assert root.attributes["http.response.status_code"] == 201
+    names = [s.name for s in trace.spans[1:]]
+    assert "auth.validate_notify_jwt" in names
+    assert "validate SmsRequest" in names
+    assert "crud.create_notification" in names
+    assert "render json" in names
+    for span in trace.spans[1:]:
+        assert span.parent_id == root.span_id
+        assert root.start <= span.start <= span.end <= root.end
+
+
+def test_traceparent_joins_callers_trace(client):
+    exporter = ListExporter()
+    tracer = Tracer(sample_rate=0.0, exporter=exporter)
+    client = TestClient(TracingMiddleware(main.app, tracer=tracer))
+
+    client.get("/pit/notifications")
+    assert exporter.traces == []
+
+    trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    response = client.get(
+        "/pit/notifications", headers={"traceparent": f"00-{trace_id}-{parent_id}-01"}
+    )
+    assert response.headers["x-pit-trace-id"] == trace_id
+    assert exporter.traces[0].spans[0].parent_id == parent_id
+
+
+def test_sample_rate():
+    tracer = Tracer(sample_rate=0.25, rng=random.Random(1))
+    sampled = sum(tracer.sample() is not None for _ in range(10000))
+    assert 2300 < sampled < 2700
+
+    unsampled = "00-" + "a" * 32 + "-" + "b" * 16 + "-00"
+    assert Tracer(sample_rate=0.0).sample(unsampled) is None
+    assert Tracer(sample_rate=0.0).sample("not-a-traceparent") is None
+
+
+def test_otlp_json_export(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = Exporter(str(path))
+    trace = tracing.Trace()
+    root = tracing.Span(trace, "GET /", kind=tracing.SERVER)
+    child = tracing.Span(trace, "child", root.span_id)
+    child.attributes.update({"rows": 3, "cached": False})
+    child.end = root.end = child.start + 1000
+    exporter.export(trace)
+    exporter.export(trace)
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert spans[0]["traceId"] == trace.trace_id
+    assert "parentSpanId" not in spans[0]
+    assert spans[1]["parentSpanId"] == root.span_id
+    assert {"key": "rows", "value": {"intValue": "3"}} in spans[1]["attributes"]
+    assert {"key": "cached", "value": {"boolValue": False}} in spans[1]["attributes"]
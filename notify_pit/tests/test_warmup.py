@@ -0,0 +1,84 @@
+import pytest
+
+from app import crud, main, metrics, warmup
+from app.cache import TTLCache
+from tests.conftest import TestingSessionLocal, engine, get_token
+
+
+@pytest.fixture
+def restore_state():
+    saved = dict(warmup.state)
+    yield
+    warmup.state.clear()
+    warmup.state.update(saved)
+
+
+def test_ttl_cache_expires_entries():
+    now = [0.0]
+    cache = TTLCache("test", ttl=5, maxsize=2, clock=lambda: now[0])
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    now[0] = 5.0
+    assert cache.get("a") is None
+
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("c", 3)
+    assert cache.get("a") is None and len(cache) == 2
+
+
+def test_warm_up_preloads_templates(client, restore_state, monkeypatch):
+    created = client.post(
+        "/pit/template", json={"type": "sms", "name": "Hi", "body": "Hi ((name))"}
+    ).json()
+    monkeypatch.setattr(main.migrations, "state", {"status": "up_to_date"})
+    assert client.get("/readyz").status_code == 503
+
+    state = warmup.run(engine, TestingSessionLocal, main.templates.env)
+    assert state["status"] == "done"
+    assert state["templates"] == 1
+    assert warmup.finished()
+    assert client.get("/readyz").status_code == 200
+
+    hits = metrics.CACHE_REQUESTS.values.get(("templates", "hit"), 0)
+    response = client.post(
+        f"/v2/template/{created['id']}/preview",
+        json={"personalisation": {"name": "Ada"}},
+        headers={"Authorization": f"Bearer {get_token()}"},
+    )
+    assert response.json()["body"] == "Hi Ada"
+    assert metrics.CACHE_REQUESTS.values[("templates", "hit")] == hits + 1
+
+
+def test_template_changes_invalidate_the_cache(client):
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    created = client.post(
+        "/pit/template", json={"type": "sms", "name": "T", "body": "One"}
+    ).json()
+    url = f"/v2/template/{created['id']}"
+    assert client.get(url, headers=headers).json()["body"] == "One"
+
+    client.put(
+        f"/pit/template/{created['id']}",
+        json={"type": "sms", "name": "T", "body": "Two"},
+    )
+    template = client.get(url, headers=headers).json()
+    assert (template["body"], template["version"]) == ("Two", 2)
+
+    client.delete(f"/pit/template/{created['id']}")
+    assert client.get(url, headers=headers).status_code == 404
+    assert crud.template_cache.get(created["id"]) is None
+
+
+def test_preloaded_templates_outlive_warm_up(client, db_session, monkeypatch):
+    now = [0.0]
+    cache = TTLCache("templates", ttl=crud.TEMPLATE_CACHE_TTL, clock=lambda: now[0])
+    monkeypatch.setattr(crud, "template_cache", cache)
+    created = client.post(
+        "/pit/template", json={"type": "sms", "name": "T", "body": "One"}
+    ).json()
+    assert crud.preload_templates(db_session) == 1
+
+    # Well after start-up, the preloaded entry still saves the query
+    now[0] += 60
+    assert cache.get(created["id"])["body"] == "One"